@@ -264,6 +264,18 @@ class InstitutionsStorageAddon(BaseStorageAddon):
     def root_folder_fullpath(self):
         return self.cls_fullpath(self.base_folder, self.folder_name)
 
+    @classmethod
+    def cls_path_index(cls, addon_option):
+        """PathPrefixIndex of root_folder_fullpath of the projects using the
+        addon option, to find the projects of changed files.
+        """
+        index = PathPrefixIndex()
+        for node_settings in cls.objects.filter(
+                addon_option=addon_option, folder_id__isnull=False
+        ).select_related('addon_option', 'owner'):
+            index.add(node_settings.root_folder_fullpath, node_settings)
+        return index
+
     def set_addon_option(self, addon_option):
         self.addon_option = addon_option
 
@@ -376,6 +388,50 @@ class InstitutionsStorageAddon(BaseStorageAddon):
         raise NotImplementedError()
 
 
+class PathPrefixIndex(object):
+    """Trie of folder paths to find the folders containing a path in
+    O(depth of the path).
+
+    Folders are matched by path components: '/a/b' contains '/a/b/c',
+    but does not contain '/a/bc'.
+    """
+    class _Node(object):
+        __slots__ = ('children', 'values')
+
+        def __init__(self):
+            self.children = {}
+            self.values = []
+
+    def __init__(self):
+        self._root = self._Node()
+
+    @staticmethod
+    def _split(path):
+        return [name for name in path.split('/') if name]
+
+    def add(self, folder_path, value):
+        node = self._root
+        for name in self._split(folder_path):
+            child = node.children.get(name)
+            if child is None:
+                child = node.children[name] = self._Node()
+            node = child
+        node.values.append((folder_path, value))
+
+    def find(self, path):
+        """Returns [(folder path, value)] of the folders containing the path
+        (including the path itself), shallower first.
+        """
+        node = self._root
+        found = list(node.values)
+        for name in self._split(path):
+            node = node.children.get(name)
+            if node is None:
+                break
+            found.extend(node.values)
+        return found
+
+
 # store values in a short time to detect changed fields
 class SyncInfo(object):
     sync_info_dict = {}  # Node.id -> SyncInfo
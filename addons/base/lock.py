@@ -27,3 +27,33 @@ class Lock(object):
             shutil.rmtree(self.lockdir)
         except Exception:
             logger.warning('unlock failed')
+
+
+class AdvisoryLock(object):
+    '''Lock shared by all hosts (PostgreSQL advisory lock of the DB session).
+
+    The lock is released by PostgreSQL when the DB connection is closed
+    (e.g. by a crashed worker), so stale locks need not be removed.
+    '''
+    def __init__(self, prefix, purpose):
+        self.key = prefix + purpose
+
+    def _execute(self, func):
+        from django.db import connection
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT {}(hashtext(%s))'.format(func), [self.key])
+            return cursor.fetchone()[0]
+
+    def trylock(self):
+        if self._execute('pg_try_advisory_lock'):
+            return True
+        logger.debug('(try)lock failed')
+        return False
+
+    def lock(self):
+        self._execute('pg_advisory_lock')
+        return True
+
+    def unlock(self):
+        if not self._execute('pg_advisory_unlock'):
+            logger.warning('unlock failed')
@@ -1,14 +1,14 @@
-import os
 import logging
 import tempfile
 
-from addons.base.lock import Lock
+from django.db import connection
+
+from addons.base.lock import AdvisoryLock, Lock
 
 logger = logging.getLogger(__name__)
 
 TMPDIR = tempfile.gettempdir()
 LOCK_PREFIX = 'GRDM_dropboxbusiness_timestamp_lock_'
-PLAN_FILE = os.path.join(TMPDIR, LOCK_PREFIX + 'TEAM_IDS')
 
 ENABLE_DEBUG = False
 
@@ -19,40 +19,40 @@ def DEBUG(msg):
         logger.debug(msg)
 
 #############################################################
-LOCK_RUN = Lock(TMPDIR, LOCK_PREFIX, 'RUN')
-LOCK_PLAN = Lock(TMPDIR, LOCK_PREFIX, 'PLAN')
+# Change notifications (webhook) of each team are recorded in the DB
+# (TeamUpdatePlan) and coalesced until a worker processes the team.
+# A team is processed by one worker at a time on any host (team_lock),
+# and different teams are processed in parallel.
+
+def team_lock(team_id):
+    return AdvisoryLock(LOCK_PREFIX, 'TEAM_' + team_id)
 
 def init_lock():
-    LOCK_RUN.unlock()
-    LOCK_PLAN.unlock()
+    # remove the lock directories of older versions
+    for purpose in ('RUN', 'PLAN'):
+        Lock(TMPDIR, LOCK_PREFIX, purpose).unlock()
+
+def _plan_model():
+    # avoid "ImportError: cannot import name"
+    from addons.dropboxbusiness.models import TeamUpdatePlan
+    return TeamUpdatePlan
 
 def add_plan(team_ids):
-    try:
-        LOCK_PLAN.lock()
-        DEBUG('PLAN_FILE={}'.format(PLAN_FILE))
-        with open(PLAN_FILE, 'a') as f:
-            for team_id in team_ids:
-                f.write(team_id + '\n')
-    except Exception as e:
-        DEBUG(str(e))
-    finally:
-        LOCK_PLAN.unlock()
-
-def get_plan(team_ids):
-    try:
-        new_ids = set(team_ids)
-        lines = []
-        LOCK_PLAN.lock()
-        tmp_lines = []
-        with open(PLAN_FILE, 'r') as f:
-            tmp_lines = f.readlines()
-        for line in tmp_lines:
-            lines.append(line.rstrip())
-        os.unlink(PLAN_FILE)
-    except Exception as e:
-        DEBUG(str(e))
-    finally:
-        LOCK_PLAN.unlock()
-    DEBUG('requested team_ids={}'.format(lines))
-    new_ids.update(lines)
-    return new_ids
+    table = _plan_model()._meta.db_table
+    with connection.cursor() as cursor:
+        for team_id in team_ids:
+            cursor.execute(
+                'INSERT INTO {} (created, modified, team_id) VALUES (now(), now(), %s)'
+                ' ON CONFLICT (team_id) DO UPDATE SET modified = now()'.format(table),
+                [team_id])
+    DEBUG('planned team_ids={}'.format(team_ids))
+
+def has_plan(team_id):
+    return _plan_model().objects.filter(team_id=team_id).exists()
+
+def take_plan(team_id):
+    '''Remove the pending notifications of the team.
+    Notifications received after this are processed next time.
+    '''
+    deleted, _ = _plan_model().objects.filter(team_id=team_id).delete()
+    return deleted > 0
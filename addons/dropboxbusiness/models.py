@@ -8,6 +8,7 @@ from django.dispatch import receiver
 from dropbox.dropbox import DropboxTeam
 from dropbox.exceptions import DropboxException
 
+from osf.models.base import BaseModel
 from osf.models.node import Node
 from osf.models.contributor import Contributor
 from osf.models.files import File, Folder, BaseFileNode
@@ -403,6 +404,13 @@ def init_addon(node, addon_name):
                              save=True)
 
 
+class TeamUpdatePlan(BaseModel):
+    """Pending change notifications of a Dropbox Business team (see lock.py).
+    modified: when the last notification was received
+    """
+    team_id = models.CharField(max_length=255, unique=True)
+
+
 # store values in a short time to detect changed fields
 class SyncInfo(object):
     sync_info_dict = {}  # Node.id -> SyncInfo
@@ -0,0 +1,43 @@
+import unittest
+
+from mock import patch
+import pytest
+from nose.tools import *  # noqa (PEP8 asserts)
+
+from addons.dropboxbusiness import lock, utils
+from addons.dropboxbusiness.models import TeamUpdatePlan
+
+pytestmark = pytest.mark.django_db
+
+DBXBIZ = 'addons.dropboxbusiness'
+
+class TestTeamUpdatePlan(unittest.TestCase):
+
+    def test_plan_is_coalesced_per_team(self):
+        lock.add_plan(['dbtid:team1', 'dbtid:team2'])
+        lock.add_plan(['dbtid:team1'])
+        assert_equal(TeamUpdatePlan.objects.filter(team_id='dbtid:team1').count(), 1)
+        assert_true(lock.has_plan('dbtid:team1'))
+
+        assert_true(lock.take_plan('dbtid:team1'))
+        assert_false(lock.take_plan('dbtid:team1'))
+        assert_false(lock.has_plan('dbtid:team1'))
+        assert_true(lock.has_plan('dbtid:team2'))
+
+    @patch('{}.utils.time.sleep'.format(DBXBIZ))
+    @patch('{}.utils.team_id_to_instituion'.format(DBXBIZ))
+    def test_check_updated_files_skips_locked_team(self, mock_inst, mock_sleep):
+        team_lock = lock.team_lock('dbtid:team3')
+        with patch.object(lock.AdvisoryLock, 'trylock', return_value=False):
+            utils.celery_check_updated_files(['dbtid:team3'])
+        # left to the worker processing the team
+        assert_true(lock.has_plan('dbtid:team3'))
+        mock_sleep.assert_not_called()
+
+        with patch('{}.utils.ExternalAccount.objects.get'.format(DBXBIZ)) as mock_get:
+            mock_get.side_effect = Exception('no team')  # logged
+            utils.celery_check_updated_files(['dbtid:team3'])
+        assert_false(lock.has_plan('dbtid:team3'))
+        assert_equal(mock_sleep.call_count, 1)
+        assert_true(team_lock.trylock())
+        team_lock.unlock()
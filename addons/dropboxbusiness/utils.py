@@ -17,19 +17,16 @@ from dropbox.team import (GroupMembersAddError, GroupMembersRemoveError,
                           MemberAccess)
 
 from django.db import transaction
-from django.contrib.contenttypes.models import ContentType
 
 from celery.contrib.abortable import AbortableTask
 
-from osf.models import BaseFileNode, OSFUser
+from osf.models import OSFUser
 from osf.models.external import ExternalAccount
 # from osf.models.nodelog import NodeLog
 from osf.models.rdm_addons import RdmAddonOption
 from addons.dropboxbusiness import settings, lock
 from admin.rdm_addons.utils import get_rdm_addon_option
-from website.util import timestamp, waterbutler
-from api.base import settings as api_settings
-from framework.auth import Auth
+from website.util import timestamp
 from framework.celery_tasks import app as celery_app
 
 logger = logging.getLogger(__name__)
@@ -1086,121 +1083,60 @@ def _select_admin(node):
             return user
     raise Exception('unexpected condition')
 
-def _check_and_add_timestamp(team_info, file_attr):
-    from addons.dropboxbusiness.models import NodeSettings
-
-    tfp = file_attr.team_folder_path()
-    if tfp is None:
-        return
-    team_folder_id, name, path = tfp
-    DEBUG(u'team_folder_id={}, name={}, path={}'.format(team_folder_id,
-                                                        name, path))
-
-    def _file_exists(cls, target, path):
-        # see osf.models.files/BaseFileNode.get_or_create()
-        content_type = ContentType.objects.get_for_model(target)
-        kwargs = {'target_object_id': target.id,
-                  'target_content_type': content_type,
-                  '_path': '/' + path.lstrip('/')}
-        return cls.objects.filter(**kwargs).exists()
-
-    def _check_for_file(addon):
-        node = addon.owner
-        if node.is_deleted:
-            return
-        admin = _select_admin(node)
-        admin_cookie = admin.get_or_create_cookie().decode()
-        created = True
-
-        cls = BaseFileNode.resolve_class(PROVIDER_NAME, BaseFileNode.FILE)
-        if _file_exists(cls, node, path):
-            created = False
-        file_node = cls.get_or_create(node, path)
-        waterbutler_json_res = waterbutler.get_node_info(
-            admin_cookie, node._id, PROVIDER_NAME, path)
-        if waterbutler_json_res is None:
-            DEBUG(u'waterbutler.get_node_info() is None: path={}'.format(path))
-            return
-        file_data = waterbutler_json_res.get('data')
-        if file_data is None:
-            DEBUG(u'waterbutler.get_node_info().get("data") is None: path={}'.format(path))
-            return
-        DEBUG(u'file_data: ' + str(file_data))
-        attrs = file_data['attributes']
-        file_node.update(None, attrs, user=admin)  # update content_hash
-        file_info = {
-            'file_id': file_node._id,
-            'file_name': attrs.get('name'),
-            'file_path': attrs.get('materialized'),
-            'size': attrs.get('size'),
-            'created': attrs.get('created_utc'),
-            'modified': attrs.get('modified_utc'),
-            'file_version': '',
-            'provider': PROVIDER_NAME
-        }
-        # verified by admin
-        verify_result = timestamp.check_file_timestamp(
-            admin.id, node, file_info, verify_external_only=True)
-        DEBUG('check timestamp: verify_result={}'.format(verify_result.get('verify_result_title')))
-        if verify_result['verify_result'] == \
-           api_settings.TIME_STAMP_TOKEN_CHECK_SUCCESS:
-            return  # already checked
-
-        # The file is created (new file) or modified.
-        user = None
+def _modified_users(file_attrs):
+    # email -> OSFUser.id
+    eppns = {}
+    for file_attr in file_attrs:
         if file_attr.modified_by:
             eppn = email_to_eppn(file_attr.modified_by)
             if eppn:
-                try:
-                    user = OSFUser.objects.get(eppn=eppn)
-                except OSFUser.DoesNotExist:
-                    logger.warning(u'modified by unknown user: email={}'.format(file_attr.modified_by))
-        metadata = {
-            'path': path
-        }
-        if created:
-            action = 'file_added'
-        else:
-            action = 'file_updated'
-        if user:  # modified by user
-            verify_result = timestamp.add_token(user.id, node, file_info)
-            addon.create_waterbutler_log(Auth(user), action, metadata)
-            # timestamp.add_log_a_file(NodeLog.TIMESTAMP_ADDED, node, user.id, PROVIDER_NAME, file_node._id)
-        else:  # modified by unknown user
-            verify_result = timestamp.add_token(admin.id, node, file_info)
-            addon.create_waterbutler_log(None, action, metadata)
-            # timestamp.add_log_a_file(NodeLog.TIMESTAMP_ADDED, node, admin.id, PROVIDER_NAME, file_node._id)
-        logger.info(u'update timestamp by Webhook for Dropbox Business: node_guid={}, path={}, verify_result={}'.format(node._id, path, verify_result.get('verify_result_title')))
-
-    def _check_for_folder(addon):
-        logger.info(u'folder created: path={}, path_display={}'.format(path, file_attr.path_display))
-        metadata = {
-            'path': path
-        }
-        addon.create_waterbutler_log(None, 'folder_created', metadata)
+                eppns[eppn] = file_attr.modified_by
+    users = {}
+    for eppn, user_id in OSFUser.objects.filter(
+            eppn__in=list(eppns.keys())).values_list('eppn', 'id'):
+        users[eppns.pop(eppn)] = user_id
+    for email in eppns.values():
+        logger.warning(u'modified by unknown user: email={}'.format(email))
+    return users
+
+def _check_and_add_timestamps(team_info, file_attrs):
+    from addons.dropboxbusiness.models import NodeSettings
 
-    def _deleted_entry(addon):
-        logger.info(u'deleted: path={}, path_display={}'.format(path, file_attr.path_display))
-        metadata = {
-            'path': path
-        }
-        addon.create_waterbutler_log(None, 'file_removed', metadata)
+    # team_folder_id -> {path: FileAttr}
+    changes = collections.defaultdict(dict)
+    for file_attr in file_attrs:
+        ### unable to distinguish updating event of folders and deleted
+        ### entries from GRDM or Dropbox
+        if file_attr.optype != FileAttr.OPTYPE_FILE:
+            continue
+        tfp = file_attr.team_folder_path()
+        if tfp is None:
+            continue
+        team_folder_id, name, path = tfp
+        DEBUG(u'team_folder_id={}, name={}, path={}'.format(team_folder_id,
+                                                            name, path))
+        changes[team_folder_id][path] = file_attr  # the latest change
+    if not changes:
+        return
+    users = _modified_users(
+        [fa for c in changes.values() for fa in c.values()])
 
     # team_folder_id of NodeSettings is not UNIQUE,
     # but two or more NodeSettings do not exist.
-    with transaction.atomic():
-        for addon in NodeSettings.objects.filter(
-                team_folder_id=team_folder_id):
-            try:
-                if file_attr.optype == FileAttr.OPTYPE_FILE:
-                    _check_for_file(addon)
-                ### unable to distinguish updating event from GRDM or Dropbox
-                # elif file_attr.optype == FileAttr.OPTYPE_DIR:
-                #     _check_for_folder(addon)
-                # elif file_attr.optype == FileAttr.OPTYPE_DELETED:
-                #     _deleted_entry(addon)
-            except Exception:
-                logger.exception('project guid={}'.format(addon.owner._id))
+    for addon in NodeSettings.objects.filter(
+            team_folder_id__in=list(changes.keys())).select_related('owner'):
+        node = addon.owner
+        if node.is_deleted:
+            continue
+        try:
+            with transaction.atomic():
+                files = changes[addon.team_folder_id]
+                timestamp.reconcile_external_files(
+                    node, PROVIDER_NAME, _select_admin(node),
+                    dict((path, users.get(fa.modified_by))
+                         for path, fa in files.items()))
+        except Exception:
+            logger.exception('project guid={}'.format(node._id))
     # Unknown team_folder_id is ignored.
 
 def team_id_to_instituion(team_id):
@@ -1244,30 +1180,33 @@ def celery_check_updated_files(self, team_ids):
             opt.extended[KEY_ADMIN_ID] = admin_dbmid
             list_cursor = None
         files, cursor = team_info.list_updated_files(list_cursor)
-        for file_attr in files:
-            _check_and_add_timestamp(team_info, file_attr)
+        _check_and_add_timestamps(team_info, files)
         opt.extended[KEY_LIST_CURSOR] = cursor
         opt.save()
 
-    if not lock.LOCK_RUN.trylock():
-        lock.add_plan(team_ids)
-        return  # exit
-
-    while True:
-        team_ids = lock.get_plan(team_ids)
-        if len(team_ids) == 0:
-            break
-        # to wait for updating timestamp in create_waterbutler_log()
-        time.sleep(5)
-        for dbtid in team_ids:
-            institution = team_id_to_instituion(dbtid)
-            name = u'Institution={}, Dropbox Business Team ID={}'.format(
-                institution, dbtid)
+    def _process_team(dbtid):
+        institution = team_id_to_instituion(dbtid)
+        name = u'Institution={}, Dropbox Business Team ID={}'.format(
+            institution, dbtid)
+        while lock.has_plan(dbtid):
+            # to wait for updating timestamp in create_waterbutler_log()
+            # (notifications received meanwhile are processed at once)
+            time.sleep(5)
+            lock.take_plan(dbtid)
             try:
                 DEBUG(u'check and update timestamp: {}'.format(name))
                 _check_team_files(dbtid)
             except Exception:
                 logger.exception(name)
-        team_ids = []
 
-    lock.LOCK_RUN.unlock()
+    lock.add_plan(team_ids)
+    for dbtid in team_ids:
+        team_lock = lock.team_lock(dbtid)
+        # If another worker is processing the team, it processes the plan.
+        # Check the plan again after unlocking not to miss the plan added
+        # before unlocking.
+        while lock.has_plan(dbtid) and team_lock.trylock():
+            try:
+                _process_team(dbtid)
+            finally:
+                team_lock.unlock()
@@ -63,6 +63,8 @@ def webhook_post():
             for dbtid in teams.keys():
                 DEBUG('dbtid={}'.format(dbtid))
                 team_ids.append(dbtid)
-    utils.celery_check_updated_files.delay(team_ids)
+    # teams are processed in parallel
+    for dbtid in team_ids:
+        utils.celery_check_updated_files.delay([dbtid])
 
     return ''
@@ -12,6 +12,13 @@ ROOT_FOLDER_FORMAT = 'GRDM_{title}_{guid}'
 PROPERTY_KEY_TIMESTAMP = 'grdm-timestamp'
 PROPERTY_KEY_TIMESTAMP_STATUS = 'grdm-timestamp-status'
 
+# WebDAV sessions (logged-in clients) for the timestamp metadata are
+# pooled and reused per account.
+# max idle clients per account
+METADATA_CLIENT_POOL_SIZE = 4
+# seconds before an idle client logs in again
+METADATA_CLIENT_IDLE_TIMEOUT = 300
+
 DEBUG_URL = None
 DEBUG_USER = None
 DEBUG_PASSWORD = None
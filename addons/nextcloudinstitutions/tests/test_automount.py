@@ -136,3 +136,27 @@ class TestNextcloudinstitutions(unittest.TestCase):
         result = self.project.get_addon(NAME)
         assert_true(isinstance(result, NodeSettings))
         assert_equal(result.root_folder_fullpath, self._expected_root_folder)
+
+    def test_nextcloudinstitutions_path_index(self):
+        from addons.nextcloudinstitutions import utils
+
+        self._allow()
+        self._new_project()
+        project1 = self.project
+        self._new_project()
+        root_folder = self._expected_root_folder
+
+        fileinfo = Mock(path=root_folder + '/dir/file.txt')
+        fileinfo2 = Mock(path=root_folder + '/file2.txt')
+        with patch(PACKAGE + '.utils._check_for_files') as mock_check:
+            utils._check_project_files(self.option, [fileinfo, fileinfo2])
+        assert_equal(mock_check.call_count, 1)
+        node_settings, files = mock_check.call_args[0]
+        assert_equal(node_settings.owner, self.project)
+        assert_equal(files, {'/dir/file.txt': fileinfo, '/file2.txt': fileinfo2})
+
+        index = NodeSettings.cls_path_index(self.option)
+        assert_equal(len(index.find(root_folder + 'X/file.txt')), 0)
+        assert_equal(len(index.find(root_folder)), 1)
+        assert_equal(len(index.find(DEFAULT_BASE_FOLDER + '/file.txt')), 0)
+        assert_not_equal(project1.get_addon(NAME).root_folder_fullpath, root_folder)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import base64
+import unittest
+
+from mock import patch, Mock
+from nose.tools import *  # noqa (PEP8 asserts)
+
+from addons.nextcloudinstitutions import settings, utils
+
+PACKAGE = 'addons.nextcloudinstitutions'
+
+
+def _fileinfo(name, timestamp, status, is_dir=False):
+    return Mock(
+        attributes={
+            '{http://nextcloud.org/ns}' + settings.PROPERTY_KEY_TIMESTAMP: timestamp,
+            '{http://nextcloud.org/ns}' + settings.PROPERTY_KEY_TIMESTAMP_STATUS: status,
+        },
+        get_name=Mock(return_value=name),
+        is_dir=Mock(return_value=is_dir))
+
+
+class TestMetadataClientPool(unittest.TestCase):
+
+    def setUp(self):
+        super(TestMetadataClientPool, self).setUp()
+        utils.clear_client_pool()
+        self.node_settings = Mock()
+        self.node_settings.provider.account.provider_id = 'https://nc.example.com:user01'
+        self.node_settings.provider.account.oauth_key = 'password'
+
+    def tearDown(self):
+        utils.clear_client_pool()
+        super(TestMetadataClientPool, self).tearDown()
+
+    def test_login_is_reused(self):
+        with patch(PACKAGE + '.utils.NextcloudClient') as mock_client:
+            client = mock_client.return_value
+            client._make_dav_request.return_value = [
+                _fileinfo('a.txt', base64.b64encode(b'token'), '1')]
+            for _ in range(3):
+                data, status, context = utils.get_timestamp(self.node_settings, '/GRDM/a.txt')
+                assert_equal(data, b'token')
+                assert_equal(status, 1)
+            utils.set_timestamp(self.node_settings, '/GRDM/a.txt', b'token', 1, context=context)
+        assert_equal(mock_client.call_count, 1)
+        assert_equal(client.login.call_count, 1)
+        assert_equal(client._make_dav_request.call_count, 4)
+
+    def test_broken_client_is_discarded(self):
+        with patch(PACKAGE + '.utils.NextcloudClient') as mock_client:
+            client = mock_client.return_value
+            client._make_dav_request.side_effect = \
+                utils.NCHTTPResponseError(Mock(status_code=401))
+            assert_equal(utils.get_timestamp(self.node_settings, '/GRDM/a.txt'),
+                         (None, None, None))
+            utils.get_timestamp(self.node_settings, '/GRDM/a.txt')
+        assert_equal(client.login.call_count, 2)
+        assert_equal(client.logout.call_count, 2)
+
+    def test_get_timestamps_of_folder(self):
+        with patch(PACKAGE + '.utils.NextcloudClient') as mock_client:
+            client = mock_client.return_value
+            client._make_dav_request.return_value = [
+                _fileinfo('dir', None, None, is_dir=True),
+                _fileinfo('a.txt', base64.b64encode(b'token'), '1'),
+                _fileinfo('b.txt', None, None),
+                _fileinfo('sub', None, None, is_dir=True),
+            ]
+            timestamps = utils.get_timestamps(self.node_settings, '/GRDM/dir')
+        assert_equal(sorted(timestamps.keys()), ['a.txt', 'b.txt'])
+        assert_equal(timestamps['a.txt'][:2], (b'token', 1))
+        assert_equal(timestamps['b.txt'][:2], (None, None))
+        args, kwargs = client._make_dav_request.call_args
+        assert_equal(args[:2], ('PROPFIND', '/GRDM/dir/'))
+        assert_equal(kwargs['headers'], {'Depth': '1'})
@@ -1,24 +1,22 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import threading
 import time
 import math
+from contextlib import contextmanager
 import xml.etree.ElementTree as ET
 import base64
 
 from owncloud import Client as NextcloudClient
 from owncloud import HTTPResponseError as NCHTTPResponseError
 
-from django.contrib.contenttypes.models import ContentType
-
-from api.base import settings as api_settings
-from framework.auth import Auth
 from framework.celery_tasks import app as celery_app
 from celery.contrib.abortable import AbortableTask
-from osf.models import BaseFileNode, OSFUser
+from osf.models import OSFUser
 from osf.models.external import ExternalAccount
 from osf.models.rdm_addons import RdmAddonOption
-from website.util import timestamp, waterbutler
+from website.util import timestamp
 from addons.nextcloudinstitutions import apps, settings
 from addons.nextcloudinstitutions.lock import TMPDIR, LOCK_PREFIX
 from addons.base.lock import Lock
@@ -74,6 +72,15 @@ class MetadataClient(object):
         self.server = server
         self.client = NextcloudClient(self.server, dav_endpoint_version=2)
         self.client.login(self.account, self.password)
+        self.last_used = time.time()
+        # discarded instead of being returned to the pool
+        self.broken = False
+
+    def logout(self):
+        try:
+            self.client.logout()
+        except Exception:
+            pass
 
     def set_metadata(self, path, attributes):
         array = []
@@ -83,81 +90,196 @@ class MetadataClient(object):
         xml = self.PROPPATCH_XML_BASE.format(str_attributes)
         try:
             res = self.client._make_dav_request('PROPPATCH', path, data=xml)
-        except NCHTTPResponseError:
+        except NCHTTPResponseError as e:
+            self._check_error(e)
             logger.error(u'cannot set timestamp: user={}, path={}'.format(self.account, path))
             return None
         return res
 
-    def get_metadata(self, path, attributes):
+    def get_metadata(self, path, attributes, depth=0):
         array = []
         for a in attributes:
             array.append('<nc:' + a + '/>')
         str_attributes = '    '.join(array)
         xml = self.PROPFIND_XML_BASE.format(str_attributes)
         try:
-            res = self.client._make_dav_request('PROPFIND', path, data=xml)
-        except NCHTTPResponseError:
+            res = self.client._make_dav_request(
+                'PROPFIND', path, data=xml, headers={'Depth': str(depth)})
+        except NCHTTPResponseError as e:
+            self._check_error(e)
             logger.error(u'cannot get timestamp: user={}, path={}'.format(self.account, path))
             return None
         return res
 
+    def get_folder_metadata(self, path, attributes):
+        """PROPFIND (Depth: 1) for the children of a folder.
+
+        Returns the list of FileInfo of the children (without the folder
+        itself), or None on error.
+        """
+        res = self.get_metadata(path.rstrip('/') + '/', attributes, depth=1)
+        if res is None:
+            return None
+        return res[1:]
+
+    def _check_error(self, e):
+        # the session (or the password) is no longer valid
+        if e.status_code in (401, 403):
+            self.broken = True
+
     def get_attribute(self, fileinfo, prop):
         key = '{http://nextcloud.org/ns}' + prop
         return fileinfo.attributes[key]
 
 
-def get_timestamp(node_settings, path):
-    DEBUG(u'get_timestamp: path={}'.format(path))
+_client_pool = {}
+_client_pool_lock = threading.Lock()
+
+
+def _pool_key(server, account):
+    return (server, account)
+
+
+def _acquire_client(server, account, password):
+    key = _pool_key(server, account)
+    now = time.time()
+    expired = []
+    cli = None
+    with _client_pool_lock:
+        idle = _client_pool.get(key, [])
+        while idle:
+            c = idle.pop()
+            if c.password != password or \
+               now - c.last_used > settings.METADATA_CLIENT_IDLE_TIMEOUT:
+                expired.append(c)
+                continue
+            cli = c
+            break
+    for c in expired:
+        c.logout()
+    if cli is None:
+        DEBUG(u'MetadataClient: login: user={}'.format(account))
+        cli = MetadataClient(server, account, password)
+    return cli
+
+
+def _release_client(cli):
+    if cli.broken:
+        cli.logout()
+        return
+    cli.last_used = time.time()
+    key = _pool_key(cli.server, cli.account)
+    with _client_pool_lock:
+        idle = _client_pool.setdefault(key, [])
+        if len(idle) < settings.METADATA_CLIENT_POOL_SIZE:
+            idle.append(cli)
+            return
+    cli.logout()
+
+
+def clear_client_pool():
+    with _client_pool_lock:
+        clients = [c for idle in _client_pool.values() for c in idle]
+        _client_pool.clear()
+    for c in clients:
+        c.logout()
+
+
+@contextmanager
+def metadata_client(server, account, password):
+    """Borrow a logged-in MetadataClient of the account from the pool.
+
+    The HTTP session (keep-alive connections and login) of the client is
+    reused by the later calls for the same account.
+    """
+    cli = _acquire_client(server, account, password)
+    try:
+        yield cli
+    except Exception:
+        cli.broken = True
+        raise
+    finally:
+        _release_client(cli)
+
+
+def _account_context(node_settings):
     provider = node_settings.provider
     external_account = provider.account
     url, username = external_account.provider_id.rsplit(':', 1)
     password = external_account.oauth_key
-    attributes = [
-        settings.PROPERTY_KEY_TIMESTAMP,
-        settings.PROPERTY_KEY_TIMESTAMP_STATUS
-    ]
-    cli = MetadataClient(url, username, password)
-    res = cli.get_metadata(path, attributes)
-    if res is not None:
-        timestamp = cli.get_attribute(res[0], settings.PROPERTY_KEY_TIMESTAMP)
-        if timestamp is None:
-            decoded_timestamp = None
-        else:
-            decoded_timestamp = base64.b64decode(timestamp)
-        # DEBUG(u'get timestamp: {}'.format(timestamp))
-        timestamp_status = cli.get_attribute(res[0], settings.PROPERTY_KEY_TIMESTAMP_STATUS)
-        try:
-            timestamp_status = int(timestamp_status)
-        except Exception:
-            timestamp_status = None
-        DEBUG(u'get timestamp_status: {}'.format(timestamp_status))
-        context = {}
-        context['url'] = url
-        context['username'] = username
-        context['password'] = password
-        return (decoded_timestamp, timestamp_status, context)
+    return {
+        'url': url,
+        'username': username,
+        'password': password,
+    }
+
+
+def _timestamp_attributes(cli, fileinfo):
+    timestamp = cli.get_attribute(fileinfo, settings.PROPERTY_KEY_TIMESTAMP)
+    if timestamp is None:
+        decoded_timestamp = None
+    else:
+        decoded_timestamp = base64.b64decode(timestamp)
+    # DEBUG(u'get timestamp: {}'.format(timestamp))
+    timestamp_status = cli.get_attribute(fileinfo, settings.PROPERTY_KEY_TIMESTAMP_STATUS)
+    try:
+        timestamp_status = int(timestamp_status)
+    except Exception:
+        timestamp_status = None
+    DEBUG(u'get timestamp_status: {}'.format(timestamp_status))
+    return decoded_timestamp, timestamp_status
+
+
+TIMESTAMP_ATTRIBUTES = [
+    settings.PROPERTY_KEY_TIMESTAMP,
+    settings.PROPERTY_KEY_TIMESTAMP_STATUS
+]
+
+
+def get_timestamp(node_settings, path):
+    DEBUG(u'get_timestamp: path={}'.format(path))
+    context = _account_context(node_settings)
+    with metadata_client(context['url'], context['username'], context['password']) as cli:
+        res = cli.get_metadata(path, TIMESTAMP_ATTRIBUTES)
+        if res is not None:
+            decoded_timestamp, timestamp_status = _timestamp_attributes(cli, res[0])
+            return (decoded_timestamp, timestamp_status, context)
     return (None, None, None)
 
 
+def get_timestamps(node_settings, folder_path):
+    """Get the timestamps of all files in a folder by one PROPFIND.
+
+    Returns {name: (timestamp_data, timestamp_status, context)} of the
+    files directly under folder_path, or None on error.
+    """
+    DEBUG(u'get_timestamps: folder_path={}'.format(folder_path))
+    context = _account_context(node_settings)
+    with metadata_client(context['url'], context['username'], context['password']) as cli:
+        res = cli.get_folder_metadata(folder_path, TIMESTAMP_ATTRIBUTES)
+        if res is None:
+            return None
+        timestamps = {}
+        for fileinfo in res:
+            if fileinfo.is_dir():
+                continue
+            decoded_timestamp, timestamp_status = _timestamp_attributes(cli, fileinfo)
+            timestamps[fileinfo.get_name()] = (decoded_timestamp, timestamp_status, context)
+        return timestamps
+
+
 def set_timestamp(node_settings, path, timestamp_data, timestamp_status, context=None):
     DEBUG(u'set_timestamp: path={}'.format(path))
     if context is None:
-        provider = node_settings.provider
-        external_account = provider.account
-        url, username = external_account.provider_id.rsplit(':', 1)
-        password = external_account.oauth_key
-    else:
-        url = context['url']
-        username = context['username']
-        password = context['password']
+        context = _account_context(node_settings)
     encoded_timestamp = base64.b64encode(timestamp_data)
     # DEBUG(u'set timestamp: {}'.format(encoded_timestamp))
     attributes = {
         settings.PROPERTY_KEY_TIMESTAMP: encoded_timestamp,
         settings.PROPERTY_KEY_TIMESTAMP_STATUS: str(timestamp_status)
     }
-    cli = MetadataClient(url, username, password)
-    res = cli.set_metadata(path, attributes)
+    with metadata_client(context['url'], context['username'], context['password']) as cli:
+        res = cli.set_metadata(path, attributes)
     if res:
         DEBUG(u'metadata res: {}'.format(type(res)))
 
@@ -192,15 +314,6 @@ def _list_updated_files(externa_account, since):
     return updated_files
 
 
-def _file_exists(cls, target, path):
-    # see osf.models.files/BaseFileNode.get_or_create()
-    content_type = ContentType.objects.get_for_model(target)
-    kwargs = {'target_object_id': target.id,
-              'target_content_type': content_type,
-              '_path': '/' + path.lstrip('/')}
-    return cls.objects.filter(**kwargs).exists()
-
-
 def _select_admin(node):
     # select from admin contributors
     for user in node.contributors.all():
@@ -212,87 +325,79 @@ def _select_admin(node):
     raise Exception('unexpected condition')
 
 
-def _check_for_file(project, path, fileinfo):
+def _modified_users(project, files):
+    # Nextcloud user -> OSFUser.id
+    guids = {}
+    for fileinfo in files.values():
+        if fileinfo.muser and fileinfo.muser not in guids.values():
+            osfuser_guid = project.extuser_to_osfuser(fileinfo.muser)
+            DEBUG(u'osfuser_guid: {}'.format(osfuser_guid))
+            if osfuser_guid:
+                guids[osfuser_guid] = fileinfo.muser
+    users = {}
+    for guid, user_id in OSFUser.objects.filter(
+            guids___id__in=list(guids.keys())).values_list('guids___id', 'id'):
+        users[guids.pop(guid)] = user_id
+    for muser in guids.values():
+        logger.warning(u'modified by unknown user: email={}'.format(muser))
+    return users
+
+
+def _check_for_files(project, files):
+    """Check the timestamps of changed files of a project.
+
+    files: {internal path: FileInfo}
+    """
     node = project.owner
     if node.is_deleted:
         return
-    admin = _select_admin(node)
-    admin_cookie = admin.get_or_create_cookie().decode()
-    created = True
-
-    cls = BaseFileNode.resolve_class(SHORT_NAME, BaseFileNode.FILE)
-    if _file_exists(cls, node, path):
-        created = False
-    file_node = cls.get_or_create(node, path)
-    json = waterbutler.get_node_info(admin_cookie, node._id, SHORT_NAME, path)
-    if json is None:
-        DEBUG(u'waterbutler.get_node_info() is None: path={}'.format(path))
-        return
+    users = _modified_users(project, files)
+    timestamp.reconcile_external_files(
+        node, SHORT_NAME, _select_admin(node),
+        dict((path, users.get(fileinfo.muser))
+             for path, fileinfo in files.items()))
 
-    data = json.get('data')
-    if data is None:
-        DEBUG('waterbutler.get_node_info().get("data") is None: path={}'.format(path))
-        return
-    DEBUG(u'data: {}'.format(str(data)))
-
-    attrs = data['attributes']
-    file_node.update(None, attrs, user=admin)  # update content_hash
-    info = {
-        'file_id': file_node._id,
-        'file_name': attrs.get('name'),
-        'file_path': attrs.get('materialized'),
-        'size': attrs.get('size'),
-        'created': attrs.get('created_utc'),
-        'modified': attrs.get('modified_utc'),
-        'file_version': '',
-        'provider': SHORT_NAME
-    }
-    # verified by admin
-    verify_result = timestamp.check_file_timestamp(admin.id, node, info, verify_external_only=True)
-    DEBUG(u'check timestamp: verify_result={}'.format(verify_result.get('verify_result_title')))
-    if verify_result['verify_result'] == api_settings.TIME_STAMP_TOKEN_CHECK_SUCCESS:
-        return  # already checked
-
-    # The file is created (new file) or modified.
-    user = None
-    if fileinfo.muser:
-        osfuser_guid = project.extuser_to_osfuser(fileinfo.muser)
-        DEBUG(u'osfuser_guid: {}'.format(osfuser_guid))
-        if osfuser_guid:
-            try:
-                user = OSFUser.objects.get(guids___id=osfuser_guid)
-                DEBUG(u'user: {}'.format(str(user)))
-            except OSFUser.DoesNotExist:
-                logger.warning(u'modified by unknown user: email={}'.format(fileinfo.muser))
-
-    metadata = {
-        'path': path,
-        'materialized': path,
-    }
-    if created:
-        action = 'file_added'
-    else:
-        action = 'file_updated'
-    if user:  # modified by user
-        verify_result = timestamp.add_token(user.id, node, info)
-        project.create_waterbutler_log(Auth(user), action, metadata)
-    else:  # modified by unknown user
-        verify_result = timestamp.add_token(admin.id, node, info)
-        project.create_waterbutler_log(None, action, metadata)
-    logger.info(u'update timestamp by Webhook for Nextcloud: node_guid={}, path={}, verify_result={}'.format(
-        node._id, path, verify_result.get('verify_result_title')))
-
-
-def _check_project_files(addon_option, fileinfo):
+
+def _path_index(addon_option):
     from addons.nextcloudinstitutions.models import NodeSettings
 
-    for project in NodeSettings.objects.filter(addon_option=addon_option):
-        path = project.root_folder_fullpath
-        if fileinfo.path.startswith(path):
+    return NodeSettings.cls_path_index(addon_option)
+
+
+def _check_project_files(addon_option, updated_files, path_index=None):
+    """Check the changed files for each project (in bulk per project)."""
+    if path_index is None:
+        path_index = _path_index(addon_option)
+    # NodeSettings.id -> (NodeSettings, {internal path: FileInfo})
+    changes = {}
+    for fileinfo in updated_files:
+        for path, project in path_index.find(fileinfo.path):
             internal_path = fileinfo.path[len(path):]
             if internal_path:
                 DEBUG(u'internal_path: {}'.format(internal_path))
-                _check_for_file(project, internal_path, fileinfo)
+                files = changes.setdefault(project.id, (project, {}))[1]
+                files[internal_path] = fileinfo  # the latest change
+    for project, files in changes.values():
+        try:
+            _check_for_files(project, files)
+        except Exception:
+            logger.exception(u'Insititution={}, project guid={}'.format(
+                addon_option.institution, project.owner._id))
+
+
+def _check_updated_files(addon_option, updated_files, latest):
+    files = []
+    for f in updated_files or []:
+        DEBUG(u'path: {}, mtime: {}, modified user: {}'.format(f.path, f.mtime, f.muser))
+        if f.ftype == 'file':
+            files.append(f)
+            if latest < f.mtime:
+                latest = f.mtime
+                DEBUG(u'latest: {}'.format(str(latest)))
+    # the index of projects is built for each pass
+    # (projects may be added or renamed while sleeping)
+    _check_project_files(addon_option, files)
+    return latest
 
 
 @celery_app.task(bind=True, base=AbortableTask)
@@ -327,17 +432,7 @@ def celery_check_updated_files(self, provider_id, since, interval):
     updated_files = _list_updated_files(ea, since)
     DEBUG(u'update files: {}'.format(str(updated_files)))
 
-    latest = since
-    for f in updated_files:
-        DEBUG(u'path: {}, mtime: {}, modified user: {}'.format(f.path, f.mtime, f.muser))
-        if f.ftype == 'file':
-            try:
-                _check_project_files(opt, f)
-                if latest < f.mtime:
-                    latest = f.mtime
-                    DEBUG(u'latest: {}'.format(str(latest)))
-            except Exception:
-                logger.exception(u'Insititution={}, Nextcloud ID={}'.format(opt.institution, provider_id))
+    latest = _check_updated_files(opt, updated_files, since)
 
     # wait for the specified interval
     current_time = time.time()
@@ -350,17 +445,7 @@ def celery_check_updated_files(self, provider_id, since, interval):
 
     updated_files2 = _list_updated_files(ea, latest)
     DEBUG(u'update files2: {}'.format(str(updated_files2)))
-
-    for f in updated_files2:
-        DEBUG(u'path: {}, mtime: {}, modified user: {}'.format(f.path, f.mtime, f.muser))
-        if f.ftype == 'file':
-            try:
-                _check_project_files(opt, f)
-                if latest < f.mtime:
-                    latest = f.mtime
-                    DEBUG(u'latest: {}'.format(str(latest)))
-            except Exception:
-                logger.exception(u'Insititution={}, Nextcloud ID={}'.format(opt.institution, provider_id))
+    latest = _check_updated_files(opt, updated_files2, latest)
 
     opt.extended[NEXTCLOUD_FILE_UPDATE_SINCE] = latest
     opt.save()
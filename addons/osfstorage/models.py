@@ -80,6 +80,46 @@ class OsfStorageFileNode(BaseFileNode):
         # raise Exception('Cannot set materialized path on OSFStorage as it is computed.')
         logger.warn('Cannot set materialized path on OSFStorage because it\'s computed.')
 
+    @classmethod
+    def get_materialized_paths(cls, file_nodes):
+        """Returns {pk: materialized_path} of file_nodes by one recursive query."""
+        file_nodes = list(file_nodes)
+        if not file_nodes:
+            return {}
+        sql = """
+            WITH RECURSIVE materialized_path_cte(start_id, parent_id, GEN_PATH) AS (
+              SELECT
+                T.id,
+                T.parent_id,
+                T.name :: TEXT AS GEN_PATH
+              FROM %s AS T
+              WHERE T.id IN %s
+              UNION ALL
+              SELECT
+                R.start_id,
+                T.parent_id,
+                (T.name || '/' || R.GEN_PATH) AS GEN_PATH
+              FROM materialized_path_cte AS R
+                JOIN %s AS T ON T.id = R.parent_id
+              WHERE R.parent_id IS NOT NULL
+            )
+            SELECT start_id, gen_path
+            FROM materialized_path_cte AS N
+            WHERE parent_id IS NULL;
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [AsIs(cls._meta.db_table), tuple(f.pk for f in file_nodes), AsIs(cls._meta.db_table)])
+            paths = dict(cursor.fetchall())
+        ret = {}
+        for file_node in file_nodes:
+            path = paths.get(file_node.pk)
+            if path is None:
+                path = '/'
+            elif not file_node.is_file:
+                path = path + '/'
+            ret[file_node.pk] = path
+        return ret
+
     @classmethod
     def get(cls, _id, target):
         return cls.objects.get(_id=_id, target_object_id=target.id, target_content_type=ContentType.objects.get_for_model(target))
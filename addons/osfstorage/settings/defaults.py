@@ -32,6 +32,11 @@ try:
 except Exception as ex:
     logger.warn('No migration settings loaded for OSFStorage, falling back to local dev. {}'.format(ex))
 
+# Max number of children in a page of osfstorage_get_children
+CHILDREN_MAX_PAGE_SIZE = 1000
+# Number of children fetched at once from the database in the streaming mode
+CHILDREN_STREAM_CHUNK_SIZE = 1000
+
 # Max file size permitted by frontend in megabytes
 MAX_UPLOAD_SIZE = 5 * 1024  # 5 GB
 
@@ -172,6 +172,47 @@ class TestGetMetadataHook(HookTestCase):
         assert_equal(res_date_modified, expected_date_modified)
         assert_equal(res_date_created, expected_date_created)
 
+    def test_children_metadata_paginated(self):
+        root = self.node_settings.get_root()
+        for name in ('c.txt', 'a.txt', 'b.txt'):
+            record = root.append_file(name)
+            record.add_version(factories.FileVersionFactory())
+        record.add_version(factories.FileVersionFactory())
+        record.refresh_from_db()
+        assert_equal(record.latest_version, record.versions.order_by('created').last())
+        assert_equal(record.earliest_version, record.versions.order_by('created').first())
+
+        names = []
+        cursor = None
+        for _ in range(2):
+            view_kwargs = {'fid': root._id, 'user_id': self.user._id, 'limit': 2}
+            if cursor:
+                view_kwargs['cursor'] = cursor
+            res = self.send_hook('osfstorage_get_children', view_kwargs, {}, self.node)
+            names.extend(child['name'] for child in res.json['data'])
+            cursor = res.json['next']
+        assert_equal(names, ['a.txt', 'b.txt', 'c.txt'])
+        assert_equal(cursor, None)
+
+        res = self.send_hook(
+            'osfstorage_get_children',
+            {'fid': root._id, 'user_id': self.user._id, 'stream': 'true'},
+            {},
+            self.node
+        )
+        children = json.loads(res.body)
+        assert_equal(sorted(child['name'] for child in children), ['a.txt', 'b.txt', 'c.txt'])
+        assert_equal([c['version'] for c in children if c['name'] == 'b.txt'], [2])
+
+        res = self.send_hook(
+            'osfstorage_get_children',
+            {'fid': root._id, 'user_id': self.user._id, 'cursor': 'invalid'},
+            {},
+            self.node,
+            expect_errors=True
+        )
+        assert_equal(res.status_code, 400)
+
     def test_osf_storage_root(self):
         auth = Auth(self.project.creator)
         result = osf_storage_root(self.node_settings.config, self.node_settings, auth)
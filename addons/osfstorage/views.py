@@ -1,6 +1,8 @@
 from __future__ import unicode_literals
 
 from rest_framework import status as http_status
+import base64
+import json
 import logging
 
 from django.core.exceptions import ValidationError
@@ -8,7 +10,7 @@ from django.db import IntegrityError
 from django.db import connection
 from django.db import transaction
 
-from flask import request
+from flask import request, Response, stream_with_context
 
 from framework.auth import Auth
 from framework.sessions import get_session
@@ -172,113 +174,173 @@ def osfstorage_get_metadata(file_node, **kwargs):
     return file_node.serialize(version=version, include_full=True)
 
 
+# Read the documentation on FileVersion's fields before reading this query.
+# The latest/earliest versions are precomputed on the file node (see BaseFileNode.add_version)
+CHILDREN_QUERY = """
+    SELECT F.name, F.id, CASE
+        WHEN F.type = 'osf.osfstoragefile' THEN
+            json_build_object(
+                'id', F._id
+                , 'path', '/' || F._id
+                , 'name', F.name
+                , 'kind', 'file'
+                , 'size', LATEST_VERSION.size
+                , 'downloads',  COALESCE(DOWNLOAD_COUNT, 0)
+                , 'version', (SELECT COUNT(*) FROM osf_basefileversionsthrough WHERE osf_basefileversionsthrough.basefilenode_id = F.id)
+                , 'contentType', LATEST_VERSION.content_type
+                , 'modified', LATEST_VERSION.created
+                , 'created', EARLIEST_VERSION.created
+                , 'checkout', CHECKOUT_GUID
+                , 'md5', LATEST_VERSION.metadata ->> 'md5'
+                , 'sha256', LATEST_VERSION.metadata ->> 'sha256'
+                , 'sha512', LATEST_VERSION.metadata ->> 'sha512'
+                , 'latestVersionSeen', SEEN_LATEST_VERSION.case
+            )
+        ELSE
+            json_build_object(
+                'id', F._id
+                , 'path', '/' || F._id || '/'
+                , 'name', F.name
+                , 'kind', 'folder'
+            )
+        END AS child
+    FROM osf_basefilenode AS F
+    LEFT JOIN osf_fileversion AS LATEST_VERSION ON LATEST_VERSION.id = F.latest_version_id
+    LEFT JOIN osf_fileversion AS EARLIEST_VERSION ON EARLIEST_VERSION.id = F.earliest_version_id
+    LEFT JOIN LATERAL (
+        SELECT _id from osf_guid
+        WHERE object_id = F.checkout_id
+        AND content_type_id = %(user_content_type_id)s
+        LIMIT 1
+    ) CHECKOUT_GUID ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT P.total AS DOWNLOAD_COUNT FROM osf_pagecounter AS P
+        WHERE P.resource_id = %(resource_id)s
+        AND P.file_id = F.id
+        AND P.action = 'download'
+        AND P.version ISNULL
+        LIMIT 1
+    ) DOWNLOAD_COUNT ON TRUE
+    LEFT JOIN LATERAL (
+      SELECT EXISTS(
+        SELECT (1) FROM osf_fileversionusermetadata
+          INNER JOIN osf_fileversion ON osf_fileversionusermetadata.file_version_id = osf_fileversion.id
+          INNER JOIN osf_basefileversionsthrough ON osf_fileversion.id = osf_basefileversionsthrough.fileversion_id
+          WHERE osf_fileversionusermetadata.user_id = %(user_pk)s
+          AND osf_basefileversionsthrough.basefilenode_id = F.id
+        LIMIT 1
+      )
+    ) SEEN_FILE ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT CASE WHEN SEEN_FILE.exists
+        THEN
+            CASE WHEN EXISTS(
+              SELECT (1) FROM osf_fileversionusermetadata
+              WHERE osf_fileversionusermetadata.file_version_id = F.latest_version_id
+              AND osf_fileversionusermetadata.user_id = %(user_pk)s
+              LIMIT 1
+            )
+            THEN
+              json_build_object('user', %(user_id)s, 'seen', TRUE)
+            ELSE
+              json_build_object('user', %(user_id)s, 'seen', FALSE)
+            END
+        ELSE
+          NULL
+        END
+    ) SEEN_LATEST_VERSION ON TRUE
+    WHERE parent_id = %(parent_id)s
+    AND (NOT F.type IN ('osf.trashedfilenode', 'osf.trashedfile', 'osf.trashedfolder'))
+"""
+
+
+def encode_children_cursor(name, pk):
+    return base64.urlsafe_b64encode(json.dumps([name, pk]).encode('utf-8')).decode('ascii')
+
+
+def decode_children_cursor(cursor):
+    try:
+        name, pk = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        return name, int(pk)
+    except (TypeError, ValueError):
+        raise HTTPError(http_status.HTTP_400_BAD_REQUEST, data={'message_long': 'Invalid cursor'})
+
+
+def _stream_children(query, params):
+    # a server-side cursor, so that the whole listing is not held in memory
+    with connection.chunked_cursor() as cursor:
+        cursor.execute('SELECT C.child::text FROM ({}) AS C'.format(query), params)
+        yield '['
+        first = True
+        while True:
+            rows = cursor.fetchmany(osf_storage_settings.CHILDREN_STREAM_CHUNK_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                yield (row[0] if first else ',' + row[0])
+                first = False
+        yield ']'
+
+
 @must_be_signed
 @decorators.autoload_filenode(must_be='folder')
 def osfstorage_get_children(file_node, **kwargs):
+    """List the children of a folder.
+
+    Query parameters (all optional):
+
+    - limit: returns a page of children ordered by (name, id) as
+      ``{"data": [...], "next": <cursor or null>}``
+    - cursor: the ``next`` of the previous page
+    - stream: "true" to stream the whole listing as a JSON array
+
+    Without them, the whole listing is returned as a JSON array.
+    """
     from django.contrib.contenttypes.models import ContentType
     user_id = request.args.get('user_id')
     user_content_type_id = ContentType.objects.get_for_model(OSFUser).id
     user_pk = OSFUser.objects.filter(guids___id=user_id, guids___id__isnull=False).values_list('pk', flat=True).first()
+    params = {
+        'user_content_type_id': user_content_type_id,
+        'resource_id': file_node.target.guids.first().id,
+        'user_pk': user_pk,
+        'user_id': user_id,
+        'parent_id': file_node.id,
+    }
+
+    limit = request.args.get('limit')
+    cursor_arg = request.args.get('cursor')
+    if limit is None and cursor_arg is None:
+        if request.args.get('stream', '').lower() == 'true':
+            return Response(stream_with_context(_stream_children(CHILDREN_QUERY, params)),
+                            mimetype='application/json')
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT json_agg(C.child) FROM ({}) AS C'.format(CHILDREN_QUERY), params)
+            return cursor.fetchone()[0] or []
+
+    try:
+        limit = int(limit or osf_storage_settings.CHILDREN_MAX_PAGE_SIZE)
+    except ValueError:
+        raise HTTPError(http_status.HTTP_400_BAD_REQUEST, data={'message_long': 'Invalid limit'})
+    limit = max(1, min(limit, osf_storage_settings.CHILDREN_MAX_PAGE_SIZE))
+    query = CHILDREN_QUERY
+    if cursor_arg:
+        params['cursor_name'], params['cursor_id'] = decode_children_cursor(cursor_arg)
+        query += ' AND (F.name, F.id) > (%(cursor_name)s, %(cursor_id)s)'
+    # one more row to know whether there is a next page
+    query += ' ORDER BY F.name, F.id LIMIT %(limit)s'
+    params['limit'] = limit + 1
     with connection.cursor() as cursor:
-        # Read the documentation on FileVersion's fields before reading this code
-        cursor.execute("""
-            SELECT json_agg(CASE
-                WHEN F.type = 'osf.osfstoragefile' THEN
-                    json_build_object(
-                        'id', F._id
-                        , 'path', '/' || F._id
-                        , 'name', F.name
-                        , 'kind', 'file'
-                        , 'size', LATEST_VERSION.size
-                        , 'downloads',  COALESCE(DOWNLOAD_COUNT, 0)
-                        , 'version', (SELECT COUNT(*) FROM osf_basefileversionsthrough WHERE osf_basefileversionsthrough.basefilenode_id = F.id)
-                        , 'contentType', LATEST_VERSION.content_type
-                        , 'modified', LATEST_VERSION.created
-                        , 'created', EARLIEST_VERSION.created
-                        , 'checkout', CHECKOUT_GUID
-                        , 'md5', LATEST_VERSION.metadata ->> 'md5'
-                        , 'sha256', LATEST_VERSION.metadata ->> 'sha256'
-                        , 'sha512', LATEST_VERSION.metadata ->> 'sha512'
-                        , 'latestVersionSeen', SEEN_LATEST_VERSION.case
-                    )
-                ELSE
-                    json_build_object(
-                        'id', F._id
-                        , 'path', '/' || F._id || '/'
-                        , 'name', F.name
-                        , 'kind', 'folder'
-                    )
-                END
-            )
-            FROM osf_basefilenode AS F
-            LEFT JOIN LATERAL (
-                SELECT * FROM osf_fileversion
-                JOIN osf_basefileversionsthrough ON osf_fileversion.id = osf_basefileversionsthrough.fileversion_id
-                WHERE osf_basefileversionsthrough.basefilenode_id = F.id
-                ORDER BY created DESC
-                LIMIT 1
-            ) LATEST_VERSION ON TRUE
-            LEFT JOIN LATERAL (
-                SELECT * FROM osf_fileversion
-                JOIN osf_basefileversionsthrough ON osf_fileversion.id = osf_basefileversionsthrough.fileversion_id
-                WHERE osf_basefileversionsthrough.basefilenode_id = F.id
-                ORDER BY created ASC
-                LIMIT 1
-            ) EARLIEST_VERSION ON TRUE
-            LEFT JOIN LATERAL (
-                SELECT _id from osf_guid
-                WHERE object_id = F.checkout_id
-                AND content_type_id = %s
-                LIMIT 1
-            ) CHECKOUT_GUID ON TRUE
-            LEFT JOIN LATERAL (
-                SELECT P.total AS DOWNLOAD_COUNT FROM osf_pagecounter AS P
-                WHERE P.resource_id = %s
-                AND P.file_id = F.id
-                AND P.action = 'download'
-                AND P.version ISNULL
-                LIMIT 1
-            ) DOWNLOAD_COUNT ON TRUE
-            LEFT JOIN LATERAL (
-              SELECT EXISTS(
-                SELECT (1) FROM osf_fileversionusermetadata
-                  INNER JOIN osf_fileversion ON osf_fileversionusermetadata.file_version_id = osf_fileversion.id
-                  INNER JOIN osf_basefileversionsthrough ON osf_fileversion.id = osf_basefileversionsthrough.fileversion_id
-                  WHERE osf_fileversionusermetadata.user_id = %s
-                  AND osf_basefileversionsthrough.basefilenode_id = F.id
-                LIMIT 1
-              )
-            ) SEEN_FILE ON TRUE
-            LEFT JOIN LATERAL (
-                SELECT CASE WHEN SEEN_FILE.exists
-                THEN
-                    CASE WHEN EXISTS(
-                      SELECT (1) FROM osf_fileversionusermetadata
-                      WHERE osf_fileversionusermetadata.file_version_id = LATEST_VERSION.fileversion_id
-                      AND osf_fileversionusermetadata.user_id = %s
-                      LIMIT 1
-                    )
-                    THEN
-                      json_build_object('user', %s, 'seen', TRUE)
-                    ELSE
-                      json_build_object('user', %s, 'seen', FALSE)
-                    END
-                ELSE
-                  NULL
-                END
-            ) SEEN_LATEST_VERSION ON TRUE
-            WHERE parent_id = %s
-            AND (NOT F.type IN ('osf.trashedfilenode', 'osf.trashedfile', 'osf.trashedfolder'))
-        """, [
-            user_content_type_id,
-            file_node.target.guids.first().id,
-            user_pk,
-            user_pk,
-            user_id,
-            user_id,
-            file_node.id
-        ])
-        return cursor.fetchone()[0] or []
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_children_cursor(rows[-1][0], rows[-1][1])
+    return {
+        'data': [row[2] for row in rows],
+        'next': next_cursor,
+    }
 
 
 @must_be_signed
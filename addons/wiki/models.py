@@ -176,7 +176,7 @@ class WikiVersion(ObjectIDMixin, BaseModel):
     def save(self, *args, **kwargs):
         rv = super(WikiVersion, self).save(*args, **kwargs)
         if self.wiki_page.node:
-            self.wiki_page.node.update_search()
+            self.wiki_page.node.update_search(saved_fields=[])
         self.wiki_page.modified = self.created
         self.wiki_page.save()
         self.check_spam()
@@ -288,7 +288,7 @@ class WikiPage(GuidMixin, BaseModel):
     def save(self, *args, **kwargs):
         rv = super(WikiPage, self).save(*args, **kwargs)
         if self.node and (self.node.is_public or settings.ENABLE_PRIVATE_SEARCH):
-            self.node.update_search(wiki_page=self)
+            self.node.update_search(wiki_page=self, saved_fields=[])
         return rv
 
     def update(self, user, content):
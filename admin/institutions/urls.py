@@ -26,4 +26,5 @@ urlpatterns = [
     url(r'^recalculate_quota/$', views.RecalculateQuota.as_view(), name='recalculate_quota'),
     url(r'^recalculate_quota_of_users_in_institution/$',
         views.RecalculateQuotaOfUsersInInstitution.as_view(), name='recalculate_quota_of_users_in_institution'),
+    url(r'^recalculate_quota/status/$', views.RecalculateQuotaStatus.as_view(), name='recalculate_quota_status'),
 ]
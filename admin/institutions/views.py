@@ -67,6 +67,9 @@ class InstitutionUserList(PermissionRequiredMixin, ListView):
         query_set = kwargs.pop('object_list', self.object_list)
         page_size = self.get_paginate_by(query_set)
         paginator, page, query_set, is_paginated = self.paginate_queryset(query_set, page_size)
+        statuses = quota.get_recalculation_statuses([institution.id for institution in query_set])
+        for institution in query_set:
+            institution.quota_recalculation = statuses.get(institution.id)
         kwargs.setdefault('institutions', query_set)
         kwargs.setdefault('page', page)
         kwargs.setdefault('logohost', settings.OSF_URL)
@@ -445,17 +448,20 @@ class StatisticalStatusDefaultStorage(QuotaUserList, RdmPermissionMixin, UserPas
     def get_institution(self):
         return self.request.user.affiliated_institutions.first()
 
+    def get_context_data(self, **kwargs):
+        kwargs['quota_recalculation'] = quota.get_recalculation_status(
+            self.get_institution().id, UserQuota.CUSTOM_STORAGE)
+        return super(StatisticalStatusDefaultStorage, self).get_context_data(**kwargs)
+
 
 class RecalculateQuota(RdmPermissionMixin, RedirectView):
 
     def dispatch(self, request, *args, **kwargs):
         if self.is_super_admin:
-            institutions_list = Institution.objects.all()
-
-            for institution in institutions_list:
-                user_list = OSFUser.objects.filter(affiliated_institutions=institution)
-                for user in user_list:
-                    quota.update_user_used_quota(user)
+            institution_ids = list(Institution.objects.values_list('id', flat=True))
+            quota.start_used_quota_recalculation(
+                institution_ids, UserQuota.NII_STORAGE,
+                changed_only=bool(request.POST.get('changed_only')))
 
         return redirect('institutions:institution_list')
 
@@ -466,7 +472,27 @@ class RecalculateQuotaOfUsersInInstitution(RdmPermissionMixin, RedirectView):
         if self.is_admin:
             institution = self.request.user.affiliated_institutions.first()
             if institution is not None and Region.objects.filter(_id=institution._id).exists():
-                for user in OSFUser.objects.filter(affiliated_institutions=institution.id):
-                    quota.update_user_used_quota(user, UserQuota.CUSTOM_STORAGE)
+                quota.start_used_quota_recalculation(
+                    [institution.id], UserQuota.CUSTOM_STORAGE,
+                    changed_only=bool(request.POST.get('changed_only')))
 
         return redirect('institutions:statistical_status_default_storage')
+
+
+class RecalculateQuotaStatus(RdmPermissionMixin, View):
+    """Progress of the recalculations started by RecalculateQuota (for super
+    admins) or RecalculateQuotaOfUsersInInstitution (for institution admins)."""
+
+    def get(self, request, *args, **kwargs):
+        if self.is_super_admin:
+            institution_ids = list(Institution.objects.values_list('id', flat=True))
+            storage_type = UserQuota.NII_STORAGE
+        elif self.is_admin and request.user.affiliated_institutions.exists():
+            institution_ids = [request.user.affiliated_institutions.first().id]
+            storage_type = UserQuota.CUSTOM_STORAGE
+        else:
+            return JsonResponse({'message': 'Forbidden'}, status=403)
+        statuses = quota.get_recalculation_statuses(institution_ids, storage_type)
+        return JsonResponse({
+            'statuses': {str(institution_id): status for institution_id, status in statuses.items()}
+        })
@@ -7,6 +7,10 @@ urlpatterns = [
     url(r'^(?P<institution_id>[0-9]+)/nodes/$', views.InstitutionNodeList.as_view(), name='nodes'),
     url(r'^(?P<institution_id>[0-9]+)/nodes/(?P<guid>[a-z0-9]+)/$',
         views.TimeStampAddList.as_view(), name='timestamp_add'),
+    url(r'^(?P<institution_id>[0-9]+)/nodes/(?P<guid>[a-z0-9]+)/error_list/$',
+        views.TimestampErrorList.as_view(), name='error_list'),
+    url(r'^(?P<institution_id>[0-9]+)/nodes/(?P<guid>[a-z0-9]+)/error_list/csv/$',
+        views.ExportErrorListCSV.as_view(), name='error_list_csv'),
     url(r'^(?P<institution_id>[0-9]+)/nodes/(?P<guid>[a-z0-9]+)/verify/$',
         views.VerifyTimestamp.as_view(), name='verify'),
     url(r'^(?P<institution_id>[0-9]+)/nodes/(?P<guid>[a-z0-9]+)/addtimestamp/add_timestamp_data/$',
@@ -4,8 +4,9 @@ from __future__ import unicode_literals
 from admin.base import settings
 from admin.rdm.utils import RdmPermissionMixin, get_dummy_institution
 from django.contrib.auth.mixins import UserPassesTestMixin
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.urlresolvers import reverse
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import redirect
 from django.views.generic import ListView, View, TemplateView
 from osf.models import Institution, Node, AbstractNode, TimestampTask
@@ -89,13 +90,51 @@ class TimeStampAddList(RdmPermissionMixin, TemplateView):
         ctx = super(TimeStampAddList, self).get_context_data(**kwargs)
         absNodeData = AbstractNode.objects.get(id=self.kwargs['guid'])
 
-        ctx['init_project_timestamp_error_list'] = timestamp.get_error_list(absNodeData._id)
+        error_list_page = timestamp.get_error_list_page(absNodeData._id)
+        ctx['init_project_timestamp_error_list'] = error_list_page['provider_list']
+        ctx['error_list_page'] = error_list_page
+        ctx['error_list_users'] = timestamp.get_error_list_users(absNodeData._id)
         ctx['project_title'] = absNodeData.title
         ctx['guid'] = self.kwargs['guid']
         ctx['institution_id'] = self.kwargs['institution_id']
         ctx['async_task'] = timestamp.get_async_task_data(absNodeData)
         return ctx
 
+class TimestampErrorList(RdmPermissionMixin, View):
+    """Paginated error list (JSON)"""
+
+    def test_func(self):
+        """validate user permissions"""
+        institution_id = int(self.kwargs.get('institution_id'))
+        return self.has_auth(institution_id)
+
+    def get(self, request, *args, **kwargs):
+        node = AbstractNode.objects.get(id=self.kwargs['guid'])
+        ctx = timestamp.get_error_list_page(
+            node._id,
+            page=request.GET.get('page', 1),
+            page_size=request.GET.get('page_size'),
+            **timestamp.get_error_list_filters(request.GET)
+        )
+        return HttpResponse(json.dumps(ctx, cls=DjangoJSONEncoder), content_type='application/json')
+
+class ExportErrorListCSV(RdmPermissionMixin, View):
+    """Streaming CSV export of the error list"""
+
+    def test_func(self):
+        """validate user permissions"""
+        institution_id = int(self.kwargs.get('institution_id'))
+        return self.has_auth(institution_id)
+
+    def get(self, request, *args, **kwargs):
+        node = AbstractNode.objects.get(id=self.kwargs['guid'])
+        response = StreamingHttpResponse(
+            timestamp.iter_error_list_csv(node._id, **timestamp.get_error_list_filters(request.GET)),
+            content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="timestamp_errors_{}.csv"'.format(node._id)
+        timestamp.add_log_download_errors(node, self.request.user.id, {'file_format': 'CSV'})
+        return response
+
 class VerifyTimestamp(RdmPermissionMixin, View):
 
     def post(self, request, *args, **kwargs):
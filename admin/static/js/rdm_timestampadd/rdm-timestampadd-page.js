@@ -63,41 +63,38 @@ $(function () {
 
     $('#first-page').on('click', function () {
         $('.listjs-pagination li').first().click();
-        updatePaginationElements();
     });
 
     $('#previous-page').on('click', function () {
         $('.pagination-prev').click();
-        updatePaginationElements();
     });
 
     $('#next-page').on('click', function () {
         $('.pagination-next').click();
-        updatePaginationElements();
     });
 
     $('#last-page').on('click', function () {
         $('.listjs-pagination li').last().click();
-        updatePaginationElements();
     });
 
     $('#pageLength-10').on('click', function () {
         $('#pageLength').val(10).change();
-        updatePaginationElements();
     });
 
     $('#pageLength-25').on('click', function () {
         $('#pageLength').val(25).change();
-        updatePaginationElements();
     });
 
     $('#pageLength-50').on('click', function () {
         $('#pageLength').val(50).change();
-        updatePaginationElements();
     });
 
     $(document).ready(function () {
-        timestampCommon.init(urls.taskStatusUrl);
+        timestampCommon.init(urls.taskStatusUrl, {
+            errorListUrl: urls.errorList,
+            errorListCsvUrl: urls.errorListCsv,
+            onPageLoaded: updatePaginationElements
+        });
         $('#btn-verify').on('click', btnVerify_onclick).focus();
         $('#btn-addtimestamp').on('click', btnAddtimestamp_onclick).focus();
         $('#btn-cancel').on('click', function () {
@@ -106,6 +103,5 @@ $(function () {
         $('#btn-download').on('click', function () {
             timestampCommon.download(urls.downloadErrors);
         });
-        updatePaginationElements();
     });
 });
@@ -982,40 +982,29 @@ class TestRecalculateQuota(AdminTestCase):
         self.view = views.RecalculateQuota()
         self.view.request = self.request
 
-    @mock.patch('website.util.quota.update_user_used_quota')
-    @mock.patch('admin.institutions.views.OSFUser.objects')
-    @mock.patch('admin.institutions.views.Institution.objects')
-    def test_dispatch_method_with_user_is_superuser(self, mock_institution, mock_osfuser,
-                                                    mock_update_user_used_quota_method):
-        mock_institution.all.return_value = [self.institution1]
-        mock_osfuser.filter.return_value = [self.user]
-
+    @mock.patch('website.util.quota.start_used_quota_recalculation')
+    def test_dispatch_method_with_user_is_superuser(self, mock_start):
         response = self.view.dispatch(request=self.request)
 
         nt.assert_equal(response.status_code, 302)
         nt.assert_equal(response.url, self.url)
-        mock_institution.all.assert_called()
-        mock_osfuser.filter.assert_called()
-        mock_update_user_used_quota_method.assert_called()
-
-    @mock.patch('website.util.quota.update_user_used_quota')
-    @mock.patch('admin.institutions.views.OSFUser.objects')
-    @mock.patch('admin.institutions.views.Institution.objects')
-    def test_dispatch_method_with_user_is_not_superuser(self, mock_institution, mock_osfuser,
-                                                        mock_update_user_used_quota_method):
+        mock_start.assert_called_once()
+        institution_ids, storage_type = mock_start.call_args[0]
+        nt.assert_in(self.institution1.id, institution_ids)
+        nt.assert_in(self.institution2.id, institution_ids)
+        nt.assert_equal(storage_type, UserQuota.NII_STORAGE)
+        nt.assert_equal(mock_start.call_args[1], {'changed_only': False})
+
+    @mock.patch('website.util.quota.start_used_quota_recalculation')
+    def test_dispatch_method_with_user_is_not_superuser(self, mock_start):
         self.user.is_superuser = False
         self.user.save()
 
-        mock_institution.all.return_value = [self.institution1]
-        mock_osfuser.filter.return_value = [self.user]
-
         response = self.view.dispatch(request=self.request)
 
         nt.assert_equal(response.status_code, 302)
         nt.assert_equal(response.url, self.url)
-        mock_institution.all.assert_not_called()
-        mock_osfuser.filter.assert_not_called()
-        mock_update_user_used_quota_method.assert_not_called()
+        mock_start.assert_not_called()
 
 
 class TestRecalculateQuotaOfUsersInInstitution(AdminTestCase):
@@ -1040,28 +1029,28 @@ class TestRecalculateQuotaOfUsersInInstitution(AdminTestCase):
         self.view.request = self.request
 
     @mock.patch('admin.institutions.views.Region.objects')
-    @mock.patch('website.util.quota.update_user_used_quota')
-    def test_dispatch_method_with_institution_exists_in_Region(self, mock_update_user_used_quota_method, mock_region):
+    @mock.patch('website.util.quota.start_used_quota_recalculation')
+    def test_dispatch_method_with_institution_exists_in_Region(self, mock_start, mock_region):
         mock_region.filter.return_value.exists.return_value = True
         response = self.view.dispatch(request=self.request)
 
         nt.assert_equal(response.status_code, 302)
         nt.assert_equal(response.url, self.url)
-        mock_update_user_used_quota_method.assert_called()
+        mock_start.assert_called()
 
     @mock.patch('admin.institutions.views.Region.objects')
-    @mock.patch('website.util.quota.update_user_used_quota')
-    def test_dispatch_method_with_institution_not_exists_in_Region(self, mock_update_user_used_quota_method,
+    @mock.patch('website.util.quota.start_used_quota_recalculation')
+    def test_dispatch_method_with_institution_not_exists_in_Region(self, mock_start,
                                                                    mock_region):
         mock_region.filter.return_value.exists.return_value = False
         response = self.view.dispatch(request=self.request)
         nt.assert_equal(response.status_code, 302)
         nt.assert_equal(response.url, self.url)
-        mock_update_user_used_quota_method.assert_not_called()
+        mock_start.assert_not_called()
 
     @mock.patch('admin.institutions.views.Region.objects')
-    @mock.patch('website.util.quota.update_user_used_quota')
-    def test_dispatch_method_with_user_is_not_admin(self, mock_update_user_used_quota_method, mock_region):
+    @mock.patch('website.util.quota.start_used_quota_recalculation')
+    def test_dispatch_method_with_user_is_not_admin(self, mock_start, mock_region):
         self.user.is_staff = False
         self.user.affiliated_institutions.remove(self.institution1)
         self.user.save()
@@ -1070,4 +1059,4 @@ class TestRecalculateQuotaOfUsersInInstitution(AdminTestCase):
         response = self.view.dispatch(request=self.request)
         nt.assert_equal(response.status_code, 302)
         nt.assert_equal(response.url, self.url)
-        mock_update_user_used_quota_method.assert_not_called()
+        mock_start.assert_not_called()
@@ -154,6 +154,71 @@ class TestTimeStampAddList(AdminTestCase):
         nt.assert_in(u'Freddie Mercury', other_error_list[0]['creator_name'])
         nt.assert_not_equal(u'', other_error_list[0]['creator_id'])
 
+        nt.assert_equal(res['error_list_page']['count'], 3)
+        nt.assert_equal(res['error_list_page']['num_pages'], 1)
+        nt.assert_equal([user['id'] for user in res['error_list_users']], [self.project_user._id])
+
+    @mock.patch('website.util.timestamp.ERROR_LIST_PAGE_SIZE', 2)
+    def test_get_context_data_first_page(self):
+        self.view.kwargs['guid'] = self.private_project1.id
+        res = self.view.get_context_data()
+
+        nt.assert_in('osfstorage_test_file2.status_3', str(res['init_project_timestamp_error_list']))
+        nt.assert_in('osfstorage_test_file3.status_3', str(res['init_project_timestamp_error_list']))
+        nt.assert_not_in('s3_test_file1.status_3', str(res['init_project_timestamp_error_list']))
+        nt.assert_equal(res['error_list_page']['count'], 3)
+        nt.assert_equal(res['error_list_page']['num_pages'], 2)
+
+    def _error_list_view(self, view, url):
+        request = RequestFactory().get(url)
+        view = setup_user_view(view, request, user=self.user)
+        view.kwargs = {'institution_id': self.project_institution.id, 'guid': self.private_project1.id}
+        return view
+
+    def test_error_list_json(self):
+        url = '/timestampadd/{}/nodes/{}/error_list/?page=2&page_size=2'.format(
+            self.project_institution.id, self.private_project1.id)
+        view = self._error_list_view(views.TimestampErrorList(), url)
+        res = view.get(view.request)
+        nt.assert_equal(res.status_code, 200)
+        data = json.loads(res.content.decode())
+        nt.assert_equal(data['count'], 3)
+        nt.assert_equal(data['num_pages'], 2)
+        nt.assert_equal(data['page'], 2)
+        # ordered by provider and path: osfstorage, osfstorage | s3
+        nt.assert_equal(len(data['provider_list']), 1)
+        nt.assert_equal(data['provider_list'][0]['provider'], 's3')
+        nt.assert_in('s3_test_file1.status_3', data['provider_list'][0]['error_list'][0]['file_path'])
+
+    def test_error_list_json_sort_and_filter(self):
+        url = '/timestampadd/{}/nodes/{}/error_list/?sort=file_path&order=desc'.format(
+            self.project_institution.id, self.private_project1.id)
+        view = self._error_list_view(views.TimestampErrorList(), url)
+        data = json.loads(view.get(view.request).content.decode())
+        # the provider is always the first sort key
+        nt.assert_equal([provider['provider'] for provider in data['provider_list']], ['osfstorage', 's3'])
+        nt.assert_in('osfstorage_test_file3.status_3', data['provider_list'][0]['error_list'][0]['file_path'])
+
+        url = '/timestampadd/{}/nodes/{}/error_list/?end_date=2000-01-01'.format(
+            self.project_institution.id, self.private_project1.id)
+        view = self._error_list_view(views.TimestampErrorList(), url)
+        data = json.loads(view.get(view.request).content.decode())
+        nt.assert_equal(data['count'], 0)
+        nt.assert_equal(data['provider_list'], [])
+
+    def test_error_list_csv(self):
+        url = '/timestampadd/{}/nodes/{}/error_list/csv/'.format(
+            self.project_institution.id, self.private_project1.id)
+        view = self._error_list_view(views.ExportErrorListCSV(), url)
+        res = view.get(view.request)
+        nt.assert_equal(res.status_code, 200)
+        content = b''.join(res.streaming_content).decode()
+        lines = content.splitlines()
+        nt.assert_equal(len(lines), 4)
+        nt.assert_true(lines[0].startswith('provider,file_id,file_path'))
+        nt.assert_not_in('osfstorage_test_file1.status_1', content)
+        nt.assert_in('s3_test_file1.status_3', lines[3])
+
 class TestTimestampVerifyData(AdminTestCase):
     def setUp(self):
         super(TestTimestampVerifyData, self).setUp()
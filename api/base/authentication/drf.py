@@ -34,11 +34,7 @@ def get_session_from_cookie(cookie_val):
         session_id = ensure_str(itsdangerous.Signer(settings.SECRET_KEY).unsign(cookie_val))
     except itsdangerous.BadSignature:
         return None
-    try:
-        session = Session.objects.get(_id=session_id)
-        return session
-    except Session.DoesNotExist:
-        return None
+    return Session.load(session_id)
 
 
 def check_user(user):
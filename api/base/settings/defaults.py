@@ -318,6 +318,25 @@ NPLUSONE_RAISE = False
 
 # Timestamp - number of requests to send to cloud storages per minute
 TS_REQUESTS_PER_MIN = 30
+# Timestamp - number of worker threads used by verify-all (download lane)
+TS_VERIFY_WORKERS = 4
+# Timestamp - number of worker threads used by verify-all (hash lane)
+TS_VERIFY_HASH_WORKERS = 4
+# Timestamp - seconds to wait for more file events before adding timestamps
+TS_PENDING_DELAY = 10
+# Timestamp - number of pending files processed by one task
+TS_PENDING_BATCH_SIZE = 100
+# Timestamp - seconds after which a file claimed by a (lost) task is processed again
+TS_PROCESSING_TIMEOUT = 600
+# Timestamp - files changed outside of GRDM in a folder from which the metadata
+# is fetched by listing the folder instead of per file
+TS_EXTERNAL_FOLDER_LISTING_MIN = 2
+# Timestamp - verify-all skips files not modified since their last successful verification
+TS_INCREMENTAL_VERIFY = True
+# Timestamp - providers whose files are changed only through WaterButler,
+# so the file inventory is kept up to date by file events and not crawled again
+# (the other providers are fully crawled by every verify-all)
+TS_INVENTORY_EVENT_PROVIDERS = ['osfstorage']
 
 # salt used for generating hashids
 HASHIDS_SALT = 'pinkhimalayan'
@@ -334,6 +353,8 @@ ELASTICSEARCH_METRICS_DATE_FORMAT = '%Y'
 
 WAFFLE_CACHE_NAME = 'waffle_cache'
 STORAGE_USAGE_CACHE_NAME = 'storage_usage'
+SEARCH_RESULT_CACHE_NAME = 'search_results'
+SESSION_CACHE_NAME = 'sessions'
 
 
 CACHES = {
@@ -347,6 +368,15 @@ CACHES = {
     WAFFLE_CACHE_NAME: {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     },
+    SEARCH_RESULT_CACHE_NAME: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': SEARCH_RESULT_CACHE_NAME,
+    },
+    # Override with a cache shared by all processes to enable website.settings.SESSION_CACHE_TIMEOUT
+    SESSION_CACHE_NAME: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': SESSION_CACHE_NAME,
+    },
 }
 
 SLOAN_ID_COOKIE_NAME = 'sloan_id'
@@ -451,6 +481,15 @@ SSL_GET_TIMESTAMP_HASH_RESPONSE = 'openssl ts -verify {digest_type} -digest {dig
 
 # openssl ts verify check value
 OPENSSL_VERIFY_RESULT_OK = 'OK'
+# How to create timestamp requests and verify timestamp tokens (not used for uPKI)
+#   'command': run the openssl command templates above
+#   'python': build and verify RFC 3161 messages in-process (website.util.rfc3161)
+TIMESTAMP_BACKEND_COMMAND = 'command'
+TIMESTAMP_BACKEND_PYTHON = 'python'
+TIMESTAMP_BACKEND = TIMESTAMP_BACKEND_COMMAND
+# Compute the digest for timestamp requests/verification by streaming files
+# from WaterButler instead of downloading them to a temporary directory
+TIMESTAMP_STREAMING_DIGEST = False
 # timestamp verify rootKey
 VERIFY_ROOT_CERTIFICATE = 'root_cert_verifycate.pem'
 # timestamp request const
@@ -491,9 +530,16 @@ TIME_STAMP_STORAGE_DISCONNECTED = 8
 TIME_STAMP_STORAGE_DISCONNECTED_MSG = 'Error: storage disconnected.'
 TIME_STAMP_STORAGE_NOT_ACCESSIBLE = 9
 TIME_STAMP_STORAGE_NOT_ACCESSIBLE_MSG = 'Error: storage service connection error occurred.'
+TIME_STAMP_TOKEN_PENDING = 10
+TIME_STAMP_TOKEN_PENDING_MSG = 'Pending: timestamp is being added.'
+# claimed by celery_add_pending_timestamps
+TIME_STAMP_TOKEN_PROCESSING = 11
+TIME_STAMP_TOKEN_PROCESSING_MSG = TIME_STAMP_TOKEN_PENDING_MSG
 
 # Quota settings
 DEFAULT_MAX_QUOTA = 100
+# users per aggregate query of website.util.quota.recalculate_used_quota_of_institution
+QUOTA_RECALCULATION_CHUNK_SIZE = 500
 WARNING_THRESHOLD = 0.9
 BASE_FOR_METRIC_PREFIX = 1000
 SIZE_UNIT_GB = BASE_FOR_METRIC_PREFIX ** 3
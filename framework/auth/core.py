@@ -2,7 +2,12 @@
 
 import datetime as dt
 
+import hashlib
+import hmac
 import logging
+import threading
+import time
+from collections import OrderedDict
 
 from django.utils import timezone
 from django.db.models import Q
@@ -104,7 +109,45 @@ def _get_current_user():
 
 
 # TODO: This should be a class method of User?
-def get_user(email=None, password=None, token=None, external_id_provider=None, external_id=None, eppn=None, log=True):
+_verified_passwords = OrderedDict()
+_verified_passwords_lock = threading.Lock()
+
+
+def _verified_password_key(user, password):
+    # The stored hash is part of the key, so that a change of the password
+    # invalidates the entries. Passwords are not kept in memory.
+    message = u'{}:{}:{}'.format(user.pk, user.password, password)
+    return hmac.new(settings.SECRET_KEY.encode('utf-8'), message.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def check_password_cached(user, password):
+    """Same as `user.check_password(password)`, but a successful check is
+    remembered for settings.BASIC_AUTH_CACHE_TIMEOUT seconds to skip bcrypt.
+    """
+    if settings.BASIC_AUTH_CACHE_TIMEOUT <= 0:
+        return user.check_password(password)
+    now = time.time()
+    key = _verified_password_key(user, password)
+    with _verified_passwords_lock:
+        expires = _verified_passwords.get(key)
+        if expires is not None:
+            if expires > now:
+                return True
+            del _verified_passwords[key]
+
+    if not user.check_password(password):
+        return False
+    # the hash may have been upgraded by check_password
+    key = _verified_password_key(user, password)
+    with _verified_passwords_lock:
+        _verified_passwords[key] = now + settings.BASIC_AUTH_CACHE_TIMEOUT
+        while len(_verified_passwords) > settings.BASIC_AUTH_CACHE_MAX_SIZE:
+            _verified_passwords.popitem(last=False)
+    return True
+
+
+def get_user(email=None, password=None, token=None, external_id_provider=None, external_id=None, eppn=None, log=True,
+             cache_password=False):
     """
     Get an instance of `User` matching the provided params.
 
@@ -121,6 +164,7 @@ def get_user(email=None, password=None, token=None, external_id_provider=None, e
     :param external_id: the external id
     :param eppn: eppn
     :param log: log error
+    :param cache_password: remember a successful password check for a while (see check_password_cached)
     :rtype User or None
     """
     from osf.models import OSFUser, Email
@@ -145,7 +189,7 @@ def get_user(email=None, password=None, token=None, external_id_provider=None, e
             if log:
                 logger.error(err)
             user = None
-        if user and not user.check_password(password):
+        if user and not (check_password_cached(user, password) if cache_password else user.check_password(password)):
             return False
         return user
 
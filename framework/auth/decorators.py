@@ -67,7 +67,8 @@ def must_be_confirmed(func):
 MAPCORE_SYNC_IGNORE_ERROR = True
 
 # for GakuNin mAP Core (API v2)
-# If node is not None, mapcore_sync_rdm_project_or_map_group() is called.
+# If node is not None, mapcore_sync_rdm_project_or_map_group() is called
+# (or enqueued if settings.MAPCORE_SYNC_IN_BACKGROUND).
 def mapcore_check_token(auth, node, use_mapcore=True):
     from nii.mapcore_api import MAPCoreTokenExpired
     from nii.mapcore import (mapcore_sync_is_enabled,
@@ -75,7 +76,9 @@ def mapcore_check_token(auth, node, use_mapcore=True):
                              mapcore_log_error,
                              mapcore_url_is_my_projects,
                              mapcore_sync_rdm_my_projects,
-                             mapcore_sync_rdm_project_or_map_group)
+                             mapcore_sync_rdm_project_or_map_group,
+                             mapcore_request_sync_rdm_my_projects,
+                             mapcore_request_sync_rdm_project_or_map_group)
 
     # from framework import status
     # msg = 'test mapcore message'
@@ -86,7 +89,14 @@ def mapcore_check_token(auth, node, use_mapcore=True):
         node_page = False
         try:
             try:
-                if mapcore_url_is_my_projects(request.url):
+                if settings.MAPCORE_SYNC_IN_BACKGROUND:
+                    # check my token only, and read the last synchronized state
+                    mapcore_api_is_available(auth.user)
+                    if mapcore_url_is_my_projects(request.url):
+                        mapcore_request_sync_rdm_my_projects(auth.user)
+                    elif node:
+                        mapcore_request_sync_rdm_project_or_map_group(auth.user, node)
+                elif mapcore_url_is_my_projects(request.url):
                     # include MAPCore.get_my_groups() to check my token
                     mapcore_sync_rdm_my_projects(auth.user, use_raise=True)
                 elif node:
@@ -11,6 +11,8 @@ def match_by_module(task_path):
             return CeleryConfig.task_med_queue
         if task_subpath in CeleryConfig.high_pri_modules:
             return CeleryConfig.task_low_queue
+        if task_subpath in CeleryConfig.timestamp_modules:
+            return CeleryConfig.task_timestamp_queue
     return CeleryConfig.task_default_queue
 
 
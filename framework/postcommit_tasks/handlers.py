@@ -13,6 +13,7 @@ from celery.local import PromiseProxy
 from gevent.pool import Pool
 from flask import _app_ctx_stack as context_stack
 
+from api.base.api_globals import api_globals
 from website import settings
 
 _local = threading.local()
@@ -28,14 +29,32 @@ def postcommit_celery_queue():
         _local.postcommit_celery_queue = OrderedDict()
     return _local.postcommit_celery_queue
 
+def postcommit_buffer_discards():
+    if not hasattr(_local, 'postcommit_buffer_discards'):
+        _local.postcommit_buffer_discards = OrderedDict()
+    return _local.postcommit_buffer_discards
+
+def discard_postcommit_buffers():
+    """Passes the entries left in the buffers of the request (not flushed) to their discard functions."""
+    discards = postcommit_buffer_discards()
+    _local.postcommit_buffer_discards = OrderedDict()
+    for discard, buffer in discards.values():
+        if buffer:
+            try:
+                discard(buffer)
+            except Exception as ex:
+                logger.exception('Failed to discard post commit buffer: {}'.format(ex))
+
 def postcommit_before_request():
     _local.postcommit_queue = OrderedDict()
     _local.postcommit_celery_queue = OrderedDict()
+    _local.postcommit_buffer_discards = OrderedDict()
 
 def postcommit_after_request(response, base_status_error_code=500):
     if response.status_code >= base_status_error_code:
         _local.postcommit_queue = OrderedDict()
         _local.postcommit_celery_queue = OrderedDict()
+        discard_postcommit_buffers()
         return response
     try:
         if postcommit_queue():
@@ -57,6 +76,8 @@ def postcommit_after_request(response, base_status_error_code=500):
     except AttributeError as ex:
         if not settings.DEBUG_MODE:
             logger.error('Post commit task queue not initialized: {}'.format(ex))
+    finally:
+        discard_postcommit_buffers()
     return response
 
 def get_task_from_postcommit_queue(name, predicate, celery=True):
@@ -91,6 +112,31 @@ def enqueue_postcommit_task(fn, args, kwargs, celery=False, once_per_request=Tru
         else:
             postcommit_queue().update({key: functools.partial(fn, *args, **kwargs)})
 
+def get_postcommit_buffer(fn, discard=None):
+    """
+    Returns a dict that is passed to fn once after the request's transaction has been committed,
+    so that the work of a request can be coalesced (e.g. keyed by object id) into one call.
+    fn should remove the entries it has processed; the entries left (e.g. the request failed,
+    fn raised or timed out) are passed to discard at the end of the request.
+    Returns None if fn can not be delayed (outside of a request, in unit tests or local dev).
+    """
+    if settings.DEBUG_MODE:
+        return None
+    if context_stack.top is None:
+        if getattr(api_globals, 'request', None) is None:
+            return None
+    elif context_stack.top.app.testing:
+        return None
+
+    key = '{}.{}:buffer'.format(fn.__module__, fn.__name__)
+    task = postcommit_queue().get(key)
+    if task is None:
+        task = functools.partial(fn, OrderedDict())
+        postcommit_queue()[key] = task
+        if discard is not None:
+            postcommit_buffer_discards()[key] = (discard, task.args[0])
+    return task.args[0]
+
 handlers = {
     'before_request': postcommit_before_request,
     'after_request': postcommit_after_request,
@@ -130,7 +130,8 @@ def before_request():
     if request.authorization:
         user = get_user(
             email=request.authorization.username,
-            password=request.authorization.password
+            password=request.authorization.password,
+            cache_password=True
         )
         # Create an empty session
         # TODO: Shoudn't need to create a session for Basic Auth
@@ -164,7 +165,8 @@ def before_request():
             return
         if not throttle_period_expired(user_session.created, settings.OSF_SESSION_TIMEOUT):
             # Update date last login when making non-api requests
-            if user_session.data.get('auth_user_id') and 'api' not in request.url:
+            if user_session.data.get('auth_user_id') and 'api' not in request.url and \
+                    not last_login_recently_updated(user_session.data['auth_user_id']):
                 OSFUser = apps.get_model('osf.OSFUser')
                 (
                     OSFUser.objects
@@ -177,6 +179,18 @@ def before_request():
             remove_session(user_session)
 
 
+def last_login_recently_updated(user_id):
+    """Throttle the updates of date_last_login by the cache of sessions (if enabled)
+    instead of an UPDATE query on every request."""
+    from osf.models.session import session_cache
+
+    cache = session_cache()
+    if cache is None:
+        return False
+    key = 'date_last_login:{}'.format(user_id)
+    return not cache.add(key, True, settings.DATE_LAST_LOGIN_THROTTLE_DELTA.total_seconds())
+
+
 def after_request(response):
     # Disallow embedding in frames
     response.headers['X-Frame-Options'] = 'SAMEORIGIN'
@@ -16,7 +16,8 @@ from pprint import pformat as pp
 from urllib.parse import urlparse
 
 from django.utils import timezone
-from django.db import transaction
+from django.db import connection, transaction
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
 
 logger = logging.getLogger(__name__)
@@ -33,6 +34,9 @@ from osf.models.node import Node
 from osf.models.mapcore import MAPSync, MAPProfile
 from osf.models.nodelog import NodeLog
 from framework.auth import Auth
+from framework.celery_tasks import app as celery_app
+from framework.celery_tasks.handlers import enqueue_task
+from website import settings
 from website.util import web_url_for
 from website.settings import (MAPCORE_HOSTNAME,
                               MAPCORE_AUTHCODE_PATH,
@@ -130,65 +134,57 @@ def mapcore_log_error(msg):
 # lock node or user
 #
 class MAPCoreLocker():
+    '''
+    Lock a user or a node by PostgreSQL advisory locks (session level).
+
+    Waiting processes are blocked until the lock is released (without polling),
+    and the locks are released by PostgreSQL when the DB connection of a
+    crashed process is closed.  The same process can lock the same object
+    again (unlock the same number of times).
+    '''
+    # classid of pg_advisory_lock(classid, objid)
+    NAMESPACE_USER = 0x4d415001
+    NAMESPACE_NODE = 0x4d415002
+
+    def _lock(self, namespace, obj_id):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_lock(%s, %s)', [namespace, obj_id])
+
+    def _unlock(self, namespace, obj_id):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(%s, %s)', [namespace, obj_id])
+            unlocked = cursor.fetchone()[0]
+        if not unlocked:
+            # the DB connection was closed and the lock was released already
+            logger.warning('MAPCoreLocker: lock({}, {}) is not held'.format(namespace, obj_id))
+
     def lock_user(self, user):
-        while True:
-            #print('before transaction.atomic')
-            with transaction.atomic():
-                #print('transaction.atomic start')
-                u = OSFUser.objects.select_for_update().get(username=user.username)
-                if not u.mapcore_api_locked:
-                    #print('before lock')
-                    #time.sleep(5) # for debug
-                    u.mapcore_api_locked = True
-                    u.save()
-                    logger.debug('OSFUser(' + u.username + ').mapcore_api_locked=True')
-                    return
-            #print('cannot get lock, sleep 1')
-            time.sleep(1)
+        self._lock(self.NAMESPACE_USER, user.id)
+        logger.debug('OSFUser(' + user.username + ') is locked')
 
     def unlock_user(self, user):
-        with transaction.atomic():
-            u = OSFUser.objects.select_for_update().get(username=user.username)
-            u.mapcore_api_locked = False
-            u.save()
-            logger.debug('OSFUser(' + u.username + ').mapcore_api_locked=False')
+        self._unlock(self.NAMESPACE_USER, user.id)
+        logger.debug('OSFUser(' + user.username + ') is unlocked')
 
     def lock_node(self, node):
-        while True:
-            with transaction.atomic():
-                #print('transaction.atomic start')
-                n = Node.objects.select_for_update().get(guids___id=node._id)
-                if not n.mapcore_api_locked:
-                    n.mapcore_api_locked = True
-                    n.save()
-                    logger.debug('Node(' + n._id + ').mapcore_api_locked=True')
-                    return
-            #print('cannot get lock, sleep 1')
-            time.sleep(1)
+        self._lock(self.NAMESPACE_NODE, node.id)
+        logger.debug('Node(' + node._id + ') is locked')
 
     def unlock_node(self, node):
-        with transaction.atomic():
-            n = Node.objects.select_for_update().get(guids___id=node._id)
-            #print('n.mapcore_api_locked={}'.format(n.mapcore_api_locked))
-            n.mapcore_api_locked = False
-            n.save()
-            logger.debug('Node(' + n._id + ').mapcore_api_locked=False')
+        self._unlock(self.NAMESPACE_NODE, node.id)
+        logger.debug('Node(' + node._id + ') is unlocked')
 
 locker = MAPCoreLocker()
 
 def mapcore_unlock_all():
+    '''
+    Clear the lock flags (mapcore_api_locked) left by older versions.
+    The advisory locks of MAPCoreLocker do not need to be cleared.
+    '''
     logger.info('mapcore_unlock_all() start')
-    with transaction.atomic():
-        for user in OSFUser.objects.all():
-            if user.mapcore_api_locked:
-                user.mapcore_api_locked = False
-                user.save()
-                logger.info('mapcore_unlock_all(): unlocked: User={}'.format(user.username))
-        for node in Node.objects.all():
-            if node.mapcore_api_locked:
-                node.mapcore_api_locked = False
-                node.save()
-                logger.info('mapcore_unlock_all(): unlocked: Node={}'.format(node._id))
+    n_users = OSFUser.objects.filter(mapcore_api_locked=True).update(mapcore_api_locked=False)
+    n_nodes = Node.objects.filter(mapcore_api_locked=True).update(mapcore_api_locked=False)
+    logger.info('mapcore_unlock_all(): unlocked: {} users, {} nodes'.format(n_users, n_nodes))
     logger.info('mapcore_unlock_all() done')
 
 def mapcore_request_authcode(user, params):
@@ -980,7 +976,7 @@ def mapcore_url_is_my_projects(request_url):
             return True
     return False
 
-def mapcore_sync_rdm_my_projects0(user):
+def mapcore_sync_rdm_my_projects0(user, dry_run=False):
     '''
     自分が所属しているRDMプロジェクトとmAPグループを比較する。
 
@@ -1009,96 +1005,24 @@ def mapcore_sync_rdm_my_projects0(user):
           プロジェクトをis_deleted=Trueにする
 
     :param user: OSFUser
-    :return: なし。エラー時には例外投げる
+    :param dry_run: True ... 比較結果を返すだけで反映しない
+    :return: mapcore_diff_my_projects()の比較結果。エラー時には例外投げる
 
     '''
 
     logger.debug('starting mapcore_sync_rdm_my_projects(\'' + user.eppn + '\').')
 
+    if dry_run:
+        mapcore = MAPCore(user)
+        return mapcore_diff_my_projects(user, mapcore.get_my_groups()['result']['groups'])
+
     try:
         locker.lock_user(user)
 
-        my_rdm_projects = {}
-        sync_id_list = []
-        for project in Node.objects.filter(contributor__user__id=user.id):
-            if project.map_group_key:
-                my_rdm_projects[project.map_group_key] = project
-            # if project.map_group_key is None:
-            # ... This project will be synchronized in _view_project()
-
         mapcore = MAPCore(user)
         result = mapcore.get_my_groups()
-        my_map_groups = {}
-        for grp in result['result']['groups']:
-            group_key = grp['group_key']
-            my_map_groups[group_key] = grp
-
-            if not grp['active'] or not grp['public']:
-                logger.warning('mAP group [' + grp['group_name'] + '] has unsuitable attribute(s). (ignored)')
-                continue
-            if mapcore_group_member_is_private(grp):
-                logger.warning('mAP group( {} ) member list is private. (skipped)'.format(grp['group_name']))
-                continue
-            logger.debug('mAP group [' + grp['group_name'] + '] (' + grp['group_key'] + ') is a candidate to Sync.')
-
-            project_exists = False
-            try:
-                node = Node.objects.get(map_group_key=group_key)
-                project_exists = True
-                # exists in RDM and mAP
-            except ObjectDoesNotExist:
-                # exists only in mAP -> create new Node in RDM
-                try:
-                    node = mapcore_create_new_node_from_mapgroup(mapcore, grp)
-                    if node is None:
-                        logger.error('cannot create GRDM project for mAP group [' + grp['group_name'] + '].  skip.')
-                        continue
-                    #logger.info('New node is created from mAP group [' + grp['group_name'] + '] (' + group_key + ')')
-                    # copy info and members to RDM
-                    mapcore_sync_rdm_project(user, node,
-                                             title_desc=True,
-                                             contributors=True,
-                                             use_raise=True)
-                except MAPCoreException as e:
-                    if e.group_does_not_exist():
-                        # This group is not linked to this RDM SP.
-                        # Other SPs may have the group.
-                        del my_map_groups[group_key]
-                        logger.info('mAP group({}, group_key={}) exists but it is not linked to this GRDM service provider.'.format(grp['group_name'], group_key))
-                    else:
-                        logger.debug('MAPCoreException: {}'.format(utf8(str(e))))
-                        raise
-
-            if project_exists and not node.is_deleted:
-                # different contributors or title
-                if my_rdm_projects.get(group_key) is None:
-                    logger.debug('different contributors: group_key={}'.format(node.map_group_key))
-                    mapcore_sync_rdm_project_or_map_group(user, node)
-                    sync_id_list.append(node._id)
-                elif node.title != utf8dec(grp['group_name']):
-                    #logger.debug('node.title={}, grp[group_name]={}'.format(utf8(node.title), grp['group_name']))
-                    logger.debug('different title: group_key={}'.format(node.map_group_key))
-                    mapcore_sync_rdm_project_or_map_group(user, node)
-                    sync_id_list.append(node._id)
-
-        for group_key, project in my_rdm_projects.items():
-            if project.is_deleted:
-                #logger.info('GRDM project [{} ({})] was deleted. (skipped)'.format(utf8(project.title), project._id))
-                continue
-            if project._id in sync_id_list:
-                continue
-
-            grp = my_map_groups.get(group_key)
-            if grp:
-                if project.title == utf8dec(grp['group_name']):
-                    # already synchronized project
-                    continue
-                else:
-                    logger.debug('different title')
-                    mapcore_sync_rdm_project_or_map_group(user, project)
-            else:
-                # Project contributors is different from mAP group members.
-                mapcore_sync_rdm_project_or_map_group(user, project)
+        changes = mapcore_diff_my_projects(user, result['result']['groups'])
+        mapcore_apply_my_projects_changes(user, mapcore, changes)
 
         ### to create new mAP groups at /myprojects/
         # for project in Node.objects.filter(contributor__user__id=user.id):
@@ -1109,15 +1033,112 @@ def mapcore_sync_rdm_my_projects0(user):
         locker.unlock_user(user)
 
     logger.debug('mapcore_sync_rdm_my_projects finished.')
+    return changes
 
-def mapcore_sync_rdm_my_projects(user, use_raise=False):
+def mapcore_sync_rdm_my_projects(user, use_raise=False, dry_run=False):
     try:
-        mapcore_sync_rdm_my_projects0(user)
+        return mapcore_sync_rdm_my_projects0(user, dry_run=dry_run)
     except Exception as e:
         logger.error('User(username={}, eppn={}) cannot compare my GRDM Projects and my mAP groups, reason={}'.format(user.username, user.eppn, utf8(str(e))))
         if use_raise:
             raise
 
+# actions of mapcore_diff_my_projects()
+MAPCORE_CREATE_PROJECT = 'create'  # exists only in mAP -> create new Node in RDM
+MAPCORE_SYNC_PROJECT = 'sync'  # different contributors or title
+
+def mapcore_diff_my_projects(user, my_map_groups):
+    '''
+    Compare my GRDM projects and my mAP groups as sets of group_key.
+
+    All projects of the group_keys are fetched by one query, and the
+    projects which need synchronization are listed.
+    (GRDM projects without group_key are synchronized in _view_project().)
+
+    :param user: OSFUser
+    :param my_map_groups: list of groups by MAPCore.get_my_groups()
+    :return: list of (action, group_key, node, grp, reason) sorted by group_key
+    '''
+    map_groups = {grp['group_key']: grp for grp in my_map_groups}
+    my_group_keys = set(Node.objects.filter(contributor__user__id=user.id,
+                                            map_group_key__isnull=False)
+                        .values_list('map_group_key', flat=True))
+    nodes = {node.map_group_key: node for node in
+             Node.objects.filter(map_group_key__in=set(map_groups) | my_group_keys)}
+
+    changes = []
+    for group_key in sorted(set(map_groups) | my_group_keys):
+        grp = map_groups.get(group_key)
+        node = nodes.get(group_key)
+        is_mine = group_key in my_group_keys
+
+        if grp is not None:
+            suitable = True
+            if not grp['active'] or not grp['public']:
+                logger.warning('mAP group [' + grp['group_name'] + '] has unsuitable attribute(s). (ignored)')
+                suitable = False
+            elif mapcore_group_member_is_private(grp):
+                logger.warning('mAP group( {} ) member list is private. (skipped)'.format(grp['group_name']))
+                suitable = False
+            if not suitable and not is_mine:
+                continue
+            if suitable:
+                logger.debug('mAP group [' + grp['group_name'] + '] (' + group_key + ') is a candidate to Sync.')
+
+        if node is None:
+            # exists only in mAP
+            changes.append((MAPCORE_CREATE_PROJECT, group_key, None, grp, 'new mAP group'))
+        elif node.is_deleted:
+            continue
+        elif not is_mine:
+            # exists in RDM and mAP, but I am not a contributor
+            changes.append((MAPCORE_SYNC_PROJECT, group_key, node, grp, 'different contributors'))
+        elif grp is None:
+            # Project contributors is different from mAP group members.
+            changes.append((MAPCORE_SYNC_PROJECT, group_key, node, grp, 'not a member of mAP group'))
+        elif node.title != utf8dec(grp['group_name']):
+            changes.append((MAPCORE_SYNC_PROJECT, group_key, node, grp, 'different title'))
+        # else: already synchronized project
+
+    for action, group_key, node, grp, reason in changes:
+        logger.debug('mapcore_diff_my_projects: {}: group_key={} ({})'.format(action, group_key, reason))
+    return changes
+
+def mapcore_apply_my_projects_changes(user, mapcore, changes):
+    '''
+    Apply the changes by mapcore_diff_my_projects() one by one.
+    '''
+    for action, group_key, node, grp, reason in changes:
+        if action == MAPCORE_SYNC_PROJECT:
+            mapcore_sync_rdm_project_or_map_group(user, node)
+            continue
+        try:
+            node = mapcore_create_new_node_from_mapgroup(mapcore, grp)
+            if node is None:
+                logger.error('cannot create GRDM project for mAP group [' + grp['group_name'] + '].  skip.')
+                continue
+            # copy info and members to RDM
+            mapcore_sync_rdm_project(user, node,
+                                     title_desc=True,
+                                     contributors=True,
+                                     use_raise=True)
+        except MAPCoreException as e:
+            if e.group_does_not_exist():
+                # This group is not linked to this RDM SP.
+                # Other SPs may have the group.
+                logger.info('mAP group({}, group_key={}) exists but it is not linked to this GRDM service provider.'.format(grp['group_name'], group_key))
+            else:
+                logger.debug('MAPCoreException: {}'.format(utf8(str(e))))
+                raise
+
+def mapcore_report_my_projects_changes(changes):
+    lines = []
+    for action, group_key, node, grp, reason in changes:
+        title = node.title if node else utf8dec(grp['group_name'])
+        guid = node._id if node else '-'
+        lines.append(u'{}\t{}\t{}\t{}\t{}'.format(action, group_key, guid, reason, title))
+    return lines
+
 
 def mapcore_set_standby_to_upload(node, log=True):
     with transaction.atomic():
@@ -1166,10 +1187,10 @@ def mapcore_set_sync_time(node):
         logger.error('mapcore_set_sync_time: {}'.format(utf8(str(e))))
         # ignore
 
-def mapcore_is_sync_time_expired(node):
+def mapcore_is_sync_time_expired(node, seconds=SYNC_CACHE_TIME):
     if node.mapcore_sync_time is None:
         return True
-    if timezone.now() >= node.mapcore_sync_time + datetime.timedelta(seconds=SYNC_CACHE_TIME):
+    if timezone.now() >= node.mapcore_sync_time + datetime.timedelta(seconds=seconds):
         logger.debug('mapcore_is_sync_time_expired: need sync')
         return True
     else:
@@ -1210,6 +1231,71 @@ def mapcore_sync_rdm_project_or_map_group(access_user, node, use_raise=False):
     finally:
         locker.unlock_node(node)
 
+#
+# synchronization in background (settings.MAPCORE_SYNC_IN_BACKGROUND)
+#
+
+def mapcore_set_user_sync_time(user):
+    user.mapcore_sync_time = timezone.now()
+    OSFUser.objects.filter(id=user.id).update(mapcore_sync_time=user.mapcore_sync_time)
+
+def _mapcore_sync_is_queued(key):
+    # avoid enqueuing the same synchronization for every page load
+    # until the task updates the sync time
+    return not cache.add('mapcore_sync_queued:{}'.format(key), True,
+                         settings.MAPCORE_SYNC_FRESHNESS)
+
+def mapcore_request_sync_rdm_my_projects(user):
+    '''
+    Enqueue the synchronization of my projects unless it is fresh.
+    :return: True if enqueued
+    '''
+    if not mapcore_is_sync_time_expired(user, seconds=settings.MAPCORE_SYNC_FRESHNESS):
+        return False
+    if _mapcore_sync_is_queued('user:{}'.format(user._id)):
+        return False
+    enqueue_task(mapcore_sync_rdm_my_projects_task.s(user._id))
+    return True
+
+def mapcore_request_sync_rdm_project_or_map_group(user, node):
+    '''
+    Enqueue the synchronization of the project unless it is fresh.
+    :return: True if enqueued
+    '''
+    if node.is_deleted:
+        return False
+    if not mapcore_is_sync_time_expired(node, seconds=settings.MAPCORE_SYNC_FRESHNESS):
+        return False
+    if _mapcore_sync_is_queued('node:{}'.format(node._id)):
+        return False
+    enqueue_task(mapcore_sync_rdm_project_or_map_group_task.s(user._id, node._id))
+    return True
+
+@celery_app.task(ignore_result=True, name='nii.mapcore.sync_rdm_my_projects')
+def mapcore_sync_rdm_my_projects_task(user_id):
+    user = OSFUser.load(user_id)
+    if user is None:
+        return
+    # the user is redirected to /mapcore_oauth_start by the next page load
+    # if the token has expired
+    try:
+        mapcore_sync_rdm_my_projects(user, use_raise=True)
+    except Exception as e:
+        logger.error('User(username={}) cannot be synchronized with mAP groups, reason={}'.format(user.username, utf8(str(e))))
+        return
+    mapcore_set_user_sync_time(user)
+
+@celery_app.task(ignore_result=True, name='nii.mapcore.sync_rdm_project_or_map_group')
+def mapcore_sync_rdm_project_or_map_group_task(user_id, node_id):
+    user = OSFUser.load(user_id)
+    node = Node.load(node_id)
+    if user is None or node is None:
+        return
+    try:
+        mapcore_sync_rdm_project_or_map_group(user, node)
+    except Exception as e:
+        logger.error('Node(guid={}) cannot be synchronized with mAP group, reason={}'.format(node._id, utf8(str(e))))
+
 #
 # debugging utilities
 #
@@ -0,0 +1,112 @@
+import datetime
+import logging
+import os
+
+from django.core.management.base import BaseCommand
+from osf.models import OSFUser, UserQuota
+from website.util import quota
+
+logger = logging.getLogger(__name__)
+
+STORAGE_TYPES = {
+    'nii': UserQuota.NII_STORAGE,
+    'custom': UserQuota.CUSTOM_STORAGE,
+}
+
+def read_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return int(f.read().strip() or 0)
+
+def write_checkpoint(path, last_user_id):
+    if not path:
+        return
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(str(last_user_id))
+    os.rename(tmp_path, path)
+
+def reconcile_all_used_quota(storage_types, batch_size=500, start_after=0,
+                             checkpoint=None, dry_run=False):
+    """Reconcile the used quota of all users, batch_size users at a time.
+
+    The id of the last processed user is saved to the checkpoint file after
+    each batch, so an interrupted run can be resumed.
+    Returns (users, drifted users, total drift in bytes).
+    """
+    users = drifted = drift_bytes = 0
+    last_user_id = start_after
+    while True:
+        user_ids = list(OSFUser.objects.filter(
+            deleted__isnull=True, id__gt=last_user_id
+        ).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not user_ids:
+            break
+        for storage_type in storage_types:
+            for user_id, stored, used in quota.reconcile_used_quota(
+                    user_ids, storage_type, dry_run=dry_run):
+                logger.info('Drift: user_id={}, storage_type={}, stored={}, calculated={}'.format(
+                    user_id, storage_type, stored, used))
+                drifted += 1
+                drift_bytes += abs(used - stored)
+        users += len(user_ids)
+        last_user_id = user_ids[-1]
+        if not dry_run:
+            write_checkpoint(checkpoint, last_user_id)
+        logger.info('{} users processed (last user id: {})'.format(users, last_user_id))
+    return users, drifted, drift_bytes
+
+class Command(BaseCommand):
+    help = '''Recalculates the used quota of users and fixes the values maintained
+    incrementally by website.util.quota, reporting the drift.'''
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry_run',
+            action='store_true',
+            help='Report the drift without fixing it',
+        )
+        parser.add_argument(
+            '--batch_size',
+            type=int,
+            default=500,
+            help='How many users to recalculate at a time',
+        )
+        parser.add_argument(
+            '--storage_type',
+            choices=list(STORAGE_TYPES.keys()),
+            help='Storage type to recalculate (default: all)',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            type=str,
+            help='File to save the progress to, and to resume from',
+        )
+
+    def handle(self, *args, **options):
+        script_start_time = datetime.datetime.now()
+        logger.info('Script started time: {}'.format(script_start_time))
+
+        dry_run = options['dry_run']
+        if dry_run:
+            logger.info('DRY RUN')
+        if options['storage_type']:
+            storage_types = [STORAGE_TYPES[options['storage_type']]]
+        else:
+            storage_types = list(STORAGE_TYPES.values())
+        start_after = read_checkpoint(options['checkpoint'])
+        if start_after:
+            logger.info('Resuming after user id {}'.format(start_after))
+
+        users, drifted, drift_bytes = reconcile_all_used_quota(
+            storage_types, options['batch_size'], start_after,
+            options['checkpoint'], dry_run)
+        logger.info('{} users, {} drifted quotas, {} bytes of drift'.format(
+            users, drifted, drift_bytes))
+        if options['checkpoint'] and not dry_run and os.path.exists(options['checkpoint']):
+            os.remove(options['checkpoint'])
+
+        script_finish_time = datetime.datetime.now()
+        logger.info('Script finished time: {}'.format(script_finish_time))
+        logger.info('Run time {}'.format(script_finish_time - script_start_time))
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django_extensions.db.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osf', '0223_ensure_schema_and_reports'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimestampFileInventory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('provider', models.CharField(max_length=25)),
+                ('path', models.TextField()),
+                ('materialized_path', models.TextField()),
+                ('file_id', models.CharField(max_length=24)),
+                ('size', models.BigIntegerField(blank=True, null=True)),
+                ('created_utc', models.CharField(blank=True, max_length=64, null=True)),
+                ('modified_utc', models.CharField(blank=True, max_length=64, null=True)),
+                ('etag', models.CharField(blank=True, max_length=255, null=True)),
+                ('version', models.CharField(blank=True, max_length=64, null=True)),
+                ('signature', models.TextField()),
+                ('verified_signature', models.TextField(blank=True, null=True)),
+                ('node', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timestamp_file_inventory', to='osf.AbstractNode')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='timestampfileinventory',
+            unique_together=set([('node', 'provider', 'path')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='timestampfileinventory',
+            index_together=set([('node', 'provider')]),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django_extensions.db.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osf', '0224_timestampfileinventory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NodeQuotaUsage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', django_extensions.db.fields.CreationDateTimeField(auto_now_add=True, verbose_name='created')),
+                ('modified', django_extensions.db.fields.ModificationDateTimeField(auto_now=True, verbose_name='modified')),
+                ('used', models.BigIntegerField(default=0)),
+                ('node', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='osf.AbstractNode')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osf', '0226_osfuser_mapcore_sync_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='basefilenode',
+            name='earliest_version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='osf.FileVersion'),
+        ),
+        migrations.AddField(
+            model_name='basefilenode',
+            name='latest_version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='osf.FileVersion'),
+        ),
+        migrations.RunSQL(
+            [
+                """
+                UPDATE osf_basefilenode AS F
+                SET latest_version_id = (
+                    SELECT V.id FROM osf_fileversion AS V
+                    JOIN osf_basefileversionsthrough AS T ON V.id = T.fileversion_id
+                    WHERE T.basefilenode_id = F.id
+                    ORDER BY V.created DESC, V.id DESC
+                    LIMIT 1
+                ), earliest_version_id = (
+                    SELECT V.id FROM osf_fileversion AS V
+                    JOIN osf_basefileversionsthrough AS T ON V.id = T.fileversion_id
+                    WHERE T.basefilenode_id = F.id
+                    ORDER BY V.created ASC, V.id ASC
+                    LIMIT 1
+                )
+                WHERE EXISTS (
+                    SELECT 1 FROM osf_basefileversionsthrough AS T
+                    WHERE T.basefilenode_id = F.id
+                );
+                """
+            ],
+            migrations.RunSQL.noop
+        ),
+    ]
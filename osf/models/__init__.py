@@ -59,8 +59,10 @@ from osf.models.rdm_file_timestamptoken_verify_result import RdmFileTimestamptok
 from osf.models.rdm_user_key import RdmUserKey  # noqa
 from osf.models.rdm_timestamp_grant_pattern import RdmTimestampGrantPattern  # noqa
 from osf.models.timestamp_task import TimestampTask  # noqa
+from osf.models.timestamp_file_inventory import TimestampFileInventory  # noqa
 from osf.models.fileinfo import FileInfo  # noqa
 from osf.models.user_quota import UserQuota  # noqa
 from osf.models.project_storage_type import ProjectStorageType  # noqa
+from osf.models.node_quota_usage import NodeQuotaUsage  # noqa
 from osf.models.region_external_account import RegionExternalAccount  # noqa
 from osf.models.institution_entitlement import InstitutionEntitlement  # noqa
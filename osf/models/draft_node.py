@@ -31,7 +31,7 @@ class DraftNode(AbstractNode):
         raise NodeStateError('A DraftNode may not be forked, used as a template, or registered.')
 
     # Overrides AbstractNode.update_search
-    def update_search(self):
+    def update_search(self, wiki_page=None, saved_fields=None):
         """
         In the off-chance a DraftNode gets turned public, ensure it doesn't get sent to search
         """
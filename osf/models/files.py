@@ -7,7 +7,9 @@ import requests
 from dateutil.parser import parse as parse_date
 from django.apps import apps
 from django.db import models, IntegrityError
-from django.db.models import Manager
+from django.db.models import Case, F, Manager, Value, When
+from django.db.models.functions import Concat, Substr
+from django.db.models.expressions import RawSQL
 from django.core.exceptions import ObjectDoesNotExist
 from django.utils import timezone
 from django.contrib.contenttypes.models import ContentType
@@ -49,6 +51,81 @@ class BaseFileNodeManager(TypedModelManager, IncludeManager):
             return qs.filter(provider=self.model._provider)
         return qs
 
+    DESCENDANTS_QUERY = """
+        WITH RECURSIVE descendants AS (
+            SELECT id FROM osf_basefilenode WHERE parent_id = %s
+            UNION ALL
+            SELECT child.id FROM osf_basefilenode AS child
+                JOIN descendants ON child.parent_id = descendants.id
+        ) SELECT id FROM descendants
+    """
+
+    def get_descendants(self, root, include_root=False):
+        """Returns all file nodes under `root` (at any depth) by one recursive query."""
+        query = models.Q(id__in=RawSQL(self.DESCENDANTS_QUERY, [root.pk]))
+        if include_root:
+            query |= models.Q(id=root.pk)
+        return self.filter(query)
+
+    def _subtree(self, target, provider, path):
+        queryset = self.filter(
+            target_object_id=target.id,
+            target_content_type=ContentType.objects.get_for_model(target),
+            provider=provider,
+            deleted_on=None,
+        )
+        # Nodes created by get_or_create have no _materialized_path, so
+        # match on either path.
+        if path.endswith('/'):
+            return queryset.filter(models.Q(_path__startswith=path) |
+                                   models.Q(_materialized_path__startswith=path))
+        return queryset.filter(models.Q(_path=path) | models.Q(_materialized_path=path))
+
+    def move_subtree(self, target, provider, src_path, dest_path):
+        """Move the active file nodes at (or under, for a folder) the path
+        `src_path` to `dest_path` by UPDATE statements.
+
+        The prefixes of `_path` and `_materialized_path` are rewritten where
+        they are `src_path`, as for the providers whose paths are
+        materialized paths.
+        Returns the number of moved file nodes.
+        """
+        subtree = self.filter(id__in=list(
+            self._subtree(target, provider, src_path).values_list('id', flat=True)))
+
+        def replace_prefix(field):
+            return Concat(Value(dest_path), Substr(field, len(src_path) + 1),
+                          output_field=models.TextField())
+        subtree.filter(_path__startswith=src_path).update(_path=replace_prefix('_path'))
+        subtree.filter(_materialized_path__startswith=src_path).update(
+            _materialized_path=replace_prefix('_materialized_path'))
+        return subtree.count()
+
+    def trash_subtree(self, target, provider, path, user):
+        """Trash the active file nodes at (or under, for a folder) the path
+        `path` by one UPDATE statement.
+
+        Returns the ids of the trashed files.
+        """
+        subtree = self._subtree(target, provider, path)
+        file_type = 'osf.{}file'.format(provider)
+        file_ids = list(subtree.filter(type=file_type).values_list('id', flat=True))
+        now = timezone.now()
+        subtree.update(
+            type=Case(
+                When(type=file_type, then=Value('osf.trashedfile')),
+                When(type='osf.{}folder'.format(provider), then=Value('osf.trashedfolder')),
+                default=F('type'),
+                output_field=models.CharField()
+            ),
+            deleted=now,
+            deleted_on=now,
+            deleted_by=user,
+            # update() skips auto_now; the change is seen by modified__gte queries
+            modified=now,
+        )
+        return file_ids
+
 class ActiveFileNodeManager(Manager):
     """Manager that filters out TrashedFileNodes.
     Note: We do not use this as the default manager for BaseFileNode because
@@ -90,6 +167,10 @@ class BaseFileNode(TypedModel, CommentableMixin, OptionalGuidMixin, Taggable, Ob
     _history = DateTimeAwareJSONField(default=list, blank=True)
     # A concrete version of a FileNode, must have an identifier
     versions = models.ManyToManyField('FileVersion', through='BaseFileVersionsThrough')
+    # The newest and oldest (by created) of versions, kept by add_version()
+    # so that listings of folders do not have to sort the versions of each file
+    latest_version = models.ForeignKey('FileVersion', blank=True, null=True, related_name='+', on_delete=models.SET_NULL)
+    earliest_version = models.ForeignKey('FileVersion', blank=True, null=True, related_name='+', on_delete=models.SET_NULL)
 
     target_content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     target_object_id = models.PositiveIntegerField()
@@ -272,8 +353,18 @@ class BaseFileNode(TypedModel, CommentableMixin, OptionalGuidMixin, Taggable, Ob
         """
         version_name = name or self.name
         BaseFileVersionsThrough.objects.create(fileversion=version, basefilenode=self, version_name=version_name)
+        self.update_version_ids()
         return version
 
+    def update_version_ids(self):
+        """Update latest_version and earliest_version from the versions."""
+        versions = self.versions.order_by('created', 'id').values_list('id', flat=True)
+        self.earliest_version_id = versions.first()
+        self.latest_version_id = versions.last()
+        BaseFileNode.objects.filter(id=self.id).update(
+            earliest_version_id=self.earliest_version_id,
+            latest_version_id=self.latest_version_id)
+
     @classmethod
     def files_checked_out(cls, user):
         """
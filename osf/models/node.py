@@ -741,12 +741,18 @@ class AbstractNode(DirtyFieldsMixin, TypedModel, AddonModelMixin, IdentifierMixi
             logger.exception(e)
             log_exception()
 
-    def update_search(self, wiki_page=None):
+    def update_search(self, wiki_page=None, saved_fields=None):
+        """Update the search document of this node.
+
+        saved_fields are the names of the updated fields, used to decide
+        whether the documents of the files also need to be updated
+        (None means unknown).
+        """
         from website import search
 
         try:
             search.search.update_node(self, bulk=False, async_update=True,
-                                      wiki_page=wiki_page)
+                                      wiki_page=wiki_page, saved_fields=saved_fields)
             if self.is_collected and self.is_public:
                 search.search.update_collected_metadata(self._id)
         except search.exceptions.SearchUnavailableError as e:
@@ -1064,7 +1070,7 @@ class AbstractNode(DirtyFieldsMixin, TypedModel, AddonModelMixin, IdentifierMixi
 
     # Override Taggable
     def on_tag_added(self, tag):
-        self.update_search()
+        self.update_search(saved_fields=['tags'])
         node_tasks.update_node_share(self)
 
     def remove_tag(self, tag, auth, save=True):
@@ -1087,7 +1093,7 @@ class AbstractNode(DirtyFieldsMixin, TypedModel, AddonModelMixin, IdentifierMixi
             )
             if save:
                 self.save()
-            self.update_search()
+            self.update_search(saved_fields=['tags'])
             node_tasks.update_node_share(self)
 
             return True
@@ -1098,7 +1104,7 @@ class AbstractNode(DirtyFieldsMixin, TypedModel, AddonModelMixin, IdentifierMixi
         tags are already present on the node.
         """
         super(AbstractNode, self).remove_tags(tags, auth, save)
-        self.update_search()
+        self.update_search(saved_fields=['tags'])
         node_tasks.update_node_share(self)
 
         return True
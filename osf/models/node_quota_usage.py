@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+from django.db import models
+
+from osf.models.base import BaseModel
+
+
+class NodeQuotaUsage(BaseModel):
+    """Storage used by the files of a project (see website.util.quota)."""
+    node = models.OneToOneField('AbstractNode', on_delete=models.CASCADE)
+    used = models.BigIntegerField(default=0)
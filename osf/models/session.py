@@ -1,10 +1,31 @@
+import json
+
+from django.core.cache import caches
+from django.utils import timezone
+
 from osf.models.base import BaseModel, ObjectIDMixin
-from osf.utils.datetime_aware_jsonfield import DateTimeAwareJSONField
+from osf.utils.datetime_aware_jsonfield import DateTimeAwareJSONEncoder, DateTimeAwareJSONField
+from website import settings
+
+
+def session_cache():
+    """Returns the cache of sessions, or None if it is disabled (see settings.SESSION_CACHE_TIMEOUT)."""
+    if settings.SESSION_CACHE_TIMEOUT <= 0:
+        return None
+    from api.base.settings import SESSION_CACHE_NAME
+    return caches[SESSION_CACHE_NAME]
+
+
+def session_cache_key(session_id):
+    return 'session:{}'.format(session_id)
 
 
 class Session(ObjectIDMixin, BaseModel):
     data = DateTimeAwareJSONField(default=dict, blank=True)
 
+    # serialized data when the session was loaded or persisted (None: not persisted)
+    _saved_data = None
+
     @property
     def is_authenticated(self):
         return 'auth_user_id' in self.data
@@ -12,3 +33,88 @@ class Session(ObjectIDMixin, BaseModel):
     @property
     def is_external_first_login(self):
         return 'auth_user_external_first_login' in self.data
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Session, cls).from_db(db, field_names, values)
+        instance._saved_data = instance._dump_data()
+        return instance
+
+    def _dump_data(self):
+        return json.dumps(self.data, sort_keys=True, cls=DateTimeAwareJSONEncoder)
+
+    @property
+    def is_dirty(self):
+        return self._saved_data is None or self._dump_data() != self._saved_data
+
+    @classmethod
+    def load(cls, q, select_for_update=False):
+        cache = session_cache()
+        if cache is None or select_for_update:
+            return super(Session, cls).load(q, select_for_update=select_for_update)
+        session = cache.get(session_cache_key(q))
+        if session is None:
+            session = super(Session, cls).load(q)
+            if session is not None:
+                cache.set(session_cache_key(q), session, settings.SESSION_CACHE_TIMEOUT)
+        return session
+
+    @classmethod
+    def uncache(cls, session_ids):
+        cache = session_cache()
+        if cache is not None:
+            cache.delete_many([session_cache_key(session_id) for session_id in session_ids])
+
+    def save(self, *args, **kwargs):
+        """Persist the session only if the data has been changed.
+
+        If the cache of sessions is enabled, the cached session is updated
+        at once and the write to the database is delayed to the end of the
+        request (once per session).
+        """
+        if not self.is_dirty and not args and not kwargs:
+            return
+        cache = session_cache()
+        if cache is not None and not args and not kwargs:
+            from framework.postcommit_tasks.handlers import get_postcommit_buffer
+
+            sessions = get_postcommit_buffer(persist_sessions, discard=discard_sessions)
+            if sessions is not None:
+                if self.created is None:
+                    # the session is checked against OSF_SESSION_TIMEOUT before it is inserted
+                    self.created = timezone.now()
+                self._saved_data = self._dump_data()
+                cache.set(session_cache_key(self._id), self, settings.SESSION_CACHE_TIMEOUT)
+                sessions[self._id] = self
+                return
+        self.persist(*args, **kwargs)
+
+    def persist(self, *args, **kwargs):
+        if self.pk is None and self._saved_data is not None:
+            # the cached session may have been inserted by the delayed write of another request
+            self.pk = Session.objects.filter(_id=self._id).values_list('id', flat=True).first()
+            self._state.adding = self.pk is None
+        super(Session, self).save(*args, **kwargs)
+        self._saved_data = self._dump_data()
+        cache = session_cache()
+        if cache is not None:
+            cache.set(session_cache_key(self._id), self, settings.SESSION_CACHE_TIMEOUT)
+
+    def delete(self, *args, **kwargs):
+        Session.uncache([self._id])
+        return super(Session, self).delete(*args, **kwargs)
+
+
+def persist_sessions(sessions):
+    for session_id in list(sessions.keys()):
+        session = sessions.pop(session_id)
+        try:
+            session.persist()
+        except Exception:
+            Session.uncache([session_id])
+            raise
+
+
+def discard_sessions(sessions):
+    """Uncache the sessions whose delayed write has been dropped."""
+    Session.uncache(list(sessions.keys()))
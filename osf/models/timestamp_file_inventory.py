@@ -0,0 +1,32 @@
+from django.db import models
+from osf.models.base import BaseModel
+
+
+class TimestampFileInventory(BaseModel):
+    """Last known WaterButler metadata of a file in a project.
+
+    Rows are updated from file events and by the crawls of timestamp
+    verification.  `verified_signature` is the `signature` at the time
+    the timestamp of the file was last verified successfully.
+    """
+    node = models.ForeignKey('AbstractNode', related_name='timestamp_file_inventory',
+                             on_delete=models.CASCADE)
+    provider = models.CharField(max_length=25)
+    path = models.TextField()
+    materialized_path = models.TextField()
+    file_id = models.CharField(max_length=24)
+    size = models.BigIntegerField(null=True, blank=True)
+    created_utc = models.CharField(max_length=64, null=True, blank=True)
+    modified_utc = models.CharField(max_length=64, null=True, blank=True)
+    etag = models.CharField(max_length=255, null=True, blank=True)
+    version = models.CharField(max_length=64, null=True, blank=True)
+    signature = models.TextField()
+    verified_signature = models.TextField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('node', 'provider', 'path')
+        index_together = ('node', 'provider')
+
+    @staticmethod
+    def get_signature(size, modified_utc, etag, version):
+        return u'{}:{}:{}:{}'.format(size, modified_utc, etag, version)
@@ -469,6 +469,8 @@ class OSFUser(DirtyFieldsMixin, GuidMixin, BaseModel, AbstractBaseUser, Permissi
                                        related_name='osf_user')
     mapcore_api_locked = models.BooleanField(default=False)
     mapcore_refresh_locked = models.BooleanField(default=False)
+    # last synchronization of my projects with mAP core (see nii/mapcore.py)
+    mapcore_sync_time = NonNaiveDateTimeField(null=True, blank=True)
 
     def __repr__(self):
         return '<OSFUser({0!r}) with guid {1!r}>'.format(self.username, self._id)
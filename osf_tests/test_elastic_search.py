@@ -2,21 +2,29 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import mock
+import os
+import shutil
+import tempfile
 import time
 import unittest
 import logging
 import functools
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from nose.tools import *  # noqa: F403
 import pytest
 
+from api.base.api_globals import api_globals
 from framework.auth.core import Auth
+from framework.postcommit_tasks.handlers import get_postcommit_buffer, postcommit_before_request
 
 from website import settings
 import website.search.search as search
 from website.search import elastic_search
+from website.search.exceptions import MalformedQueryError
 from website.search.util import build_query
-from website.search_migration.migrate import migrate
+from website.search_migration.migrate import migrate, sql_migrate, MigrationState
 from osf.models import (
     Retraction,
     NodeLicense,
@@ -721,6 +729,209 @@ class TestNodeSearch(OsfTestCase):
             assert_equal(doc['license'].get('id'), new_license.license_id)
 
 
+@pytest.mark.enable_search
+class TestNodeFilesUpdate(OsfTestCase):
+
+    def setUp(self):
+        super(TestNodeFilesUpdate, self).setUp()
+        self.node = factories.ProjectFactory(is_public=True, title='node')
+
+    def test_files_need_update(self):
+        assert_true(elastic_search.files_need_update(None))
+        assert_true(elastic_search.files_need_update(['title', 'description']))
+        assert_true(elastic_search.files_need_update(['contributors']))
+        assert_false(elastic_search.files_need_update(['description']))
+        assert_false(elastic_search.files_need_update([]))
+
+    @mock.patch('website.search.elastic_search.update_node_files')
+    def test_update_node_updates_files_only_when_needed(self, mock_update_files):
+        with mock.patch.object(settings, 'USE_CELERY', False):
+            elastic_search.update_node(self.node, saved_fields=['description'])
+            assert_equal(mock_update_files.call_count, 0)
+            elastic_search.update_node(self.node, saved_fields=['is_public'])
+            assert_equal(mock_update_files.call_count, 1)
+
+    def test_serialize_file_action(self):
+        file_ = OsfStorageFile.create(target=self.node, path='/test', name='test_file.txt',
+                                      materialized_path='/test_file.txt')
+        file_.save()
+        action = elastic_search.serialize_file_action(file_, 'test')
+        assert_equal(action['_op_type'], 'index')
+        assert_equal(action['_source']['node_title'], 'node')
+        action = elastic_search.serialize_file_action(file_, 'test', delete=True)
+        assert_equal(action['_op_type'], 'delete')
+        assert_equal(action['_id'], file_._id)
+
+
+@pytest.mark.enable_search
+class TestSearchRoundTrips(OsfTestCase):
+
+    def setUp(self):
+        super(TestSearchRoundTrips, self).setUp()
+        self.query = {'query': {'match_all': {}}, 'from': 0, 'size': 10}
+        self.responses = {'responses': [
+            {'aggregations': {'tag_cloud': {'buckets': [{'key': 'tag', 'doc_count': 1}]}}},
+            {'aggregations': {'licenses': {'buckets': []}}, 'hits': {'total': 1}},
+            {'aggregations': {'counts': {'buckets': [{'key': 'project', 'doc_count': 1}]}}},
+            {'hits': {'hits': [{'_source': {'title': 'node'}}]}},
+        ]}
+        elastic_search.search_cache().clear()
+
+    def tearDown(self):
+        elastic_search.search_cache().clear()
+        super(TestSearchRoundTrips, self).tearDown()
+
+    @mock.patch('website.search.elastic_search.client')
+    def test_search_uses_one_msearch(self, mock_client):
+        mock_client.return_value.msearch.return_value = self.responses
+        ret = elastic_search.search(self.query, index='test', doc_type='project', raw=True)
+        assert_equal(mock_client.return_value.msearch.call_count, 1)
+        assert_equal(mock_client.return_value.search.call_count, 0)
+        body = mock_client.return_value.msearch.call_args[1]['body']
+        assert_equal(len(body), 8)
+        assert_equal(body[7], self.query)
+        assert_equal(body[0]['size'], 0)
+        assert_not_in('from', body[0])
+        assert_equal(ret['tags'], [{'key': 'tag', 'doc_count': 1}])
+        assert_equal(ret['counts'], {'project': 1, 'total': 1})
+        assert_equal(ret['aggs']['total'], 1)
+        assert_equal(ret['results'], [{'_source': {'title': 'node'}}])
+        # the query itself is not modified
+        assert_equal(self.query, {'query': {'match_all': {}}, 'from': 0, 'size': 10})
+
+    @mock.patch('website.search.elastic_search.client')
+    def test_search_error_in_msearch(self, mock_client):
+        mock_client.return_value.msearch.return_value = {'responses': [
+            {'error': {'type': 'search_phase_execution_exception'}, 'status': 400},
+        ] * 4}
+        with assert_raises(MalformedQueryError):
+            elastic_search.search(self.query, index='test', doc_type='project', raw=True)
+
+    @mock.patch('website.search.elastic_search.client')
+    def test_public_search_results_are_cached(self, mock_client):
+        mock_client.return_value.msearch.return_value = self.responses
+        with mock.patch.object(settings, 'SEARCH_RESULT_CACHE_TIMEOUT', 30), \
+                mock.patch.object(settings, 'ENABLE_PRIVATE_SEARCH', True):
+            first = elastic_search.search(self.query, index='test', doc_type='project', raw=True)
+            second = elastic_search.search(self.query, index='test', doc_type='project', raw=True)
+            assert_equal(first, second)
+            assert_equal(mock_client.return_value.msearch.call_count, 1)
+
+            elastic_search.search(self.query, index='test', doc_type='project', raw=True, private=True)
+            elastic_search.search(self.query, index='test', doc_type='project', raw=True, private=True)
+            assert_equal(mock_client.return_value.msearch.call_count, 3)
+
+    @mock.patch('website.search.elastic_search.client')
+    def test_search_results_are_not_cached_by_default(self, mock_client):
+        mock_client.return_value.msearch.return_value = self.responses
+        elastic_search.search(self.query, index='test', doc_type='project', raw=True)
+        elastic_search.search(self.query, index='test', doc_type='project', raw=True)
+        assert_equal(mock_client.return_value.msearch.call_count, 2)
+
+    def test_user_fullnames_are_cached(self):
+        user = factories.UserFactory(fullname='Cached Name')
+        elastic_search._user_fullname_cache.clear()
+        with mock.patch.object(settings, 'SEARCH_USER_NAME_CACHE_TIMEOUT', 60):
+            assert_equal(elastic_search.get_user_fullnames([user._id]), {user._id: 'Cached Name'})
+            with mock.patch.object(elastic_search.OSFUser, 'objects') as mock_objects:
+                assert_equal(elastic_search.get_user_fullnames([user._id]), {user._id: 'Cached Name'})
+                assert_equal(mock_objects.filter.call_count, 0)
+        elastic_search._user_fullname_cache.clear()
+
+
+class TestFormatResults(OsfTestCase):
+
+    def setUp(self):
+        super(TestFormatResults, self).setUp()
+        self.user = factories.UserFactory(fullname='Creator Name')
+        self.node = factories.ProjectFactory(is_public=True, title='parent', creator=self.user)
+        root = self.node.get_addon('osfstorage').get_root()
+        self.files = [root.append_file('test{}.txt'.format(i)) for i in range(3)]
+
+    def file_result(self, file_):
+        return {
+            'id': file_._id,
+            'category': 'file',
+            'parent_id': self.node._id,
+            'creator_id': self.user._id,
+            'modifier_id': self.user._id,
+        }
+
+    def test_format_file_results(self):
+        results = elastic_search.format_results([self.file_result(f) for f in self.files])
+        assert_equal(len(results), 3)
+        for file_, result in zip(self.files, results):
+            assert_equal(result['folder_name'], os.path.dirname(elastic_search.get_file_path(file_._id)))
+            assert_equal(result['parent_title'], 'parent')
+            assert_equal(result['parent_url'], self.node.url)
+            assert_equal(result['creator_name'], 'Creator Name')
+            assert_equal(result['modifier_name'], 'Creator Name')
+
+    def test_number_of_queries_does_not_depend_on_results(self):
+        with CaptureQueriesContext(connection) as one:
+            elastic_search.format_results([self.file_result(self.files[0])])
+        with CaptureQueriesContext(connection) as three:
+            elastic_search.format_results([self.file_result(f) for f in self.files])
+        assert_equal(len(one), len(three))
+
+
+class TestFileUpdatesBuffer(OsfTestCase):
+    # update_file() in a (django) request is buffered and indexed after the request
+
+    def setUp(self):
+        super(TestFileUpdatesBuffer, self).setUp()
+        root = factories.ProjectFactory().get_addon('osfstorage').get_root()
+        self.file = root.append_file('test.txt')
+        self.other_file = root.append_file('other.txt')
+        postcommit_before_request()
+        api_globals.request = mock.Mock()
+
+    def tearDown(self):
+        api_globals.request = None
+        postcommit_before_request()
+        super(TestFileUpdatesBuffer, self).tearDown()
+
+    @mock.patch('framework.postcommit_tasks.handlers.context_stack', mock.Mock(top=None))
+    @mock.patch.object(settings, 'USE_CELERY', True)
+    @mock.patch.object(settings, 'DEBUG_MODE', False)
+    @mock.patch.object(search, 'search_engine')
+    def test_updates_are_coalesced(self, mock_engine):
+        search.update_file(self.file)
+        search.update_file(self.other_file)
+        search.update_file(self.file)
+        search.update_file(self.other_file, delete=True)
+        assert_equal(mock_engine.update_file.call_count, 0)
+
+        updates = get_postcommit_buffer(search.flush_file_updates)
+        assert_equal(dict(updates), {
+            (None, self.file._id): False,
+            (None, self.other_file._id): True,
+        })
+        search.flush_file_updates(updates)
+        mock_engine.update_files_async.apply_async.assert_called_once_with(
+            args=([self.file._id],),
+            kwargs={'index': None, 'deleted_file_ids': [self.other_file._id]})
+
+    @mock.patch.object(search, 'search_engine')
+    def test_update_file_outside_of_request(self, mock_engine):
+        api_globals.request = None
+        with mock.patch('framework.postcommit_tasks.handlers.context_stack', mock.Mock(top=None)):
+            search.update_file(self.file)
+        mock_engine.update_file.assert_called_once_with(self.file, index=None, delete=False)
+
+    @pytest.mark.enable_search
+    @mock.patch('website.search.elastic_search.bulk_file_actions')
+    def test_update_files(self, mock_bulk):
+        elastic_search.update_files(
+            [self.file._id, 'notexist'], index='test', deleted_file_ids=[self.other_file._id])
+        actions = list(mock_bulk.call_args[0][0])
+        assert_equal(mock_bulk.call_args[1], {'refresh': False})
+        ops = {action['_id']: action['_op_type'] for action in actions}
+        assert_equal(ops[self.other_file._id], 'delete')
+        assert_equal(ops['notexist'], 'delete')
+        assert_in(ops[self.file._id], ('index', 'delete'))
+
+
 @pytest.mark.enable_search
 @pytest.mark.enable_enqueue_task
 class TestRegistrationRetractions(OsfTestCase):
@@ -1298,6 +1509,48 @@ class TestSearchExceptions(OsfTestCase):
         self.project.save()
 
 
+class TestMigrationState(OsfTestCase):
+
+    def setUp(self):
+        super(TestMigrationState, self).setUp()
+        self.work_dir = tempfile.mkdtemp()
+        self.state_file = os.path.join(self.work_dir, 'state.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+        super(TestMigrationState, self).tearDown()
+
+    def test_state_is_saved(self):
+        state = MigrationState(self.state_file, 'test')
+        state.start('test_v2')
+        state.window_done('nodes', 0)
+        state.step_done('institutions')
+
+        state = MigrationState(self.state_file, 'test')
+        assert_equal(state.index, 'test_v2')
+        assert_equal(state.done_windows('nodes'), {0})
+        assert_true(state.is_step_done('institutions'))
+        assert_false(state.is_step_done('nodes'))
+
+        # the state of another index is not resumed
+        assert_is_none(MigrationState(self.state_file, 'other').index)
+
+        state.remove()
+        assert_false(os.path.exists(self.state_file))
+
+    @mock.patch('website.search_migration.migrate.migrate_window')
+    def test_sql_migrate_skips_migrated_pages(self, mock_window):
+        mock_window.side_effect = lambda index, sql, page_start, page_end, es_args, kwargs: (page_start, 2)
+        state = MigrationState(self.state_file, 'test')
+        state.start('test_v2')
+        state.window_done('nodes', 0)
+
+        total = sql_migrate('test_v2', 'SQL', 25, 10, state=state, state_key='nodes')
+        assert_equal(total, 6)
+        assert_equal(sorted(call[0][2] for call in mock_window.call_args_list), [10, 20, 30])
+        assert_equal(MigrationState(self.state_file, 'test').done_windows('nodes'), {0, 10, 20, 30})
+
+
 @pytest.mark.enable_search
 @pytest.mark.enable_enqueue_task
 class TestSearchMigration(OsfTestCase):
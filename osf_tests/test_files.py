@@ -57,6 +57,64 @@ def test_active_manager_does_not_return_trashed_file_nodes(project, create_test_
     # root folder + file = 2 BaseFileNodes
     assert BaseFileNode.active.filter(target_object_id=project.id, target_content_type=content_type_for_query).count() == 2
 
+def test_get_descendants(project):
+    root = project.get_addon('osfstorage').get_root()
+    folder = root.append_folder('folder')
+    subfolder = folder.append_folder('subfolder')
+    file1 = folder.append_file('file1')
+    file2 = subfolder.append_file('file2')
+    other = root.append_file('other')
+
+    descendants = BaseFileNode.objects.get_descendants(folder)
+    assert set(descendants.values_list('id', flat=True)) == {subfolder.id, file1.id, file2.id}
+    descendants = BaseFileNode.objects.get_descendants(folder, include_root=True)
+    assert set(descendants.values_list('id', flat=True)) == {folder.id, subfolder.id, file1.id, file2.id}
+    assert other.id in BaseFileNode.objects.get_descendants(root).values_list('id', flat=True)
+
+def test_move_and_trash_subtree(project, user):
+    def create(type, path):
+        file_node = BaseFileNode(type=type, provider='s3', _path=path,
+                                 _materialized_path=path, target=project)
+        file_node.save()
+        return file_node
+    folder = create('osf.s3folder', '/folder/')
+    file1 = create('osf.s3file', '/folder/file1')
+    file2 = create('osf.s3file', '/folder/sub/file2')
+    other = create('osf.s3file', '/folder2')
+
+    assert BaseFileNode.objects.move_subtree(project, 's3', '/folder/', '/renamed/') == 3
+    file2.refresh_from_db()
+    assert file2._path == '/renamed/sub/file2'
+    assert file2._materialized_path == '/renamed/sub/file2'
+    other.refresh_from_db()
+    assert other._path == '/folder2'
+
+    trashed = BaseFileNode.objects.trash_subtree(project, 's3', '/renamed/', user)
+    assert set(trashed) == {file1.id, file2.id}
+    assert BaseFileNode.objects.get(id=folder.id).type == 'osf.trashedfolder'
+    assert BaseFileNode.objects.get(id=file1.id).type == 'osf.trashedfile'
+    assert BaseFileNode.objects.get(id=file1.id).deleted_by == user
+    assert BaseFileNode.objects.get(id=other.id).type == 'osf.s3file'
+
+def test_move_and_trash_subtree_without_materialized_path(project, user):
+    def create(type, path):
+        file_node = BaseFileNode(type=type, provider='s3', _path=path,
+                                 _materialized_path=None, target=project)
+        file_node.save()
+        return file_node
+    folder = create('osf.s3folder', '/folder/')
+    file1 = create('osf.s3file', '/folder/file1')
+
+    assert BaseFileNode.objects.move_subtree(project, 's3', '/folder/', '/renamed/') == 2
+    file1.refresh_from_db()
+    assert file1._path == '/renamed/file1'
+    assert file1._materialized_path is None
+
+    trashed = BaseFileNode.objects.trash_subtree(project, 's3', '/renamed/', user)
+    assert trashed == [file1.id]
+    assert BaseFileNode.objects.get(id=folder.id).type == 'osf.trashedfolder'
+    assert BaseFileNode.objects.get(id=file1.id).type == 'osf.trashedfile'
+
 def test_folder_update_calls_folder_update_method(project, create_test_file):
     file = create_test_file(target=project)
     parent_folder = file.parent
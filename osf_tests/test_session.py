@@ -1,9 +1,14 @@
+import mock
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from framework.sessions import utils
 from tests.base import DbTestCase
 from osf_tests.factories import SessionFactory, UserFactory
 from osf.models import OSFUser, Session
+from osf.models.session import discard_sessions, persist_sessions, session_cache
+from website import settings
 
 @pytest.mark.django_db
 class TestSession:
@@ -30,6 +35,78 @@ class TestSession:
         Session.objects.filter(data__auth_user_id='123ab').delete()
         assert Session.objects.count() == 1
 
+    def test_save_only_when_changed(self):
+        session = Session(data={'auth_user_id': 'abc12'})
+        session.save()
+        session = Session.load(session._id)
+        assert not session.is_dirty
+        with CaptureQueriesContext(connection) as ctx:
+            session.save()
+        assert len(ctx) == 0
+
+        session.data['search_size'] = 10
+        assert session.is_dirty
+        session.save()
+        assert Session.load(session._id).data['search_size'] == 10
+
+
+@pytest.mark.django_db
+class TestSessionCache:
+
+    @pytest.fixture(autouse=True)
+    def enable_cache(self):
+        with mock.patch.object(settings, 'SESSION_CACHE_TIMEOUT', 60):
+            session_cache().clear()
+            yield
+            session_cache().clear()
+
+    def test_load_from_cache(self):
+        session = Session(data={'auth_user_id': 'abc12'})
+        session.save()
+        assert Session.load(session._id).data == {'auth_user_id': 'abc12'}
+        with CaptureQueriesContext(connection) as ctx:
+            cached = Session.load(session._id)
+        assert len(ctx) == 0
+        assert cached.data == {'auth_user_id': 'abc12'}
+        assert not cached.is_dirty
+
+    def test_removed_session_is_not_loaded(self):
+        session = Session(data={'auth_user_id': 'abc12'})
+        session.save()
+        assert Session.load(session._id)
+        utils.remove_session(session)
+        assert Session.load(session._id) is None
+
+    def test_delayed_write_in_request(self):
+        session = Session(data={'auth_user_id': 'abc12'})
+        buffer = {}
+        with mock.patch('framework.postcommit_tasks.handlers.get_postcommit_buffer', return_value=buffer):
+            session.save()
+        assert Session.objects.filter(_id=session._id).count() == 0
+        assert Session.load(session._id).data == {'auth_user_id': 'abc12'}
+
+        # at the end of the request
+        persist_sessions(buffer)
+        assert Session.objects.get(_id=session._id).data == {'auth_user_id': 'abc12'}
+        assert buffer == {}
+
+    def test_delayed_write_sets_created(self):
+        session = Session(data={'auth_user_id': 'abc12'})
+        with mock.patch('framework.postcommit_tasks.handlers.get_postcommit_buffer', return_value={}):
+            session.save()
+        assert Session.load(session._id).created is not None
+
+    def test_dropped_delayed_write_is_uncached(self):
+        session = Session(data={'auth_user_id': 'abc12'})
+        buffer = {}
+        with mock.patch('framework.postcommit_tasks.handlers.get_postcommit_buffer', return_value=buffer):
+            session.save()
+        assert Session.load(session._id) is not None
+
+        # the request failed and its post commit tasks are not run
+        discard_sessions(buffer)
+        assert Session.load(session._id) is None
+
 
 class SessionUtilsTestCase(DbTestCase):
     def setUp(self, *args, **kwargs):
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Measure the per-request overhead of sessions with and without the cache of sessions.
+
+A user and a session are created in a transaction which is rolled back at the end.
+For each mode, framework.sessions.before_request is run for cookie-bearing requests
+and the session is saved as the private search does (changed every --write-every requests).
+
+    python -m scripts.benchmark_session_store --requests 2000
+
+The cache is the SESSION_CACHE_NAME cache of api.base.settings (locmem unless overridden).
+"""
+import argparse
+import logging
+import time
+
+import itsdangerous
+import mock
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from website.app import init_app
+from website import settings
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+
+class Rollback(Exception):
+    pass
+
+
+def run_requests(app, cookie, count, write_every):
+    from framework import sessions
+    from framework.postcommit_tasks.handlers import postcommit_after_request, postcommit_before_request
+
+    start = time.time()
+    with CaptureQueriesContext(connection) as queries:
+        for i in range(count):
+            with app.test_request_context(headers={'Cookie': '{}={}'.format(settings.COOKIE_NAME, cookie)}):
+                postcommit_before_request()
+                sessions.before_request()
+                user_session = sessions.get_session()
+                user_session.data['search_size'] = i // write_every if write_every else 10
+                user_session.save()
+                postcommit_after_request(mock.Mock(status_code=200))
+    return time.time() - start, len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--write-every', type=int, default=50, help='requests per change of the session data')
+    parser.add_argument('--cache-timeout', type=int, default=600)
+    args = parser.parse_args()
+
+    app = init_app(routes=False, set_backends=True)
+    # requests are not run as tests, so that the writes of sessions can be delayed
+    app.testing = False
+    from osf.models import Session
+    from osf.models.session import session_cache
+    from osf_tests.factories import AuthUserFactory
+
+    try:
+        with transaction.atomic():
+            user = AuthUserFactory()
+            user_session = Session(data={'auth_user_id': user._id})
+            user_session.save()
+            cookie = itsdangerous.Signer(settings.SECRET_KEY).sign(user_session._id).decode()
+
+            for label, timeout in (('database', 0), ('cache', args.cache_timeout)):
+                with mock.patch.object(settings, 'SESSION_CACHE_TIMEOUT', timeout):
+                    if timeout:
+                        session_cache().clear()
+                    elapsed, queries = run_requests(app, cookie, args.requests, args.write_every)
+                logger.info('{:<10} {:>6} requests {:>8.3f} s {:>8.3f} ms/request {:>6.2f} queries/request'.format(
+                    label, args.requests, elapsed, elapsed * 1000 / args.requests, queries / float(args.requests)))
+            raise Rollback()
+    except Rollback:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Compare the openssl command and in-process (python) timestamp backends.
+
+A throwaway CA and TSA are created with openssl in a temporary directory,
+and timestamp requests/verifications are run for synthetic files with both
+backends (see api_settings.TIMESTAMP_BACKEND).
+
+    python -m scripts.benchmark_timestamp_backend --files 2000 --size 65536
+"""
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from api.base import settings as api_settings
+from tests.tsa_utils import create_tokens, run, setup_tsa
+from website.util import rfc3161
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+
+def create_files(work_dir, count, size):
+    files = []
+    for i in range(count):
+        file_name = os.path.join(work_dir, 'file{:06d}'.format(i))
+        with open(file_name, 'wb') as f:
+            f.write(os.urandom(size))
+        files.append(file_name)
+    return files
+
+
+def request_command(file_name):
+    return run(api_settings.SSL_CREATE_TIMESTAMP_REQUEST.format(file_name))
+
+
+def request_python(file_name):
+    return rfc3161.build_request_for_file(file_name, 'sha512')
+
+
+def verify_command(file_name, token, ca_file, tmp_dir):
+    token_file = os.path.join(tmp_dir, 'token.tsr')
+    with open(token_file, 'wb') as f:
+        f.write(token)
+    stdout_data = run(api_settings.SSL_GET_TIMESTAMP_RESPONSE.format(file_name, token_file, ca_file))
+    return stdout_data.__str__().find(api_settings.OPENSSL_VERIFY_RESULT_OK) > -1
+
+
+def verify_python(file_name, token, ca_file, tmp_dir):
+    try:
+        rfc3161.verify_response_for_file(token, file_name, rfc3161.load_root_certificates(ca_file))
+    except rfc3161.TimestampVerifyError:
+        return False
+    return True
+
+
+def measure(label, func, args_list):
+    start = time.time()
+    ok = 0
+    for args in args_list:
+        if func(*args):
+            ok += 1
+    elapsed = time.time() - start
+    logger.info('{:<16} {:>6} files {:>9.3f} s {:>9.1f} files/s (ok={})'.format(
+        label, len(args_list), elapsed, len(args_list) / elapsed if elapsed else 0, ok))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--files', type=int, default=2000)
+    parser.add_argument('--size', type=int, default=64 * 1024, help='bytes per file')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        config, ca_file = setup_tsa(work_dir)
+        files = create_files(work_dir, args.files, args.size)
+        logger.info('Creating {} timestamp tokens...'.format(len(files)))
+        tokens = create_tokens(work_dir, config, files)
+
+        measure('request/command', request_command, [(f,) for f in files])
+        measure('request/python', request_python, [(f,) for f in files])
+        verify_args = [(f, t, ca_file, work_dir) for f, t in zip(files, tokens)]
+        measure('verify/command', verify_command, verify_args)
+        measure('verify/python', verify_python, verify_args)
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
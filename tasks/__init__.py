@@ -239,8 +239,13 @@ def celery_beat(ctx, level='debug', schedule=None):
     ctx.run(bin_prefix(cmd), pty=True)
 
 @task
-def migrate_search(ctx, delete=True, remove=False, remove_all=False, index=None):
-    """Migrate the search-enabled models."""
+def migrate_search(ctx, delete=True, remove=False, remove_all=False, index=None,
+                   rebuild=False, workers=None, chunk_size=None, thread_count=None, state_file=None):
+    """Migrate the search-enabled models.
+
+    --rebuild: load in parallel (--workers, --chunk-size, --thread-count) and
+    resume an interrupted rebuild from --state-file
+    """
     from website.app import init_app
     init_app(routes=False, set_backends=False)
     from website.search_migration.migrate import migrate
@@ -251,7 +256,12 @@ def migrate_search(ctx, delete=True, remove=False, remove_all=False, index=None)
     for logger in SILENT_LOGGERS:
         logging.getLogger(logger).setLevel(logging.ERROR)
 
-    migrate(delete, remove=remove, remove_all=remove_all, index=index)
+    migrate(delete, remove=remove, remove_all=remove_all, index=index,
+            rebuild=rebuild,
+            workers=int(workers) if workers else None,
+            chunk_size=int(chunk_size) if chunk_size else None,
+            thread_count=int(thread_count) if thread_count else None,
+            state_file=state_file)
 
 @task
 def rebuild_search(ctx):
@@ -1042,6 +1052,24 @@ def mapcore_remove_token(ctx, username=None, eppn=None):
         print('token is REMOVED: ePPN = ' + user.eppn)
 
 
+@task(help={'username': 'username of the user',
+            'apply': 'apply the changes (dry-run by default)'})
+def mapcore_sync_my_projects(ctx, username, apply=False):
+    '''Compare (and synchronize) GRDM projects and mAP groups of a user'''
+    from website.app import init_app
+    init_app(routes=False)
+
+    from osf.models import OSFUser
+    from nii.mapcore import (mapcore_sync_rdm_my_projects,
+                             mapcore_report_my_projects_changes)
+
+    user = OSFUser.objects.get(username=username)
+    changes = mapcore_sync_rdm_my_projects(user, use_raise=True, dry_run=not apply)
+    for line in mapcore_report_my_projects_changes(changes):
+        print(line)
+    print('{} change(s) {}'.format(len(changes), 'applied' if apply else 'found (dry-run)'))
+
+
 @task(help={'user': 'filter with creator\'s mail address',
             'file': 'file name contains group_key list',
             'grdm': 'remove groups from GRDM',
@@ -226,6 +226,29 @@ class TestFuncOfMAPCore(OsfTestCase):
         mapcore_sync_set_enabled()
         assert_equal(mapcore_sync_is_enabled(), True)
 
+    def test_locker(self):
+        from django.db import connection
+        from nii.mapcore import locker, MAPCoreLocker
+
+        def advisory_locks(namespace, obj_id):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT count(*) FROM pg_locks WHERE locktype = 'advisory'"
+                    ' AND pid = pg_backend_pid() AND classid = %s AND objid = %s',
+                    [namespace, obj_id])
+                return cursor.fetchone()[0]
+
+        locker.lock_user(self.me)
+        locker.lock_node(self.project)
+        locker.lock_node(self.project)  # reentrant
+        assert_equal(advisory_locks(MAPCoreLocker.NAMESPACE_USER, self.me.id), 1)
+        assert_equal(advisory_locks(MAPCoreLocker.NAMESPACE_NODE, self.project.id), 1)
+        locker.unlock_user(self.me)
+        locker.unlock_node(self.project)
+        locker.unlock_node(self.project)
+        assert_equal(advisory_locks(MAPCoreLocker.NAMESPACE_USER, self.me.id), 0)
+        assert_equal(advisory_locks(MAPCoreLocker.NAMESPACE_NODE, self.project.id), 0)
+
     @mock.patch('nii.mapcore.MAPCORE_CLIENTID', 'dummy_client_id')
     @mock.patch('nii.mapcore.mapcore_sync_rdm_project_or_map_group')
     def test_sync_upload_all(self, mock_sync):
@@ -958,6 +981,40 @@ class TestFuncOfMAPCore(OsfTestCase):
         assert_equal(mock_sync_rdm.call_count, 0)
         mock_mygr.call_count = 0
 
+    @mock.patch('nii.mapcore_api.MAPCORE_SECRET', 'fake_secret')
+    @mock.patch('nii.mapcore_api.MAPCORE_HOSTNAME', 'fake_hostname')
+    @mock.patch('nii.mapcore_api.MAPCORE_API_PATH', '/fake_api_path')
+    @mock.patch('nii.mapcore_api.MAPCore.get_my_groups')
+    @mock.patch('nii.mapcore.mapcore_sync_rdm_project_or_map_group')
+    @mock.patch('nii.mapcore.mapcore_create_new_node_from_mapgroup')
+    def test_sync_rdm_my_projects_dry_run(self, mock_create, mock_or, mock_mygr):
+        from nii.mapcore import (mapcore_sync_rdm_my_projects,
+                                 mapcore_report_my_projects_changes,
+                                 MAPCORE_CREATE_PROJECT,
+                                 MAPCORE_SYNC_PROJECT)
+
+        grp1 = {'group_name': 'fake_group_name1',
+                'group_key': 'fake_group_key1',
+                'active': 1, 'public': 1,
+                'open_member': OPEN_MEMBER_PUBLIC}
+        grp2 = {'group_name': 'fake_group_name2',
+                'group_key': 'fake_group_key2',
+                'active': 1, 'public': 1,
+                'open_member': OPEN_MEMBER_PUBLIC}
+        mock_mygr.return_value = {'result': {'groups': [grp1, grp2]}}
+        self.project.title = 'fake_group_name1' + randstr(4)
+        self.project.map_group_key = 'fake_group_key1'
+        self.project.save()
+
+        changes = mapcore_sync_rdm_my_projects(self.me, use_raise=True, dry_run=True)
+        assert_equal(changes, [
+            (MAPCORE_SYNC_PROJECT, 'fake_group_key1', self.project, grp1, 'different title'),
+            (MAPCORE_CREATE_PROJECT, 'fake_group_key2', None, grp2, 'new mAP group'),
+        ])
+        assert_equal(mock_or.call_count, 0)
+        assert_equal(mock_create.call_count, 0)
+        assert_equal(len(mapcore_report_my_projects_changes(changes)), 2)
+
     @mock.patch('nii.mapcore_api.MAPCORE_SECRET', 'fake_secret')
     @mock.patch('nii.mapcore_api.MAPCORE_HOSTNAME', 'fake_hostname')
     @mock.patch('nii.mapcore_api.MAPCORE_API_PATH', '/fake_api_path')
@@ -1132,6 +1189,59 @@ class TestViewsWithMAPCore(OsfTestCase):
         assert_equal(mock_sync1.call_count, 0)
         assert_equal(mock_sync2.call_count, 0)
 
+    @mock.patch('nii.mapcore.MAPCORE_CLIENTID', 'test_my_projects_background')
+    @mock.patch.object(settings, 'MAPCORE_SYNC_IN_BACKGROUND', True)
+    @mock.patch('nii.mapcore.mapcore_sync_rdm_my_projects0')
+    @mock.patch('nii.mapcore.mapcore_api_is_available0')
+    def test_my_projects_background(self, mock_token, mock_sync):
+        url = web_url_for('my_projects', _absolute=True)
+        res = self.app.get(url, auth=self.me.auth)
+        assert_equal(res.status_code, 200)
+        assert_equal(mock_token.call_count, 1)
+        assert_equal(mock_sync.call_count, 1)  # by the task after the request
+        self.me.reload()
+        assert_not_equal(self.me.mapcore_sync_time, None)
+
+        # the last synchronized state is fresh
+        res = self.app.get(url, auth=self.me.auth)
+        assert_equal(res.status_code, 200)
+        assert_equal(mock_token.call_count, 2)
+        assert_equal(mock_sync.call_count, 1)
+
+    @mock.patch('nii.mapcore.mapcore_sync_rdm_my_projects0')
+    def test_my_projects_task_error(self, mock_sync):
+        from nii.mapcore import mapcore_sync_rdm_my_projects_task
+        mock_sync.side_effect = Exception('test message')
+        mapcore_sync_rdm_my_projects_task(self.me._id)
+        assert_equal(mock_sync.call_count, 1)
+        self.me.reload()
+        assert_equal(self.me.mapcore_sync_time, None)  # retried by the next page load
+
+    @mock.patch('nii.mapcore.MAPCORE_CLIENTID', 'test_my_projects_background')
+    @mock.patch.object(settings, 'MAPCORE_SYNC_IN_BACKGROUND', True)
+    @mock.patch('nii.mapcore.mapcore_sync_rdm_my_projects0')
+    @mock.patch('nii.mapcore.mapcore_api_is_available0')
+    def test_my_projects_background_without_token(self, mock_token, mock_sync):
+        mapcore = MAPCore(self.me)
+        mock_token.side_effect = MAPCoreTokenExpired(mapcore, 'test message')
+
+        url = web_url_for('my_projects', _absolute=True)
+        res = self.app.get(url, auth=self.me.auth)
+        assert_equal(res.status_code, 302)
+        assert_in(web_url_for('mapcore_oauth_start') + '?next_url=',
+                  res.headers.get('Location'))
+        assert_equal(mock_sync.call_count, 0)
+
+    @mock.patch('nii.mapcore.MAPCORE_CLIENTID', 'test_view_project_background')
+    @mock.patch.object(settings, 'MAPCORE_SYNC_IN_BACKGROUND', True)
+    @mock.patch('nii.mapcore.mapcore_sync_rdm_project_or_map_group0')
+    @mock.patch('nii.mapcore.mapcore_api_is_available0')
+    def test_view_project_background(self, mock_token, mock_sync):
+        res = self.app.get(self.project_url, auth=self.me.auth)
+        assert_equal(res.status_code, 200)
+        assert_equal(mock_token.call_count, 1)
+        assert_equal(mock_sync.call_count, 1)  # enqueued once per request
+
     ### from tests/test_views.py::test_edit_node_title
     @mock.patch('nii.mapcore.MAPCORE_CLIENTID', 'test_edit_node_title')
     @mock.patch('nii.mapcore.mapcore_sync_rdm_project_or_map_group0')
@@ -124,6 +124,25 @@ class TestAuthUtils(OsfTestCase):
             auth.get_user(email=user.username, password='wrong')
         )
 
+    def test_get_user_with_cached_password_check(self):
+        user = UserFactory()
+        user.set_password('killerqueen')
+        user.save()
+        with mock.patch.object(OSFUser, 'check_password', autospec=True, side_effect=OSFUser.check_password) as mock_check:
+            assert_equal(auth.get_user(email=user.username, password='killerqueen', cache_password=True), user)
+            assert_equal(auth.get_user(email=user.username, password='killerqueen', cache_password=True), user)
+            assert_equal(mock_check.call_count, 1)
+            # failures are not cached
+            assert_false(auth.get_user(email=user.username, password='wrong', cache_password=True))
+            assert_false(auth.get_user(email=user.username, password='wrong', cache_password=True))
+            assert_equal(mock_check.call_count, 3)
+
+        # a change of the password invalidates the cache
+        user.set_password('brianmay')
+        user.save()
+        assert_false(auth.get_user(email=user.username, password='killerqueen', cache_password=True))
+        assert_equal(auth.get_user(email=user.username, password='brianmay', cache_password=True), user)
+
     def test_get_user_by_external_info(self):
         service_url = 'http://localhost:5000/dashboard/'
         user, validated_credentials, cas_resp = generate_external_user_with_resp(service_url)
@@ -9,7 +9,8 @@ from api.base import settings as api_settings
 from framework.auth import signing
 from tests.base import OsfTestCase
 from osf.models import (
-    FileLog, FileInfo, TrashedFileNode, TrashedFolder, UserQuota, ProjectStorageType, BaseFileNode
+    FileLog, FileInfo, TrashedFileNode, TrashedFolder, UserQuota, ProjectStorageType, BaseFileNode,
+    NodeQuotaUsage
 
 )
 from osf_tests.factories import (
@@ -1329,44 +1330,50 @@ class TestSaveUsedQuota(OsfTestCase):
         assert_equal(user_quota.used, 4500)
 
     def test_delete_folder_with_Amazon_S3(self):
-        mock_base_file_node = mock.MagicMock()
-        mock_file_info = mock.MagicMock()
-        mock_user_quota = mock.MagicMock()
-        mock_base_file_node.objects.filter.return_value.order_by.return_value.first.return_value = self.base_folder_node
-        folder_element = BaseFileNode(type='osf.s3folder', provider='s3', _path='/testfolder/foldername',
-                _materialized_path='/testfolder/foldername', target_object_id=self.node.id, target_content_type_id=2)
-        mock_base_file_node.objects.filter.return_value.all.return_value = [self.base_file_node, folder_element]
-        mock_file_info.objects.get.return_value = FileInfo(file=self.base_file_node, file_size=1500)
-        mock_user_quota.objects.filter.return_value.first.return_value = UserQuota(
+        ProjectStorageType.objects.filter(node=self.node).update(
+            storage_type=ProjectStorageType.CUSTOM_STORAGE)
+        UserQuota.objects.create(
             user=self.project_creator,
             storage_type=UserQuota.CUSTOM_STORAGE,
             max_quota=api_settings.DEFAULT_MAX_QUOTA,
             used=5500
         )
-        with mock.patch('website.util.quota.BaseFileNode', mock_base_file_node):
-            with mock.patch('website.util.quota.FileInfo', mock_file_info):
-                with mock.patch('website.util.quota.UserQuota', mock_user_quota):
-                    quota.update_used_quota(
-                        self=None,
-                        target=self.node,
-                        user=self.user,
-                        event_type=FileLog.FILE_REMOVED,
-                        payload={
-                            'provider': 's3',
-                            'metadata': {
-                                'provider': 's3',
-                                'name': 'testfolder',
-                                'materialized': '/testfolder',
-                                'path': '/testfolder',
-                                'kind': 'folder'
-                            }
-                        }
-                    )
+        folder = BaseFileNode(type='osf.s3folder', provider='s3', _path='/testfolder/',
+                _materialized_path='/testfolder/', target=self.node)
+        folder.save()
+        file_node = BaseFileNode(type='osf.s3file', provider='s3', _path='/testfolder/testfile',
+                _materialized_path='/testfolder/testfile', target=self.node)
+        file_node.save()
+        FileInfo.objects.create(file=file_node, file_size=1500)
+        other_file_node = BaseFileNode(type='osf.s3file', provider='s3', _path='/testfolder2',
+                _materialized_path='/testfolder2', target=self.node)
+        other_file_node.save()
+        FileInfo.objects.create(file=other_file_node, file_size=1000)
+
+        quota.update_used_quota(
+            self=None,
+            target=self.node,
+            user=self.user,
+            event_type=FileLog.FILE_REMOVED,
+            payload={
+                'provider': 's3',
+                'metadata': {
+                    'provider': 's3',
+                    'name': 'testfolder',
+                    'materialized': '/testfolder/',
+                    'path': '/testfolder/',
+                    'kind': 'folder'
+                }
+            }
+        )
         user_quota = UserQuota.objects.get(
             storage_type=UserQuota.CUSTOM_STORAGE,
             user=self.project_creator
         )
         assert_equal(user_quota.used, 4000)
+        assert_equal(BaseFileNode.objects.get(id=file_node.id).type, 'osf.trashedfile')
+        assert_equal(BaseFileNode.objects.get(id=folder.id).type, 'osf.trashedfolder')
+        assert_equal(BaseFileNode.objects.get(id=other_file_node.id).type, 'osf.s3file')
 
 
 class TestUpdateUserUsedQuota(OsfTestCase):
@@ -1410,6 +1417,93 @@ class TestUpdateUserUsedQuota(OsfTestCase):
         assert_equal(user_quota.used, 500)
 
 
+class TestReconcileUsedQuota(OsfTestCase):
+    def setUp(self):
+        super(TestReconcileUsedQuota, self).setUp()
+        self.user = UserFactory()
+        self.node = ProjectFactory(creator=self.user)
+        self.file = OsfStorageFileNode.create(target=self.node, name='file0')
+        self.file.save()
+        FileInfo.objects.create(file=self.file, file_size=500)
+
+    def test_add_used_quota(self):
+        quota.add_used_quota(self.node, UserQuota.NII_STORAGE, 1000)
+        quota.add_used_quota(self.node, UserQuota.NII_STORAGE, -300)
+        assert_equal(UserQuota.objects.get(user=self.user).used, 700)
+        assert_equal(NodeQuotaUsage.objects.get(node=self.node).used, 700)
+
+        quota.add_used_quota(self.node, UserQuota.NII_STORAGE, -1000)
+        assert_equal(UserQuota.objects.get(user=self.user).used, 0)
+        assert_equal(NodeQuotaUsage.objects.get(node=self.node).used, 0)
+
+    def test_reconcile_used_quota(self):
+        UserQuota.objects.create(
+            user=self.user,
+            storage_type=UserQuota.NII_STORAGE,
+            max_quota=api_settings.DEFAULT_MAX_QUOTA,
+            used=100
+        )
+        drift = quota.reconcile_used_quota([self.user.id], dry_run=True)
+        assert_equal(drift, [(self.user.id, 100, 500)])
+        assert_equal(UserQuota.objects.get(user=self.user).used, 100)
+
+        drift = quota.reconcile_used_quota([self.user.id])
+        assert_equal(drift, [(self.user.id, 100, 500)])
+        assert_equal(UserQuota.objects.get(user=self.user).used, 500)
+        assert_equal(NodeQuotaUsage.objects.get(node=self.node).used, 500)
+
+        assert_equal(quota.reconcile_used_quota([self.user.id]), [])
+
+    def test_recalculate_used_quota_of_institution(self):
+        institution = InstitutionFactory()
+        other_user = UserFactory()
+        for user in (self.user, other_user):
+            user.affiliated_institutions.add(institution)
+        UserQuota.objects.create(
+            user=self.user,
+            storage_type=UserQuota.NII_STORAGE,
+            max_quota=api_settings.DEFAULT_MAX_QUOTA,
+            used=100
+        )
+
+        quota.start_used_quota_recalculation([institution.id])  # run eagerly
+        assert_equal(UserQuota.objects.get(user=self.user).used, 500)
+        status = quota.get_recalculation_status(institution.id)
+        assert_equal(status['status'], quota.RECALCULATION_DONE)
+        assert_equal(status['processed'], 2)
+        assert_equal(status['total'], 2)
+        assert_equal(status['drifted'], 1)
+
+        # only the creators of the changed files are recalculated
+        self.file.save()
+        quota.recalculate_used_quota_of_institution(institution.id, changed_only=True, chunk_size=1)
+        status = quota.get_recalculation_status(institution.id)
+        assert_equal(status['status'], quota.RECALCULATION_DONE)
+        assert_equal(status['total'], 1)
+        assert_equal(status['drifted'], 0)
+
+    def test_recalculate_changed_only_after_trashing_folder(self):
+        institution = InstitutionFactory()
+        self.user.affiliated_institutions.add(institution)
+        for type, path in (('osf.s3folder', '/folder/'), ('osf.s3file', '/folder/file1')):
+            BaseFileNode(type=type, provider='s3', _path=path,
+                         _materialized_path=path, target=self.node).save()
+        quota.recalculate_used_quota_of_institution(institution.id)
+
+        # the files were only deleted since the last recalculation
+        BaseFileNode.objects.trash_subtree(self.node, 's3', '/folder/', self.user)
+        quota.recalculate_used_quota_of_institution(institution.id, changed_only=True)
+        status = quota.get_recalculation_status(institution.id)
+        assert_equal(status['status'], quota.RECALCULATION_DONE)
+        assert_equal(status['total'], 1)
+
+    def test_calculate_used_quota(self):
+        other_user = UserFactory()
+        users_used, nodes_used = quota.calculate_used_quota([self.user.id, other_user.id])
+        assert_equal(users_used, {self.user.id: 500, other_user.id: 0})
+        assert_equal(nodes_used[self.node.id], 500)
+
+
 class TestQuotaApiWaterbutler(OsfTestCase):
     def setUp(self):
         super(TestQuotaApiWaterbutler, self).setUp()
@@ -1,22 +1,27 @@
 # -*- coding: utf-8 -*-
 import datetime
+import hashlib
 import mock
 import os
 import pytz
 import shutil
+import threading
+import unittest
 from addons.osfstorage import settings as osfstorage_settings
 from api.base import settings as api_settings
+from django.utils import timezone
 from framework.auth import Auth
 from nose import tools as nt
-from osf.models import RdmUserKey, RdmFileTimestamptokenVerifyResult, Guid
+from osf.models import BaseFileNode, RdmUserKey, RdmFileTimestamptokenVerifyResult, Guid, TimestampFileInventory
 from osf_tests.factories import ProjectFactory, AuthUserFactory
 from tests.base import ApiTestCase, OsfTestCase
-from website.util import timestamp
+from tests.tsa_utils import create_tokens, setup_tsa
+from website.util import rfc3161, timestamp, waterbutler
 import tempfile
 from website.util.timestamp import (
     AddTimestamp, TimeStampTokenVerifyCheck,
     userkey_generation, userkey_generation_check,
-    OSFAbortableAsyncResult
+    OSFAbortableAsyncResult, TokenBucket, TimestampVerifyEngine
 )
 
 
@@ -150,6 +155,40 @@ class TestAddTimestamp(ApiTestCase):
         nt.assert_equal(rdmfiletimestamptokenverifyresult.inspection_result_status, 1)
         nt.assert_equal(rdmfiletimestamptokenverifyresult.verify_user, osfuser_id)
 
+    @mock.patch.object(api_settings, 'TIMESTAMP_STREAMING_DIGEST', False)
+    @mock.patch('website.util.waterbutler.download_file')
+    @mock.patch('website.util.waterbutler.get_node_info')
+    def test_add_pending_timestamps(self, mock_node_info, mock_download):
+        # only WaterButler (not running in tests) is replaced,
+        # the timestamp is requested from the TSA and verified
+        filename = 'test_file_add_pending_timestamp'
+        file_node = create_test_file(node=self.node, user=self.user, filename=filename)
+
+        def download_file(cookie, file_node, tmp_dir):
+            download_file_path = os.path.join(tmp_dir, filename)
+            with open(download_file_path, 'wb') as fout:
+                fout.write(b'test_file_add_pending_timestamp_context')
+            return download_file_path
+        mock_node_info.return_value = {'data': []}
+        mock_download.side_effect = download_file
+
+        file_data = {
+            'file_id': file_node._id,
+            'file_name': filename,
+            'file_path': os.path.join('/', filename),
+            'size': 39,
+            'created': None,
+            'modified': None,
+            'version': '',
+            'provider': 'osfstorage'
+        }
+        timestamp.set_timestamp_pending(self.node, file_data, self.user.id, True)
+        timestamp.celery_add_pending_timestamps(self.node.id)
+
+        verify_data = RdmFileTimestamptokenVerifyResult.objects.get(file_id=file_node._id)
+        nt.assert_equal(verify_data.inspection_result_status, api_settings.TIME_STAMP_TOKEN_CHECK_SUCCESS)
+        nt.assert_true(verify_data.timestamp_token)
+
     def test_add_timestamp_cjkname(self):
         ## create file_node
         filename = '𩸽.txt'
@@ -646,3 +685,464 @@ class TestOSFAbortableResult(OsfTestCase):
         nt.assert_true(task.ready())
         mock_logger.error.assert_any_call('Failed to get task status! Exception message:')
         mock_logger.error.assert_any_call(msg)
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_rate(self):
+        now = [1000.0]
+        bucket = TokenBucket(30, clock=lambda: now[0])
+        nt.assert_equal(bucket.try_acquire(), 0)
+        nt.assert_almost_equal(bucket.try_acquire(), 2.0)
+        now[0] += 1.0
+        nt.assert_almost_equal(bucket.try_acquire(), 1.0)
+        now[0] += 1.0
+        nt.assert_equal(bucket.try_acquire(), 0)
+
+    def test_capacity(self):
+        now = [1000.0]
+        bucket = TokenBucket(60, capacity=3, clock=lambda: now[0])
+        now[0] += 100.0
+        for _ in range(3):
+            nt.assert_equal(bucket.try_acquire(), 0)
+        nt.assert_true(bucket.try_acquire() > 0)
+
+    def test_acquire_stopped(self):
+        bucket = TokenBucket(1)
+        nt.assert_true(bucket.acquire())
+        stop = threading.Event()
+        stop.set()
+        nt.assert_false(bucket.acquire(stop))
+
+
+class TestTimestampVerifyEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.rate_limiter = mock.Mock()
+        self.rate_limiter.acquire.return_value = True
+        self.file_list = [
+            {'file_id': 'hash{}'.format(i), 'provider': 'nextcloudinstitutions'}
+            for i in range(5)
+        ] + [
+            {'file_id': 'dl{}'.format(i), 'provider': 'osfstorage'}
+            for i in range(3)
+        ]
+
+    def _check_hash(self, uid, node, data, verify_external_only=False):
+        if data['file_id'].startswith('hash'):
+            return 'user', 'file_node', {'lane': 'hash'}
+        return 'user', 'file_node', None
+
+    @mock.patch('website.util.timestamp.check_file_timestamp_download')
+    @mock.patch('website.util.timestamp.check_file_timestamp_hash')
+    def test_lanes(self, mock_hash, mock_download):
+        mock_hash.side_effect = self._check_hash
+        mock_download.return_value = {'lane': 'download'}
+        progress = []
+        engine = TimestampVerifyEngine(1, mock.Mock(), workers=2, hash_workers=2,
+                                       rate_limiter=self.rate_limiter)
+        results = engine.run(self.file_list,
+                             progress_callback=lambda p, t: progress.append((p, t)))
+
+        nt.assert_equal(mock_hash.call_count, 8)
+        nt.assert_equal(mock_download.call_count, 3)
+        # only the download lane consumes the rate budget
+        nt.assert_equal(self.rate_limiter.acquire.call_count, 3)
+        nt.assert_equal(len([r for r in results if r['lane'] == 'hash']), 5)
+        nt.assert_equal(len([r for r in results if r['lane'] == 'download']), 3)
+        nt.assert_equal(progress[-1], (8, 8))
+
+    @mock.patch('website.util.timestamp.check_file_timestamp_download')
+    @mock.patch('website.util.timestamp.check_file_timestamp_hash')
+    def test_aborted(self, mock_hash, mock_download):
+        mock_hash.side_effect = self._check_hash
+        engine = TimestampVerifyEngine(1, mock.Mock(), rate_limiter=self.rate_limiter)
+        results = engine.run(self.file_list, is_aborted=lambda: True)
+        nt.assert_equal(results, [])
+
+    @mock.patch('website.util.timestamp.check_file_timestamp_download')
+    @mock.patch('website.util.timestamp.check_file_timestamp_hash')
+    def test_error(self, mock_hash, mock_download):
+        mock_hash.side_effect = self._check_hash
+        mock_download.side_effect = ValueError('download failed')
+        engine = TimestampVerifyEngine(1, mock.Mock(), rate_limiter=self.rate_limiter)
+        with nt.assert_raises(ValueError):
+            engine.run(self.file_list)
+
+
+class TestRfc3161(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        config, ca_file = setup_tsa(self.work_dir)
+        self.ca_certs = rfc3161.load_root_certificates(ca_file)
+        self.file_name = os.path.join(self.work_dir, 'data.bin')
+        with open(self.file_name, 'wb') as f:
+            f.write(b'timestamp data')
+        self.token = create_tokens(self.work_dir, config, [self.file_name])[0]
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_build_request(self):
+        digest = rfc3161.file_digest(self.file_name, 'sha256')
+        req = rfc3161.tsp.TimeStampReq.load(rfc3161.build_request(digest.hex(), 'sha256'))
+        nt.assert_equal(req['message_imprint']['hashed_message'].native, digest)
+        nt.assert_true(req['cert_req'].native)
+
+    def test_verify_file(self):
+        tst_info = rfc3161.verify_response_for_file(self.token, self.file_name, self.ca_certs)
+        nt.assert_is_not_none(tst_info['gen_time'].native)
+
+    def test_verify_modified_file(self):
+        with open(self.file_name, 'ab') as f:
+            f.write(b'modified')
+        with nt.assert_raises(rfc3161.TimestampVerifyError):
+            rfc3161.verify_response_for_file(self.token, self.file_name, self.ca_certs)
+
+    def test_verify_no_trusted_ca(self):
+        nt.assert_false(rfc3161.is_valid(
+            self.token, rfc3161.file_digest(self.file_name, 'sha512'), []))
+
+    def test_verify_broken_token(self):
+        with nt.assert_raises(rfc3161.TimestampVerifyError):
+            rfc3161.verify_response_for_file(b'broken', self.file_name, self.ca_certs)
+
+    def test_verify_only_tsa_certificate_trusted(self):
+        # the TSA certificate is not self-signed, so it is not a trust anchor
+        tsa_certs = rfc3161.load_root_certificates(os.path.join(self.work_dir, 'tsa.crt'))
+        with nt.assert_raises(rfc3161.TimestampVerifyError):
+            rfc3161.verify_response_for_file(self.token, self.file_name, tsa_certs)
+
+    def test_verify_expired_certificate(self):
+        tsa_cert = rfc3161.load_root_certificates(os.path.join(self.work_dir, 'tsa.crt'))[0]
+        now = datetime.datetime.now(pytz.utc)
+        rfc3161._verify_chain(tsa_cert, [], self.ca_certs, now=now)
+        with nt.assert_raises(rfc3161.TimestampVerifyError):
+            rfc3161._verify_chain(tsa_cert, [], self.ca_certs, now=now + datetime.timedelta(days=2))
+
+    def test_verify_issuer_not_ca(self):
+        work_dir = tempfile.mkdtemp()
+        try:
+            config, ca_file = setup_tsa(work_dir, ca_extensions='v3_not_ca')
+            token = create_tokens(work_dir, config, [self.file_name])[0]
+            with nt.assert_raises(rfc3161.TimestampVerifyError):
+                rfc3161.verify_response_for_file(
+                    token, self.file_name, rfc3161.load_root_certificates(ca_file))
+        finally:
+            shutil.rmtree(work_dir)
+
+    def test_signer_certificate_without_time_stamping_usage(self):
+        # `openssl ts -reply` refuses such a certificate, so only the certificate is checked
+        work_dir = tempfile.mkdtemp()
+        try:
+            setup_tsa(work_dir, tsa_extensions='v3_no_eku')
+            tsa_cert = rfc3161.load_root_certificates(os.path.join(work_dir, 'tsa.crt'))[0]
+            with nt.assert_raises(rfc3161.TimestampVerifyError):
+                rfc3161._check_signer_certificate(tsa_cert)
+        finally:
+            shutil.rmtree(work_dir)
+
+
+class TestStreamingDigest(unittest.TestCase):
+
+    def setUp(self):
+        self.file_node = mock.Mock(path='/test.txt')
+        self.file_node.generate_waterbutler_url.return_value = 'http://localhost:7777/download'
+
+    @mock.patch('website.util.waterbutler.requests.get')
+    def test_download_file_digest(self, mock_get):
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.iter_content.return_value = [b'hello ', b'world']
+        digests = waterbutler.download_file_digest('cookie', self.file_node, ['sha256', 'sha512'])
+        nt.assert_equal(digests['sha256'], hashlib.sha256(b'hello world').hexdigest())
+        nt.assert_equal(digests['sha512'], hashlib.sha512(b'hello world').hexdigest())
+        nt.assert_true(mock_get.call_args[1]['stream'])
+        nt.assert_equal(mock_get.return_value.close.call_count, 1)
+
+    @mock.patch('website.util.waterbutler.requests.get')
+    def test_download_file_digest_not_found(self, mock_get):
+        mock_get.return_value.status_code = 404
+        nt.assert_is_none(waterbutler.download_file_digest('cookie', self.file_node, ['sha512']))
+
+    @mock.patch('website.util.waterbutler.download_file_digest')
+    def test_streamed_hash_info(self, mock_digest):
+        mock_digest.return_value = {'sha512': 'abcd'}
+        hash_info = timestamp.StreamedHashInfo.download('cookie', self.file_node, 'sha512')
+        nt.assert_equal(hash_info.hash_type, 'sha512')
+        nt.assert_equal(hash_info.hash_value, 'abcd')
+        nt.assert_false(hash_info.has_timestamp)
+        nt.assert_false(hash_info.use_hash)
+
+    @mock.patch('website.util.timestamp.user_guid_to_id', return_value=1)
+    @mock.patch('website.util.timestamp.TimeStampTokenVerifyCheck.generate_verify_result')
+    @mock.patch('website.util.timestamp.TimeStampTokenVerifyCheck.timestamp_check_switch')
+    def test_streamed_hash_info_is_labeled_as_download(self, mock_switch, mock_generate, mock_user_id):
+        mock_switch.return_value = (api_settings.FILE_NOT_FOUND, None, None, None)
+        hash_info = timestamp.StreamedHashInfo('sha512', 'abcd')
+        timestamp.TimeStampTokenVerifyCheckHash.timestamp_check(
+            hash_info, 'abcde', {'file_id': 'abcde'}, 'pid')
+        use_hash = mock_generate.call_args[0][5]
+        nt.assert_false(use_hash)
+
+    def test_get_token_hash_type_without_token(self):
+        nt.assert_equal(timestamp.get_token_hash_type(None), 'sha512')
+        nt.assert_equal(timestamp.get_token_hash_type(mock.Mock(timestamp_token=b'broken')), 'sha512')
+
+
+class TestPendingTimestamp(OsfTestCase):
+
+    def setUp(self):
+        super(TestPendingTimestamp, self).setUp()
+        self.project = ProjectFactory()
+        self.user = self.project.creator
+        timestamp.create_rdmuserkey_info(
+            self.user.id, 'test_pub.pem', api_settings.PUBLIC_KEY_VALUE, datetime.datetime.now()
+        ).save()
+        self.file_info = {
+            'file_id': 'abcde',
+            'file_name': 'test.txt',
+            'file_path': '/test.txt',
+            'size': 1234,
+            'created': None,
+            'modified': None,
+            'version': '',
+            'provider': 'box',
+        }
+
+    def test_set_timestamp_pending(self):
+        timestamp.set_timestamp_pending(self.project, self.file_info, self.user.id, True)
+        self.file_info['size'] = 5678
+        timestamp.set_timestamp_pending(self.project, self.file_info, self.user.id, False)
+
+        verify_data = RdmFileTimestamptokenVerifyResult.objects.get(file_id='abcde')
+        nt.assert_equal(verify_data.inspection_result_status, api_settings.TIME_STAMP_TOKEN_PENDING)
+        nt.assert_equal(verify_data.upload_file_created_user, self.user.id)
+        nt.assert_equal(verify_data.upload_file_modified_user, self.user.id)
+        nt.assert_equal(verify_data.upload_file_size, 5678)
+        nt.assert_equal(verify_data.key_file_name, 'test_pub.pem')
+
+    @mock.patch('website.util.timestamp.add_token')
+    def test_add_pending_timestamps(self, mock_add_token):
+        timestamp.set_timestamp_pending(self.project, self.file_info, self.user.id, True)
+        timestamp.celery_add_pending_timestamps(self.project.id)
+
+        nt.assert_equal(mock_add_token.call_count, 1)
+        uid, node, file_info = mock_add_token.call_args[0]
+        nt.assert_equal(uid, self.user.id)
+        nt.assert_equal(file_info['file_id'], 'abcde')
+        nt.assert_equal(file_info['file_path'], '/test.txt')
+        nt.assert_equal(file_info['provider'], 'box')
+        verify_data = RdmFileTimestamptokenVerifyResult.objects.get(file_id='abcde')
+        nt.assert_equal(verify_data.inspection_result_status, api_settings.TIME_STAMP_TOKEN_UNCHECKED)
+
+        # nothing is pending
+        timestamp.celery_add_pending_timestamps(self.project.id)
+        nt.assert_equal(mock_add_token.call_count, 1)
+
+    def test_set_timestamp_pending_keeps_token(self):
+        timestamp.set_timestamp_pending(self.project, self.file_info, self.user.id, True)
+        RdmFileTimestamptokenVerifyResult.objects.filter(file_id='abcde').update(
+            timestamp_token=b'token', inspection_result_status=api_settings.TIME_STAMP_TOKEN_CHECK_SUCCESS)
+        timestamp.set_timestamp_pending(self.project, self.file_info, self.user.id, False)
+        verify_data = RdmFileTimestamptokenVerifyResult.objects.get(file_id='abcde')
+        nt.assert_equal(bytes(verify_data.timestamp_token), b'token')
+        nt.assert_equal(verify_data.inspection_result_status, api_settings.TIME_STAMP_TOKEN_PENDING)
+
+    @mock.patch('website.util.timestamp.celery_add_pending_timestamps.apply_async')
+    @mock.patch('website.util.timestamp.add_token')
+    def test_add_pending_timestamps_event_while_processing(self, mock_add_token, mock_apply_async):
+        def add_token(uid, node, file_info):
+            # the file is claimed, but not locked
+            verify_data = RdmFileTimestamptokenVerifyResult.objects.get(file_id='abcde')
+            nt.assert_equal(verify_data.inspection_result_status, api_settings.TIME_STAMP_TOKEN_PROCESSING)
+            self.file_info['size'] = 5678
+            timestamp.set_timestamp_pending(self.project, self.file_info, self.user.id, False)
+            # overwritten by the result of the timestamp
+            verify_data.inspection_result_status = api_settings.TIME_STAMP_TOKEN_CHECK_SUCCESS
+            timestamp.save_verify_result(verify_data)
+        mock_add_token.side_effect = add_token
+        timestamp.set_timestamp_pending(self.project, self.file_info, self.user.id, True)
+        timestamp.celery_add_pending_timestamps(self.project.id)
+
+        verify_data = RdmFileTimestamptokenVerifyResult.objects.get(file_id='abcde')
+        nt.assert_equal(verify_data.inspection_result_status, api_settings.TIME_STAMP_TOKEN_PENDING)
+        nt.assert_equal(mock_apply_async.call_count, 1)
+
+    @mock.patch('website.util.timestamp.add_token')
+    def test_add_pending_timestamps_error(self, mock_add_token):
+        mock_add_token.side_effect = Exception('TSA error')
+        timestamp.set_timestamp_pending(self.project, self.file_info, self.user.id, True)
+        timestamp.celery_add_pending_timestamps(self.project.id)
+
+        verify_data = RdmFileTimestamptokenVerifyResult.objects.get(file_id='abcde')
+        nt.assert_equal(verify_data.inspection_result_status, api_settings.TIME_STAMP_TOKEN_NO_DATA)
+
+
+class TestReconcileExternalFiles(OsfTestCase):
+
+    def setUp(self):
+        super(TestReconcileExternalFiles, self).setUp()
+        self.project = ProjectFactory()
+        self.user = self.project.creator
+
+    def metadata(self, path):
+        return {
+            'kind': 'file',
+            'name': os.path.basename(path),
+            'path': path,
+            'materialized': path,
+            'size': 100,
+            'created_utc': None,
+            'modified_utc': None,
+            'modified': None,
+            'etag': path,
+            'extra': {},
+        }
+
+    def get_node_info(self, cookie, pid, provider, path):
+        if path == '/dir/':
+            return {'data': [{'attributes': self.metadata(p)} for p in ('/dir/a.txt', '/dir/b.txt')]}
+        if path == '/top.txt':
+            return {'data': {'attributes': self.metadata(path)}}
+        return None
+
+    @mock.patch('website.util.timestamp.transaction.on_commit', side_effect=lambda func: func())
+    @mock.patch('website.util.timestamp.celery_check_external_files')
+    def test_reconcile_external_files(self, mock_task, mock_on_commit):
+        existing = BaseFileNode.resolve_class('box', BaseFileNode.FILE).get_or_create(self.project, '/dir/a.txt')
+        changes = {'/dir/a.txt': self.user.id, '/dir/b.txt': None, '/top.txt': None, '/gone.txt': None}
+        with mock.patch.object(waterbutler, 'get_node_info', side_effect=self.get_node_info) as mock_info:
+            items = timestamp.reconcile_external_files(self.project, 'box', self.user, changes)
+        # one listing of /dir/ and one request per file for the others
+        nt.assert_equal(sorted(c[0][3] for c in mock_info.call_args_list), ['/dir/', '/gone.txt', '/top.txt'])
+
+        items = dict((item['path'], item) for item in items)
+        nt.assert_equal(sorted(items.keys()), ['/dir/a.txt', '/dir/b.txt', '/top.txt'])
+        nt.assert_false(items['/dir/a.txt']['created'])
+        nt.assert_equal(items['/dir/a.txt']['file_info']['file_id'], existing._id)
+        nt.assert_equal(items['/dir/a.txt']['user_id'], self.user.id)
+        nt.assert_true(items['/dir/b.txt']['created'])
+        file_node = BaseFileNode.objects.get(_id=items['/dir/b.txt']['file_info']['file_id'])
+        nt.assert_equal(file_node.name, 'b.txt')
+        nt.assert_equal(file_node.target, self.project)
+
+        nt.assert_equal(mock_task.apply_async.call_count, 1)
+        node_id, provider, admin_id, task_items = mock_task.apply_async.call_args[0][0]
+        nt.assert_equal((node_id, provider, admin_id), (self.project.id, 'box', self.user.id))
+        nt.assert_equal(len(task_items), 3)
+
+    @mock.patch('website.util.timestamp.add_token')
+    @mock.patch('website.util.timestamp.check_file_timestamp')
+    def test_check_external_files(self, mock_check, mock_add_token):
+        self.project.add_addon('box', auth=Auth(self.user))
+        mock_check.side_effect = [
+            {'verify_result': api_settings.TIME_STAMP_TOKEN_CHECK_SUCCESS},
+            {'verify_result': api_settings.TIME_STAMP_TOKEN_CHECK_NG},
+        ]
+        mock_add_token.return_value = {}
+        items = [
+            {'path': path, 'user_id': None, 'created': True, 'file_info': {'file_id': path}}
+            for path in ('/a.txt', '/b.txt')
+        ]
+        with mock.patch('addons.box.models.NodeSettings.create_waterbutler_log') as mock_log:
+            timestamp.celery_check_external_files(self.project.id, 'box', self.user.id, items)
+        # only the file changed outside of GRDM
+        nt.assert_equal(mock_add_token.call_count, 1)
+        nt.assert_equal(mock_add_token.call_args[0][2], {'file_id': '/b.txt'})
+        mock_log.assert_called_once_with(None, 'file_added', {'path': '/b.txt', 'materialized': '/b.txt'})
+
+
+class TestFileInventory(OsfTestCase):
+
+    def setUp(self):
+        super(TestFileInventory, self).setUp()
+        self.project = ProjectFactory()
+        self.user = self.project.creator
+        self.file_node = create_test_file(node=self.project, user=self.user, filename='test.txt')
+
+    def attributes(self, **kwargs):
+        attributes = {
+            'kind': 'file',
+            'name': 'test.txt',
+            'path': '/' + self.file_node._id,
+            'materialized': '/test.txt',
+            'size': 1337,
+            'created_utc': '2020-01-01T00:00:00+00:00',
+            'modified_utc': '2020-01-01T00:00:00+00:00',
+            'etag': 'etag1',
+            'extra': {'version': 1},
+        }
+        attributes.update(kwargs)
+        return attributes
+
+    def test_reconcile_file_inventory(self):
+        timestamp.reconcile_file_inventory(self.project, 'osfstorage', [self.attributes()])
+        item = TimestampFileInventory.objects.get(node=self.project, provider='osfstorage')
+        nt.assert_equal(item.file_id, self.file_node._id)
+        nt.assert_equal(item.materialized_path, '/test.txt')
+        nt.assert_equal(item.version, '1')
+
+        # unchanged files are not saved again
+        with mock.patch('osf.models.BaseFileNode.save') as mock_save:
+            timestamp.reconcile_file_inventory(self.project, 'osfstorage', [self.attributes()])
+            nt.assert_equal(mock_save.call_count, 0)
+
+        timestamp.reconcile_file_inventory(self.project, 'osfstorage', [self.attributes(size=2000)])
+        nt.assert_equal(TimestampFileInventory.objects.get(id=item.id).size, 2000)
+
+        timestamp.reconcile_file_inventory(self.project, 'osfstorage', [])
+        nt.assert_false(TimestampFileInventory.objects.filter(node=self.project).exists())
+
+    def test_get_file_inventory_list_changed_only(self):
+        timestamp.reconcile_file_inventory(self.project, 'osfstorage', [self.attributes()])
+        RdmFileTimestamptokenVerifyResult.objects.create(
+            file_id=self.file_node._id, project_id=self.project._id, provider='osfstorage',
+            path='/test.txt', key_file_name='test_pub.pem',
+            inspection_result_status=api_settings.TIME_STAMP_TOKEN_CHECK_SUCCESS,
+            verify_date=timezone.now())
+        since = timezone.now() - datetime.timedelta(minutes=1)
+        file_list = timestamp.get_file_inventory_list(self.project, 'osfstorage', changed_only=True)
+        nt.assert_equal([f['file_id'] for f in file_list], [self.file_node._id])
+
+        timestamp.mark_file_inventory_verified(self.project, [self.file_node._id], since)
+        nt.assert_equal(timestamp.get_file_inventory_list(self.project, 'osfstorage', changed_only=True), [])
+        nt.assert_equal(len(timestamp.get_file_inventory_list(self.project, 'osfstorage')), 1)
+
+        # modified after the verification
+        timestamp.update_file_inventory(
+            self.project, dict(self.attributes(etag='etag2'), provider='osfstorage'))
+        file_list = timestamp.get_file_inventory_list(self.project, 'osfstorage', changed_only=True)
+        nt.assert_equal(len(file_list), 1)
+
+    def test_update_file_inventory_before_crawl(self):
+        timestamp.update_file_inventory(
+            self.project, dict(self.attributes(), provider='osfstorage'))
+        nt.assert_false(TimestampFileInventory.objects.filter(node=self.project).exists())
+
+    def test_file_inventory_moved(self):
+        timestamp.reconcile_file_inventory(self.project, 'osfstorage', [
+            self.attributes(materialized='/folder/test.txt')])
+        timestamp.file_inventory_moved(
+            self.project, 'osfstorage', 'osfstorage', '/folder/', '/renamed/',
+            {'kind': 'folder', 'provider': 'osfstorage'})
+        item = TimestampFileInventory.objects.get(node=self.project)
+        nt.assert_equal(item.materialized_path, '/renamed/test.txt')
+        nt.assert_equal(item.file_id, self.file_node._id)
+
+    def test_file_inventory_moved_file(self):
+        other_file_node = create_test_file(node=self.project, user=self.user, filename='test.txt.bak')
+        timestamp.reconcile_file_inventory(self.project, 'osfstorage', [
+            self.attributes(),
+            self.attributes(name='test.txt.bak', path='/' + other_file_node._id,
+                            materialized='/test.txt.bak'),
+        ])
+        timestamp.file_inventory_moved(
+            self.project, 'osfstorage', 'osfstorage', '/test.txt', '/renamed.txt',
+            {'kind': 'file', 'provider': 'osfstorage'})
+        paths = dict(TimestampFileInventory.objects.filter(
+            node=self.project).values_list('file_id', 'materialized_path'))
+        nt.assert_equal(paths, {
+            self.file_node._id: '/renamed.txt',
+            other_file_node._id: '/test.txt.bak',
+        })
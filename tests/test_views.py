@@ -5921,6 +5921,38 @@ class TestTimestampView(OsfTestCase):
         assert 'class="creator_name" value="Freddie Mercury' in res
         assert 'class="creator_email" value="freddiemercury' in res
 
+    @mock.patch('website.util.timestamp.ERROR_LIST_PAGE_SIZE', 2)
+    @mock.patch('website.project.views.node.find_bookmark_collection')
+    def test_get_init_timestamp_error_data_list_first_page(self, mock_collection):
+        res = self.app.get(self.project.url + 'timestamp/', auth=self.user.auth)
+        assert_equal(res.status_code, 200)
+
+        assert 'osfstorage_test_file2.status_3' in res
+        assert 'osfstorage_test_file3.status_3' in res
+        assert 's3_test_file1.status_3' not in res
+        assert 'data-num-pages="2"' in res
+
+    def test_timestamp_error_list(self):
+        url = self.project.api_url + 'timestamp/error_list/'
+        res = self.app.get(url, {'page': 2, 'page_size': 2}, auth=self.user.auth)
+        assert_equal(res.status_code, 200)
+        assert_equal(res.json['count'], 3)
+        assert_equal(res.json['num_pages'], 2)
+        assert_equal(res.json['page'], 2)
+        assert_equal(len(res.json['provider_list']), 1)
+        assert_equal(res.json['provider_list'][0]['provider'], 's3')
+        assert_in('s3_test_file1.status_3', res.json['provider_list'][0]['error_list'][0]['file_path'])
+
+    def test_timestamp_error_list_csv(self):
+        url = self.project.api_url + 'timestamp/error_list/csv/'
+        res = self.app.get(url, auth=self.user.auth)
+        assert_equal(res.status_code, 200)
+        lines = res.body.decode().splitlines()
+        assert_equal(len(lines), 4)
+        assert_true(lines[0].startswith('provider,file_id,file_path'))
+        assert_in('s3_test_file1.status_3', lines[3])
+        assert_equal(self.project.logs.latest().action, NodeLog.TIMESTAMP_ERRORS_DOWNLOADED)
+
     @mock.patch('website.project.views.node.find_bookmark_collection')
     def test_timestamp_no_verify_user(self, mock_collection):
         ts_list = RdmFileTimestamptokenVerifyResult.objects.filter(
@@ -5987,7 +6019,7 @@ class TestTimestampView(OsfTestCase):
         assert 'osfstorage_test_file3.status_3' not in res
         assert 's3_test_file1.status_3' in res
 
-    @mock.patch('website.util.timestamp.check_file_timestamp')
+    @mock.patch('website.util.timestamp.check_file_timestamp_hash')
     @mock.patch('website.util.timestamp.get_full_list')
     @mock.patch('celery.contrib.abortable.AbortableTask.is_aborted')
     @mock.patch('website.util.waterbutler.shutil')
@@ -5995,6 +6027,7 @@ class TestTimestampView(OsfTestCase):
     def test_verify_timestamp_token(self, mock_get, mock_shutil, mock_aborted, mock_getfulllist, mock_checkfilets):
         mock_get.return_value.content = ''
         mock_aborted.return_value = False
+        mock_checkfilets.return_value = (None, None, {'verify_result': 1})
         mock_getfulllist.return_value = [
             {
                 'provider': 'osfstorage',
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""A throwaway CA and TSA created with openssl, for the tests and the
+benchmark of the timestamp backends (see website.util.rfc3161).
+"""
+import os
+import shlex
+import subprocess
+
+from website.util import rfc3161
+
+
+TSA_CONFIG = """
+[ tsa ]
+default_tsa = tsa_config1
+
+[ tsa_config1 ]
+dir = {dir}
+serial = $dir/serial
+crypto_device = builtin
+signer_cert = $dir/tsa.crt
+certs = $dir/ca.crt
+signer_key = $dir/tsa.key
+signer_digest = sha256
+default_policy = 1.2.3.4.1
+digests = sha256, sha512
+accuracy = secs:1
+ess_cert_id_alg = sha256
+
+[ v3_ca ]
+basicConstraints = critical,CA:TRUE
+keyUsage = critical,keyCertSign,cRLSign
+
+[ v3_not_ca ]
+basicConstraints = critical,CA:FALSE
+
+[ v3_tsa ]
+basicConstraints = CA:FALSE
+extendedKeyUsage = critical,timeStamping
+keyUsage = critical,digitalSignature
+
+[ v3_no_eku ]
+basicConstraints = CA:FALSE
+keyUsage = critical,digitalSignature
+"""
+
+
+def run(cmd):
+    process = subprocess.Popen(
+        shlex.split(cmd), shell=False, stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout_data, stderr_data = process.communicate()
+    return stdout_data
+
+
+def setup_tsa(work_dir, ca_extensions='v3_ca', tsa_extensions='v3_tsa'):
+    config = os.path.join(work_dir, 'tsa.cnf')
+    with open(config, 'w') as f:
+        f.write(TSA_CONFIG.format(dir=work_dir))
+    with open(os.path.join(work_dir, 'serial'), 'w') as f:
+        f.write('01\n')
+    path = lambda name: os.path.join(work_dir, name)
+    run('openssl req -x509 -newkey rsa:2048 -nodes -days 1 -subj /CN=TestCA '
+        '-keyout {} -out {} -config {} -extensions {}'.format(
+            path('ca.key'), path('ca.crt'), config, ca_extensions))
+    run('openssl req -newkey rsa:2048 -nodes -subj /CN=TestTSA '
+        '-keyout {} -out {}'.format(path('tsa.key'), path('tsa.csr')))
+    run('openssl x509 -req -days 1 -in {} -CA {} -CAkey {} -CAcreateserial -out {} '
+        '-extfile {} -extensions {}'.format(
+            path('tsa.csr'), path('ca.crt'), path('ca.key'), path('tsa.crt'), config, tsa_extensions))
+    return config, path('ca.crt')
+
+
+def create_tokens(work_dir, config, files):
+    tokens = []
+    tsq = os.path.join(work_dir, 'request.tsq')
+    tsr = os.path.join(work_dir, 'response.tsr')
+    for file_name in files:
+        with open(tsq, 'wb') as f:
+            f.write(rfc3161.build_request_for_file(file_name, 'sha512'))
+        run('openssl ts -reply -config {} -queryfile {} -out {}'.format(config, tsq, tsr))
+        with open(tsr, 'rb') as f:
+            tokens.append(f.read())
+    return tokens
@@ -30,7 +30,7 @@ def on_node_updated(node_id, user_id, first_save, saved_fields, request_headers=
         need_update = False
 
     if need_update:
-        node.update_search()
+        node.update_search(saved_fields=saved_fields)
         update_node_share(node)
         update_collecting_metadata(node, saved_fields)
 
@@ -72,6 +72,7 @@ from nii.mapcore_api import MAPCoreException
 from nii.mapcore import (mapcore_sync_is_enabled,
                          mapcore_log_error,
                          mapcore_sync_rdm_project_or_map_group,
+                         mapcore_request_sync_rdm_project_or_map_group,
                          mapcore_sync_map_group)
 
 r_strip_html = lambda collection: rapply(collection, strip_html)
@@ -781,7 +782,10 @@ def _view_project(node, auth, primary=False,
 
     user = auth.user
 
-    if mapcore_sync_is_enabled():
+    if mapcore_sync_is_enabled() and settings.MAPCORE_SYNC_IN_BACKGROUND:
+        if auth.user:
+            mapcore_request_sync_rdm_project_or_map_group(auth.user, node)
+    elif mapcore_sync_is_enabled():
         try:
             mapcore_sync_rdm_project_or_map_group(auth.user, node)
         except MAPCoreException as e:
@@ -3,7 +3,7 @@
 Timestamp views.
 """
 import logging
-from flask import request
+from flask import request, Response, stream_with_context
 from website.util import rubeus
 from website.project.decorators import must_be_contributor_or_public
 from website.project.views.node import _view_project
@@ -20,13 +20,40 @@ def get_init_timestamp_error_data_list(auth, node, **kwargs):
     ctx = _view_project(node, auth, primary=True)
     ctx.update(rubeus.collect_addon_assets(node))
     pid = kwargs.get('pid')
-    ctx['provider_list'] = timestamp.get_error_list(pid)
+    error_list_page = timestamp.get_error_list_page(pid)
+    ctx['provider_list'] = error_list_page['provider_list']
+    ctx['error_list_page'] = error_list_page
+    ctx['error_list_users'] = timestamp.get_error_list_users(pid)
     ctx['project_title'] = node.title
     ctx['guid'] = pid
     ctx['web_api_url'] = settings.DOMAIN + node.api_url
     ctx['async_task'] = timestamp.get_async_task_data(node)
     return ctx
 
+@must_be_contributor_or_public
+def get_timestamp_error_list(auth, node, **kwargs):
+    """get one page of the timestamp error list
+    """
+    return timestamp.get_error_list_page(
+        node._id,
+        page=request.args.get('page', 1),
+        page_size=request.args.get('page_size'),
+        **timestamp.get_error_list_filters(request.args)
+    )
+
+@must_be_contributor_or_public
+def export_timestamp_error_list_csv(auth, node, **kwargs):
+    """stream the timestamp error list as CSV
+    """
+    response = Response(
+        stream_with_context(timestamp.iter_error_list_csv(
+            node._id, **timestamp.get_error_list_filters(request.args))),
+        mimetype='text/csv'
+    )
+    response.headers['Content-Disposition'] = 'attachment; filename="timestamp_errors_{}.csv"'.format(node._id)
+    timestamp.add_log_download_errors(node, auth.user.id, {'file_format': 'CSV'})
+    return response
+
 @must_be_contributor_or_public
 def verify_timestamp_token(auth, node, **kwargs):
     async_task = timestamp.celery_verify_timestamp_token.delay(auth.user.id, node.id)
@@ -1962,6 +1962,24 @@ def make_url_map(app):
             project_views.timestamp.task_status,
             json_renderer,
         ),
+        Rule(
+            [
+                '/project/<pid>/timestamp/error_list/',
+                '/project/<pid>/node/<nid>/timestamp/error_list/',
+            ],
+            ['get'],
+            project_views.timestamp.get_timestamp_error_list,
+            json_renderer,
+        ),
+        Rule(
+            [
+                '/project/<pid>/timestamp/error_list/csv/',
+                '/project/<pid>/node/<nid>/timestamp/error_list/csv/',
+            ],
+            ['get'],
+            project_views.timestamp.export_timestamp_error_list_csv,
+            json_renderer,
+        ),
         Rule(
             [
                 '/project/<pid>/timestamp/download_errors/',
@@ -5,9 +5,13 @@ from __future__ import division
 
 import copy
 import functools
+import hashlib
+import json
 import logging
 import math
 import re
+import threading
+import time
 from framework import sentry
 import os.path
 
@@ -18,6 +22,7 @@ from django.db.models import Q
 from elasticsearch2 import (ConnectionError, Elasticsearch, NotFoundError,
                            RequestError, TransportError, helpers)
 from framework.celery_tasks import app as celery_app
+from framework.celery_tasks.handlers import enqueue_task
 from framework.database import paginated
 from osf.models import AbstractNode
 from osf.models import OSFUser
@@ -58,6 +63,20 @@ HIGHLIGHT_PRIORITY = ('ngram', HIGHLIGHT_PRIORITY_DEFAULT_FIELD)
 # True: use ALIASES_COMMENT
 ENABLE_DOC_TYPE_COMMENT = False
 
+# Node fields denormalized into the file documents (see update_file)
+FILE_SEARCH_UPDATE_FIELDS = {
+    'title',
+    'is_public',
+    'is_deleted',
+    'deleted',
+    'spam_status',
+    'archiving',
+    'retraction',
+    'parent',
+    'tags',
+    'contributors',
+}
+
 # These are the doc_types that exist in the search database
 # If changes of ALIASES text happen, please change js_messages.js text as well.
 ALIASES_BASE = {
@@ -206,8 +225,8 @@ def requires_search(func):
     return wrapped
 
 
-@requires_search
-def get_aggregations(query, index, doc_type):
+def _aggregations_query(query):
+    query = dict(query, size=0)
     query['aggregations'] = {
         'licenses': {
             'terms': {
@@ -215,8 +234,10 @@ def get_aggregations(query, index, doc_type):
             }
         }
     }
+    return query
+
 
-    res = client().search(index=index, doc_type=doc_type, search_type='count', body=query)
+def _parse_aggregations(res):
     ret = {
         doc_type: {
             item['key']: item['doc_count']
@@ -228,8 +249,8 @@ def get_aggregations(query, index, doc_type):
     return ret
 
 
-@requires_search
-def get_counts(count_query, index, clean=True):
+def _counts_query(count_query):
+    count_query = dict(count_query, size=0)
     count_query['aggregations'] = {
         'counts': {
             'terms': {
@@ -237,26 +258,113 @@ def get_counts(count_query, index, clean=True):
             }
         }
     }
+    return count_query
 
-    res = client().search(index=index, doc_type=None, search_type='count', body=count_query)
+
+def _parse_counts(res):
     counts = {x['key']: x['doc_count'] for x in res['aggregations']['counts']['buckets'] if x['key'] in ALIASES.keys()}
 
     counts['total'] = sum([val for val in counts.values()])
     return counts
 
 
-@requires_search
-def get_tags(query, index):
+def _tags_query(query):
+    query = dict(query, size=0)
     query['aggregations'] = {
         'tag_cloud': {
             'terms': {'field': 'tags'}
         }
     }
+    return query
+
+
+def _parse_tags(res):
+    return res['aggregations']['tag_cloud']['buckets']
+
+
+@requires_search
+def get_aggregations(query, index, doc_type):
+    res = client().search(index=index, doc_type=doc_type, body=_aggregations_query(query))
+    return _parse_aggregations(res)
+
+
+@requires_search
+def get_counts(count_query, index, clean=True):
+    res = client().search(index=index, doc_type=None, body=_counts_query(count_query))
+    return _parse_counts(res)
+
+
+@requires_search
+def get_tags(query, index):
+    res = client().search(index=index, doc_type=None, body=_tags_query(query))
+    return _parse_tags(res)
+
+
+def multi_search(index, requests):
+    """Run several searches on one index in a single _msearch round trip.
+
+    :param requests: list of (doc_type, body)
+    :return: list of responses in the same order as requests
+    """
+    body = []
+    for doc_type, request_body in requests:
+        header = {'index': index}
+        if doc_type:
+            header['type'] = doc_type.split(',')
+        body.append(header)
+        body.append(request_body)
+    responses = client().msearch(body=body)['responses']
+    for res in responses:
+        # errors of each search are not raised by msearch itself
+        if 'error' in res:
+            error = res['error']
+            error_type = error.get('type') if isinstance(error, dict) else error
+            status = res.get('status', 400)
+            if status == 404:
+                raise NotFoundError(status, error_type, res)
+            raise RequestError(status, error_type, res)
+    return responses
+
+
+def _without_filter(query):
+    """Returns a copy of query without query.filtered.filter
+    (only the modified levels are copied)."""
+    try:
+        filtered = query['query']['filtered']
+    except (KeyError, TypeError):
+        return dict(query)
+    if 'filter' not in filtered:
+        return dict(query)
+    filtered = {k: v for k, v in filtered.items() if k != 'filter'}
+    return dict(query, query=dict(query['query'], filtered=filtered))
+
+
+def search_cache():
+    from django.core.cache import caches
+    from api.base.settings import SEARCH_RESULT_CACHE_NAME
+    return caches[SEARCH_RESULT_CACHE_NAME]
+
 
-    results = client().search(index=index, doc_type=None, body=query)
-    tags = results['aggregations']['tag_cloud']['buckets']
+def search_cache_key(query, index, doc_type, raw, ext):
+    key = json.dumps([query, index, doc_type, raw, ext], sort_keys=True)
+    return 'search:{}'.format(hashlib.sha256(key.encode('utf-8')).hexdigest())
 
-    return tags
+
+def is_cacheable_search(index):
+    """Only the results of the public index are the same for every user."""
+    return settings.SEARCH_RESULT_CACHE_TIMEOUT > 0 and \
+        not index.startswith(settings.ELASTIC_INDEX_PRIVATE_PREFIX)
+
+
+def log_search_timing(timings, index, doc_type):
+    total = sum(elapsed for _, elapsed in timings)
+    message = 'search index={} doc_type={} total={:.3f}s {}'.format(
+        index, doc_type, total,
+        ' '.join('{}={:.3f}s'.format(phase, elapsed) for phase, elapsed in timings))
+    if total >= settings.SEARCH_SLOW_LOG_THRESHOLD:
+        logger.warning(message)
+    else:
+        logger.debug(message)
 
 
 def get_query_string(query):
@@ -302,6 +410,7 @@ def search(query, index=None, doc_type=None, raw=False, normalize=True, private=
     """
     global ALIASES
 
+    started = time.time()
     ALIASES = copy.deepcopy(ALIASES_BASE)
     if settings.ENABLE_PRIVATE_SEARCH and ext:
         ALIASES.update(ALIASES_EXT)
@@ -345,28 +454,34 @@ def search(query, index=None, doc_type=None, raw=False, normalize=True, private=
             q = convert_query_string(q, normalize=normalize)
             query['query']['bool']['should'][0]['query_string']['query'] = q
 
-    tag_query = copy.deepcopy(query)
-
-    for key in ['from', 'size', 'sort', 'highlight']:
-        try:
-            del tag_query[key]
-        except KeyError:
-            pass
-
-    aggs_query = copy.deepcopy(tag_query)
-    count_query = copy.deepcopy(tag_query)
-
-    tags = get_tags(tag_query, index)
-    try:
-        del aggs_query['query']['filtered']['filter']
-        del count_query['query']['filtered']['filter']
-    except KeyError:
-        pass
-    aggregations = get_aggregations(aggs_query, index, doc_type)
-    counts = get_counts(count_query, index)
-
-    # Run the real query and get the results
-    raw_results = client().search(index=index, doc_type=doc_type, body=query)
+    timings = [('prepare', time.time() - started)]
+    cache_key = None
+    if is_cacheable_search(index):
+        cache_key = search_cache_key(query, index, doc_type, raw, ext)
+        cached = search_cache().get(cache_key)
+        if cached is not None:
+            return cached
+
+    started = time.time()
+
+    tag_query = {key: val for key, val in query.items()
+                 if key not in ('from', 'size', 'sort', 'highlight')}
+    count_query = _without_filter(tag_query)
+
+    # tags, aggregations, counts and the real query in one round trip
+    responses = multi_search(index, [
+        (None, _tags_query(tag_query)),
+        (doc_type, _aggregations_query(count_query)),
+        (None, _counts_query(count_query)),
+        (doc_type, query),
+    ])
+    timings.append(('es', time.time() - started))
+    started = time.time()
+
+    tags = _parse_tags(responses[0])
+    aggregations = _parse_aggregations(responses[1])
+    counts = _parse_counts(responses[2])
+    raw_results = responses[3]
 
     if raw:
         results = raw_results['hits']['hits']
@@ -376,6 +491,8 @@ def search(query, index=None, doc_type=None, raw=False, normalize=True, private=
         hits = set_last_comment(hits)
         results = [hit['_source'] for hit in hits]
         results = format_results(results)
+    timings.append(('format', time.time() - started))
+    log_search_timing(timings, index, doc_type)
 
     return_value = {
         'results': results,
@@ -385,6 +502,9 @@ def search(query, index=None, doc_type=None, raw=False, normalize=True, private=
         'typeAliases': ALIASES
     }
 
+    if cache_key:
+        search_cache().set(cache_key, return_value, settings.SEARCH_RESULT_CACHE_TIMEOUT)
+
     return return_value
 
 def highlight_priority_check(a, b):
@@ -423,40 +543,73 @@ def merge_highlight(hits):
         hit['_source']['highlight'] = merged_highlight
     return hits
 
+def _highlight_comment_id(key):
+    if not key.startswith('comments.'):
+        return None
+    try:
+        return int(key.split('.')[1])
+    except Exception:
+        return None  # unexpected type, ignore
+
 def set_last_comment(hits):
+    comment_ids = set()
+    for hit in hits:
+        for key in hit['_source']['highlight'].keys():
+            comment_id = _highlight_comment_id(key)
+            if comment_id is not None:
+                comment_ids.add(comment_id)
+
+    # load the comments, the comments replied to and their users in bulk
+    comments = {}
+    replyto_comments = {}
+    users = {}
+    comment_content_type = ContentType.objects.get_for_model(Comment)
+
+    def is_reply(comment):
+        return comment.target is not None and \
+            comment.target.content_type_id == comment_content_type.id
+
+    if comment_ids:
+        comments = {c.id: c for c in Comment.objects.filter(id__in=comment_ids).select_related('target')}
+        replyto_ids = set(c.target.object_id for c in comments.values() if is_reply(c))
+        if replyto_ids:
+            replyto_comments = {c.id: c for c in Comment.objects.filter(id__in=replyto_ids)}
+        user_ids = set(c.user_id for c in list(comments.values()) + list(replyto_comments.values()))
+        users = {u.id: u for u in OSFUser.objects.filter(id__in=user_ids)}
+
     for hit in hits:
         s = hit['_source']
         highlight = s['highlight']
         last_comment = None
         last_text = None
         for key, value in highlight.items():
-            if not key.startswith('comments.'):
+            c = comments.get(_highlight_comment_id(key))
+            if c is None:
                 continue
-            try:
-                comment_id = int(key.split('.')[1])
-            except Exception:
-                continue  # unexpected type, ignore
-            c = Comment.objects.get(id=comment_id)
             if last_comment is None or c.created > last_comment.created:
                 last_comment = c
                 last_text = value[0]
         if last_comment is None:
             s['comment'] = None
             continue  # no comment, skip
+        user = users.get(last_comment.user_id)
         d = {}
         d['text'] = last_text
-        d['user_id'] = last_comment.user._id
-        d['user_name'] = last_comment.user.fullname
+        d['user_id'] = user._id if user else None
+        d['user_name'] = user.fullname if user else None
         d['date_created'] = last_comment.created.isoformat()
         d['date_modified'] = last_comment.modified.isoformat()
         replyto_user_id = None
         replyto_username = None
         replyto_date_created = None
         replyto_date_modified = None
-        replyto = last_comment.target.referent
-        if isinstance(replyto, Comment):
-            replyto_user_id = replyto.user._id
-            replyto_username = replyto.user.fullname
+        replyto = None
+        if is_reply(last_comment):
+            replyto = replyto_comments.get(last_comment.target.object_id)
+        if replyto is not None:
+            replyto_user = users.get(replyto.user_id)
+            replyto_user_id = replyto_user._id if replyto_user else None
+            replyto_username = replyto_user.fullname if replyto_user else None
             replyto_date_created = replyto.created.isoformat()
             replyto_date_modified = replyto.modified.isoformat()
         d['replyto_user_id'] = replyto_user_id
@@ -466,25 +619,141 @@ def set_last_comment(hits):
         s['comment'] = d
     return hits
 
-def get_file_path(file_id):
+_provider_names = {}
+
+def provider_display_name(provider):
+    name = _provider_names.get(provider)
+    if name is None:
+        app_config = settings.ADDONS_AVAILABLE_DICT.get(provider)
+        name = app_config.full_name if app_config else provider
+        _provider_names[provider] = name
+    return name
+
+def get_file_path(file_id, file_paths=None):
+    if file_paths is not None:
+        return file_paths.get(file_id)
     file_node = BaseFileNode.load(file_id)
     if file_node is None:
         return None
-    app_config = settings.ADDONS_AVAILABLE_DICT.get(file_node.provider)
-    if app_config:
-        provider_name = app_config.full_name
-    else:
-        provider_name = file_node.provider
-    return u'{}{}'.format(provider_name, file_node.materialized_path)
+    return u'{}{}'.format(provider_display_name(file_node.provider), file_node.materialized_path)
+
+def get_file_paths(file_ids):
+    """Returns {file_id: path} of the files by a few queries."""
+    from addons.osfstorage.models import OsfStorageFileNode
+
+    file_nodes = list(BaseFileNode.objects.filter(_id__in=file_ids))
+    osfstorage_paths = OsfStorageFileNode.get_materialized_paths(
+        [f for f in file_nodes if isinstance(f, OsfStorageFileNode)])
+    return {
+        f._id: u'{}{}'.format(
+            provider_display_name(f.provider),
+            osfstorage_paths[f.pk] if f.pk in osfstorage_paths else f.materialized_path)
+        for f in file_nodes
+    }
+
+_user_fullname_cache = {}
+_user_fullname_cache_lock = threading.Lock()
+USER_FULLNAME_CACHE_MAX_SIZE = 10000
+
+def get_user_fullnames(guid_ids):
+    """Returns {guid: fullname} of the users.
+
+    The names are cached in this process for
+    settings.SEARCH_USER_NAME_CACHE_TIMEOUT seconds.
+    """
+    now = time.time()
+    fullnames = {}
+    missing = set()
+    with _user_fullname_cache_lock:
+        for guid_id in guid_ids:
+            cached = _user_fullname_cache.get(guid_id)
+            if cached is not None and cached[0] > now:
+                fullnames[guid_id] = cached[1]
+            else:
+                missing.add(guid_id)
+    if not missing:
+        return fullnames
+
+    loaded = {
+        x['guids___id']: x['fullname']
+        for x in OSFUser.objects.filter(guids___id__in=missing).values('guids___id', 'fullname')
+    }
+    fullnames.update(loaded)
+    if settings.SEARCH_USER_NAME_CACHE_TIMEOUT > 0:
+        expires = now + settings.SEARCH_USER_NAME_CACHE_TIMEOUT
+        with _user_fullname_cache_lock:
+            if len(_user_fullname_cache) + len(loaded) > USER_FULLNAME_CACHE_MAX_SIZE:
+                _user_fullname_cache.clear()
+            for guid_id, fullname in loaded.items():
+                _user_fullname_cache[guid_id] = (expires, fullname)
+    return fullnames
+
+def get_parents(parent_ids):
+    """Returns {guid: parent_info (see load_parent)} of the public nodes."""
+    return {
+        parent._id: _parent_info(parent)
+        for parent in AbstractNode.objects.filter(guids___id__in=parent_ids, is_public=True)
+    }
+
+def hydrate_results(results):
+    """Load the objects referenced by a page of search results in bulk
+    (instead of loading them for each result).
+    """
+    user_ids, wiki_ids, file_ids, parent_ids, name_ids = set(), set(), set(), set(), set()
+    for result in results:
+        category = result.get('category')
+        if category == 'user':
+            user_ids.add(result['id'])
+            continue
+        if category == 'wiki':
+            wiki_ids.add(result['id'])
+        elif category == 'file':
+            file_ids.add(result.get('id'))
+            parent_ids.add(result.get('parent_id'))
+        elif category in {'project', 'component', 'registration'}:
+            parent_ids.add(result.get('parent_id'))
+        else:
+            continue
+        name_ids.add(result.get('creator_id'))
+        name_ids.add(result.get('modifier_id'))
+
+    hydrated = {
+        'users': {},
+        'wiki_names': {},
+        'file_paths': {},
+        'parents': {},
+        'fullnames': {},
+    }
+    user_ids.discard(None)
+    if user_ids:
+        hydrated['users'] = {u._id: u for u in OSFUser.objects.filter(guids___id__in=user_ids)}
+    if wiki_ids:
+        hydrated['wiki_names'] = {
+            x['guids___id']: x['page_name']
+            for x in WikiPage.objects.filter(guids___id__in=wiki_ids).values('guids___id', 'page_name')
+        }
+    file_ids.discard(None)
+    if file_ids:
+        hydrated['file_paths'] = get_file_paths(file_ids)
+    parent_ids.discard(None)
+    if parent_ids:
+        hydrated['parents'] = get_parents(parent_ids)
+    name_ids.discard(None)
+    name_ids.discard('')
+    if name_ids:
+        hydrated['fullnames'] = get_user_fullnames(name_ids)
+    return hydrated
 
 def format_results(results):
+    hydrated = hydrate_results(results)
+    fullnames = hydrated['fullnames']
     ret = []
     for result in results:
         category = result.get('category')
         if category == 'user':
             result['url'] = '/profile/' + result['id']
             # unnormalized
-            user = OSFUser.load(result['id'])
+            user = hydrated['users'].get(result['id'])
             if user:
                 job, school = user.get_ongoing_job_school()
                 if job is None:
@@ -499,13 +768,13 @@ def format_results(results):
                 result['ongoing_school_degree'] = school.get('degree', '')
         elif category == 'wiki':
             # get unnormalized names
-            wiki = WikiPage.load(result['id'])
-            if wiki:
-                result['name'] = wiki.page_name
+            wiki_name = hydrated['wiki_names'].get(result['id'])
+            if wiki_name is not None:
+                result['name'] = wiki_name
             creator_id, creator_name = user_id_fullname(
-                result.get('creator_id'))
+                result.get('creator_id'), fullnames)
             modifier_id, modifier_name = user_id_fullname(
-                result.get('modifier_id'))
+                result.get('modifier_id'), fullnames)
             result['creator_name'] = creator_name
             result['modifier_name'] = modifier_name
         elif category == 'comment':
@@ -517,24 +786,24 @@ def format_results(results):
             else:
                 result['replyto_user_url'] = None
         elif category == 'file':
-            file_path = get_file_path(result.get('id'))
+            file_path = get_file_path(result.get('id'), hydrated['file_paths'])
             if file_path:
                 folder_name = os.path.dirname(file_path)
             else:
                 folder_name = None
             result['folder_name'] = folder_name
-            parent_info = load_parent(result.get('parent_id'))
+            parent_info = load_parent(result.get('parent_id'), hydrated['parents'])
             result['parent_url'] = parent_info.get('url') if parent_info else None
             result['parent_title'] = parent_info.get('title') if parent_info else None
             # get unnormalized names
             creator_id, creator_name = user_id_fullname(
-                result.get('creator_id'))
+                result.get('creator_id'), fullnames)
             modifier_id, modifier_name = user_id_fullname(
-                result.get('modifier_id'))
+                result.get('modifier_id'), fullnames)
             result['creator_name'] = creator_name
             result['modifier_name'] = modifier_name
         elif category in {'project', 'component', 'registration'}:
-            result = format_result(result, result.get('parent_id'))
+            result = format_result(result, result.get('parent_id'), hydrated)
         elif category in {'preprint'}:
             result = format_preprint_result(result)
         elif category == 'collectionSubmission':
@@ -547,21 +816,25 @@ def format_results(results):
 
 
 # return (guid, fullname)
-def user_id_fullname(guid_id):
+def user_id_fullname(guid_id, fullnames=None):
     if guid_id:
-        user = OSFUser.load(guid_id)
-        if user:
-            return (guid_id, user.fullname)
+        if fullnames is None:
+            fullnames = get_user_fullnames([guid_id])
+        fullname = fullnames.get(guid_id)
+        if fullname is not None:
+            return (guid_id, fullname)
     return ('', '')
 
 
 # for 'project', 'component', 'registration'
-def format_result(result, parent_id=None):
-    parent_info = load_parent(parent_id)
+def format_result(result, parent_id=None, hydrated=None):
+    parents = hydrated['parents'] if hydrated else None
+    fullnames = hydrated['fullnames'] if hydrated else None
+    parent_info = load_parent(parent_id, parents)
 
     # get unnormalized names
-    creator_id, creator_name = user_id_fullname(result.get('creator_id'))
-    modifier_id, modifier_name = user_id_fullname(result.get('modifier_id'))
+    creator_id, creator_name = user_id_fullname(result.get('creator_id'), fullnames)
+    modifier_id, modifier_name = user_id_fullname(result.get('modifier_id'), fullnames)
 
     formatted_result = {
         'contributors': result['contributors'],
@@ -627,15 +900,21 @@ def format_preprint_result(result):
     return formatted_result
 
 
-def load_parent(parent_id):
+def _parent_info(parent):
+    return {
+        'title': parent.title,
+        'url': parent.url,
+        'id': parent._id,
+        'is_registation': parent.is_registration,
+    }
+
+
+def load_parent(parent_id, parents=None):
+    if parents is not None:
+        return parents.get(parent_id)
     parent = AbstractNode.load(parent_id)
     if parent and parent.is_public:
-        return {
-            'title': parent.title,
-            'url': parent.url,
-            'id': parent._id,
-            'is_registation': parent.is_registration,
-        }
+        return _parent_info(parent)
     return None
 
 
@@ -658,7 +937,7 @@ def get_doctype_from_node(node):
         return node.category
 
 @celery_app.task(bind=True, max_retries=5, default_retry_delay=60)
-def update_node_async(self, node_id, index=None, bulk=False, wiki_page_id=None):
+def update_node_async(self, node_id, index=None, bulk=False, wiki_page_id=None, saved_fields=None):
     AbstractNode = apps.get_model('osf.AbstractNode')
     node = AbstractNode.load(node_id)
     if wiki_page_id:
@@ -667,7 +946,24 @@ def update_node_async(self, node_id, index=None, bulk=False, wiki_page_id=None):
     else:
         wiki_page = None
     try:
-        update_node(node=node, index=index, bulk=bulk, async_update=True, wiki_page=wiki_page)
+        update_node(node=node, index=index, bulk=bulk, async_update=True, wiki_page=wiki_page,
+                    saved_fields=saved_fields)
+    except Exception as exc:
+        self.retry(exc=exc)
+
+@celery_app.task(bind=True, max_retries=5, default_retry_delay=60)
+def update_node_files_async(self, node_id, index=None):
+    AbstractNode = apps.get_model('osf.AbstractNode')
+    node = AbstractNode.load(node_id)
+    try:
+        update_node_files(node, index=index)
+    except Exception as exc:
+        self.retry(exc=exc)
+
+@celery_app.task(bind=True, max_retries=5, default_retry_delay=60)
+def update_files_async(self, file_ids, index=None, deleted_file_ids=None):
+    try:
+        update_files(file_ids, index=index, deleted_file_ids=deleted_file_ids)
     except Exception as exc:
         self.retry(exc=exc)
 
@@ -1032,16 +1328,26 @@ def update_wiki(wiki_page, index=None, bulk=False):
     else:
         client().index(index=index, doc_type=category, id=wiki_page._id, body=elastic_document, refresh=True)
 
+def files_need_update(saved_fields):
+    """Whether the file documents of a node must be updated when the node is
+    updated.  saved_fields is None when the updated fields are unknown.
+    """
+    if saved_fields is None:
+        return True
+    return bool(FILE_SEARCH_UPDATE_FIELDS.intersection(saved_fields))
+
 @requires_search
-def update_node(node, index=None, bulk=False, async_update=False, wiki_page=None):
+def update_node(node, index=None, bulk=False, async_update=False, wiki_page=None, saved_fields=None):
     if wiki_page:
         update_wiki(wiki_page, index=index)
         # NOTE: update_node() may be called twice after WikiPage.save()
 
-    from addons.osfstorage.models import OsfStorageFile
     index = es_index(index)
-    for file_ in paginated(OsfStorageFile, Q(target_content_type=ContentType.objects.get_for_model(type(node)), target_object_id=node.id)):
-        update_file(file_, index=index)
+    if files_need_update(saved_fields):
+        if settings.USE_CELERY:
+            enqueue_task(update_node_files_async.s(node._id, index=index))
+        else:
+            update_node_files(node, index=index)
 
     is_qa_node = bool(set(settings.DO_NOT_INDEX_LIST['tags']).intersection(node.tags.all().values_list('name', flat=True))) or any(substring in node.title for substring in settings.DO_NOT_INDEX_LIST['titles'])
     if node.is_deleted or (not settings.ENABLE_PRIVATE_SEARCH and not node.is_public) or node.archiving or node.is_spam or (node.spam_status == SpamStatus.FLAGGED and settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH) or node.is_quickfiles or is_qa_node:
@@ -1303,10 +1609,83 @@ def update_user(user, index=None):
 
     client().index(index=index, doc_type='user', body=user_doc, id=user._id, refresh=True)
 
+@requires_search
+def update_node_files(node, index=None):
+    """Update the documents of all OsfStorage files of a node by bulk requests."""
+    from addons.osfstorage.models import OsfStorageFile
+    index = es_index(index)
+    files = paginated(OsfStorageFile, Q(
+        target_content_type=ContentType.objects.get_for_model(type(node)),
+        target_object_id=node.id))
+    bulk_update_files(files, index=index)
+
+def bulk_update_files(files, index=None, refresh=True):
+    index = es_index(index)
+    actions = (serialize_file_action(file_, index) for file_ in files)
+    bulk_file_actions(actions, index, refresh=refresh)
+
+def update_files(file_ids, index=None, deleted_file_ids=None, refresh=False):
+    """Update (or delete) the documents of files by bulk requests.
+
+    The refresh is left to the refresh interval of the index by default.
+    """
+    index = es_index(index)
+    file_ids = set(file_ids) - set(deleted_file_ids or [])
+    files = list(BaseFileNode.objects.filter(_id__in=file_ids))
+    # the files which no longer exist are removed from the index
+    deleted_file_ids = set(deleted_file_ids or []) | (file_ids - set(f._id for f in files))
+
+    def actions():
+        for file_ in files:
+            yield serialize_file_action(file_, index)
+        for file_id in deleted_file_ids:
+            yield {
+                '_op_type': 'delete',
+                '_index': index,
+                '_type': 'file',
+                '_id': file_id,
+            }
+    bulk_file_actions(actions(), index, refresh=refresh)
+
+def bulk_file_actions(actions, index, refresh=True):
+    for ok, item in helpers.streaming_bulk(client(), actions, raise_on_error=False):
+        if not ok:
+            op_type, result = list(item.items())[0]
+            if op_type != 'delete' or result.get('status') != 404:
+                logger.error('Failed to update the search document of a file: {}'.format(item))
+    if refresh:
+        client().indices.refresh(index=index)
+
 @requires_search
 def update_file(file_, index=None, delete=False):
     index = es_index(index)
+    action = serialize_file_action(file_, index, delete=delete)
+    if action['_op_type'] == 'delete':
+        client().delete(
+            index=index,
+            doc_type='file',
+            id=file_._id,
+            refresh=True,
+            ignore=[404]
+        )
+    else:
+        client().index(
+            index=index,
+            doc_type='file',
+            body=action['_source'],
+            id=file_._id,
+            refresh=True
+        )
+
+def serialize_file_action(file_, index, delete=False):
+    """Returns the bulk action (index or delete) for the document of a file."""
     target = file_.target
+    delete_action = {
+        '_op_type': 'delete',
+        '_index': index,
+        '_type': 'file',
+        '_id': file_._id,
+    }
 
     # TODO: Can remove 'not file_.name' if we remove all base file nodes with name=None
     file_node_is_qa = bool(
@@ -1316,26 +1695,12 @@ def update_file(file_, index=None, delete=False):
     ) or any(substring in target.title for substring in settings.DO_NOT_INDEX_LIST['titles'])
     if not file_.name or (not settings.ENABLE_PRIVATE_SEARCH and not target.is_public) or delete or file_node_is_qa or getattr(target, 'is_deleted', False) or getattr(target, 'archiving', False) or target.is_spam or (
             target.spam_status == SpamStatus.FLAGGED and settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH):
-        client().delete(
-            index=index,
-            doc_type='file',
-            id=file_._id,
-            refresh=True,
-            ignore=[404]
-        )
-        return
+        return delete_action
 
     if isinstance(target, Preprint):
         if not getattr(target, 'verified_publishable', False) or target.primary_file != file_ or target.is_spam or (
                 target.spam_status == SpamStatus.FLAGGED and settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH):
-            client().delete(
-                index=index,
-                doc_type='file',
-                id=file_._id,
-                refresh=True,
-                ignore=[404]
-            )
-            return
+            return delete_action
 
     # We build URLs manually here so that this function can be
     # run outside of a Flask request context (e.g. in a celery task)
@@ -1415,13 +1780,13 @@ def update_file(file_, index=None, delete=False):
         'comments': comments_to_doc(file_guid._id) if file_guid else {}
     }
 
-    client().index(
-        index=index,
-        doc_type='file',
-        body=file_doc,
-        id=file_._id,
-        refresh=True
-    )
+    return {
+        '_op_type': 'index',
+        '_index': index,
+        '_type': 'file',
+        '_id': file_._id,
+        '_source': file_doc,
+    }
 
 @requires_search
 def update_institution(institution, index=None):
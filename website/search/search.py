@@ -1,6 +1,7 @@
 import logging
 
 from framework.celery_tasks.handlers import enqueue_task
+from framework.postcommit_tasks.handlers import get_postcommit_buffer
 
 from website import settings
 
@@ -28,7 +29,8 @@ def search(query, index=None, doc_type=None, raw=None, private=False, ext=False)
 def update_node(node, index=None, bulk=False, async_update=True, saved_fields=None, wiki_page=None):
     kwargs = {
         'index': index,
-        'bulk': bulk
+        'bulk': bulk,
+        'saved_fields': list(saved_fields) if saved_fields is not None else None,
     }
     if async_update:
         node_id = node._id
@@ -133,7 +135,28 @@ def update_user(user, index=None, async_update=True):
 
 @requires_search
 def update_file(file_, index=None, delete=False):
-    search_engine.update_file(file_, index=index, delete=delete)
+    updates = get_postcommit_buffer(flush_file_updates) if settings.USE_CELERY else None
+    if updates is None:
+        search_engine.update_file(file_, index=index, delete=delete)
+    else:
+        # Repeated updates of a file in a request are indexed once after the request
+        updates[(index, file_._id)] = delete
+
+FILE_UPDATES_CHUNK_SIZE = 500
+
+def flush_file_updates(updates):
+    files = {}
+    for (index, file_id), delete in updates.items():
+        file_ids, deleted_file_ids = files.setdefault(index, ([], []))
+        (deleted_file_ids if delete else file_ids).append(file_id)
+    for index, (file_ids, deleted_file_ids) in files.items():
+        for i in range(0, max(len(file_ids), len(deleted_file_ids)), FILE_UPDATES_CHUNK_SIZE):
+            search_engine.update_files_async.apply_async(
+                args=(file_ids[i:i + FILE_UPDATES_CHUNK_SIZE],),
+                kwargs={
+                    'index': index,
+                    'deleted_file_ids': deleted_file_ids[i:i + FILE_UPDATES_CHUNK_SIZE],
+                })
 
 @requires_search
 def update_institution(institution, index=None):
@@ -185,7 +208,7 @@ def update_contributor(sender, instance, **kwargs):
         # ignore first node.save() (avoid redundant updating)
         return
 
-    node.update_search()
+    node.update_search(saved_fields=['contributors'])
 
 @receiver(post_delete, sender=Contributor)
 def delete_contributor(sender, instance, **kwargs):
@@ -193,4 +216,4 @@ def delete_contributor(sender, instance, **kwargs):
     if node.is_deleted:
         return
 
-    node.update_search()
+    node.update_search(saved_fields=['contributors'])
@@ -2,11 +2,15 @@
 # -*- coding: utf-8 -*-
 """Migration script for Search-enabled Models."""
 from __future__ import absolute_import
-from math import ceil
+from collections import deque
 import functools
+import json
 import logging
+import multiprocessing
+import os
+import time
 
-from django.db import connection
+from django.db import connection, connections
 from django.core.paginator import Paginator
 from elasticsearch2 import helpers
 
@@ -28,6 +32,7 @@ from website.search.elastic_search import es_index
 from website.search.elastic_search import comments_to_doc
 from website.search.elastic_search import node_includes_wiki
 from website.search.search import update_institution, bulk_update_collected_metadata
+from website.search import elastic_search
 from website.search.util import unicode_normalize
 from addons.wiki.models import WikiPage
 from addons.osfstorage.models import OsfStorageFile
@@ -129,7 +134,99 @@ def fill_and_normalize(docs):
             node = AbstractNode.load(doc['_id'])
             d['comments'] = comments_to_doc(node._id)
 
-def sql_migrate(index, sql, max_id, increment, es_args=None, **kwargs):
+class MigrationState(object):
+    """Progress of a rebuild, saved to a local JSON file after each completed
+    window/step so that an interrupted rebuild can be resumed.
+    """
+
+    def __init__(self, path, alias):
+        self.path = path
+        self.data = {'alias': alias, 'index': None, 'index_settings': None, 'steps': [], 'windows': {}}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get('alias') == alias:
+                self.data = data
+            else:
+                logger.warning('Ignoring {}: it is the state of {}'.format(path, data.get('alias')))
+
+    @property
+    def index(self):
+        return self.data['index']
+
+    def start(self, index):
+        self.data.update({'index': index, 'index_settings': None, 'steps': [], 'windows': {}})
+        self.save()
+
+    def is_step_done(self, step):
+        return step in self.data['steps']
+
+    def step_done(self, step):
+        self.data['steps'].append(step)
+        self.save()
+
+    def done_windows(self, key):
+        return set(self.data['windows'].get(key, []))
+
+    def window_done(self, key, page_start):
+        self.data['windows'].setdefault(key, []).append(page_start)
+        self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.data, f)
+        os.rename(tmp_path, self.path)
+
+    def remove(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def bulk(actions, es_args):
+    """helpers.bulk, or helpers.parallel_bulk if es_args has thread_count"""
+    es_args = dict(es_args)
+    if es_args.get('thread_count', 1) > 1:
+        # parallel_bulk is a generator, it must be consumed
+        deque(helpers.parallel_bulk(client(), actions, **es_args), maxlen=0)
+    else:
+        es_args.pop('thread_count', None)
+        helpers.bulk(client(), actions, **es_args)
+
+
+def migrate_window(index, sql, page_start, page_end, es_args, kwargs):
+    """Migrate the objects with page_start < id <= page_end.
+
+    :return tuple: (page_start, number of migrated objects)
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql.format(
+            index=index,
+            page_start=page_start,
+            page_end=page_end,
+            enable_private_search=enable_private_search(settings.ENABLE_PRIVATE_SEARCH),
+            **kwargs))
+        ser_objs = cursor.fetchone()[0]
+    if not ser_objs:
+        return page_start, 0
+    fill_and_normalize(ser_objs)
+    bulk(ser_objs, es_args)
+    return page_start, len(ser_objs)
+
+
+def _migrate_window(args):
+    return migrate_window(*args)
+
+
+def _init_worker():
+    # connections inherited from the parent process must not be shared
+    connections.close_all()
+    elastic_search.CLIENT = None
+
+
+def sql_migrate(index, sql, max_id, increment, es_args=None, pool=None, state=None, state_key=None, **kwargs):
     """ Run provided SQL and send output to elastic.
 
     :param str index: Elastic index to update (formatted into `sql`)
@@ -137,43 +234,49 @@ def sql_migrate(index, sql, max_id, increment, es_args=None, **kwargs):
     :param int max_id: Last known object id. Indicates when to stop paging
     :param int increment: Page size
     :param  dict es_args:  Dict or None, to pass to `helpers.bulk`
+    :param Pool pool: Process pool to migrate the pages in parallel
+    :param MigrationState state: Skip and record the completed pages
+    :param str state_key: Name of the pages in `state`
     :kwargs: Additional format arguments for `sql` arg
 
     :return int: Number of migrated objects
     """
     if es_args is None:
         es_args = {}
-    total_pages = int(ceil(max_id / float(increment)))
+    # An extra page is included to cover the edge case where:
+    #       max_id == (total_pages * increment) - 1
+    # and two additional objects are created during runtime.
+    page_starts = range(0, max_id + increment + 1, increment)
+    done = state.done_windows(state_key) if state else set()
+    windows = [
+        (index, sql, page_start, page_start + increment, es_args, kwargs)
+        for page_start in page_starts if page_start not in done
+    ]
+    if done:
+        logger.info('Resuming: {} / {} pages are already migrated'.format(len(done), len(page_starts)))
+
+    if pool is None:
+        results = (_migrate_window(window) for window in windows)
+    else:
+        connection.close()  # not to share it with the forked workers
+        results = pool.imap_unordered(_migrate_window, windows)
+
     total_objs = 0
-    page_start = 0
-    page_end = 0
-    page = 0
-    while page_end <= (max_id + increment):
-        page += 1
-        page_end += increment
-        if page <= total_pages:
-            logger.info('Updating page {} / {}'.format(page_end / increment, total_pages))
-        else:
-            # An extra page is included to cover the edge case where:
-            #       max_id == (total_pages * increment) - 1
-            # and two additional objects are created during runtime.
-            logger.info('Cleaning up...')
-        with connection.cursor() as cursor:
-            cursor.execute(sql.format(
-                index=index,
-                page_start=page_start,
-                page_end=page_end,
-                enable_private_search=enable_private_search(settings.ENABLE_PRIVATE_SEARCH),
-                **kwargs))
-            ser_objs = cursor.fetchone()[0]
-            if ser_objs:
-                total_objs += len(ser_objs)
-                fill_and_normalize(ser_objs)
-                helpers.bulk(client(), ser_objs, **es_args)
-        page_start = page_end
+    started = time.time()
+    for page, (page_start, count) in enumerate(results, start=1):
+        total_objs += count
+        if state:
+            state.window_done(state_key, page_start)
+        elapsed = time.time() - started
+        logger.info('Updated page {} / {} ({} objects, {:.1f} objects/s)'.format(
+            page, len(windows), total_objs, total_objs / elapsed if elapsed else 0))
+    if state_key:
+        elapsed = time.time() - started
+        logger.info('{}: {} objects in {:.1f} s ({:.1f} objects/s)'.format(
+            state_key, total_objs, elapsed, total_objs / elapsed if elapsed else 0))
     return total_objs
 
-def migrate_nodes(index, delete, increment=10000):
+def migrate_nodes(index, delete, increment=10000, pool=None, state=None, es_args=None):
     logger.info('Migrating nodes to index: {}'.format(index))
     last = AbstractNode.objects.last()
     if last is None:
@@ -185,6 +288,10 @@ def migrate_nodes(index, delete, increment=10000):
         JSON_UPDATE_NODES_SQL,
         max_nid,
         increment,
+        es_args=es_args,
+        pool=pool,
+        state=state,
+        state_key='nodes',
         spam_flagged_removed_from_search=settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH)
     logger.info('{} nodes migrated'.format(total_nodes))
     if delete:
@@ -195,7 +302,10 @@ def migrate_nodes(index, delete, increment=10000):
             JSON_DELETE_NODES_SQL,
             max_nid,
             increment,
-            es_args={'raise_on_error': False},  # ignore 404s
+            es_args=dict(es_args or {}, raise_on_error=False),  # ignore 404s
+            pool=pool,
+            state=state,
+            state_key='nodes_delete',
             spam_flagged_removed_from_search=settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH)
         logger.info('{} nodes marked deleted'.format(total_nodes))
 
@@ -247,7 +357,7 @@ def migrate_comments(index, delete):
         search.bulk_update_comments(paginator.page(page_number).object_list, index=index)
     logger.info('{} comments migrated'.format(comments.count()))
 
-def migrate_files(index, delete, increment=10000):
+def migrate_files(index, delete, increment=10000, pool=None, state=None, es_args=None):
     logger.info('Migrating files to index: {}'.format(index))
     last = BaseFileNode.objects.last()
     if last is None:
@@ -259,6 +369,10 @@ def migrate_files(index, delete, increment=10000):
         JSON_UPDATE_FILES_SQL,
         max_fid,
         increment,
+        es_args=es_args,
+        pool=pool,
+        state=state,
+        state_key='files',
         spam_flagged_removed_from_search=settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH)
     logger.info('{} files migrated'.format(total_files))
     if delete:
@@ -269,11 +383,14 @@ def migrate_files(index, delete, increment=10000):
             JSON_DELETE_FILES_SQL,
             max_fid,
             increment,
-            es_args={'raise_on_error': False},  # ignore 404s
+            es_args=dict(es_args or {}, raise_on_error=False),  # ignore 404s
+            pool=pool,
+            state=state,
+            state_key='files_delete',
             spam_flagged_removed_from_search=settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH)
         logger.info('{} files marked deleted'.format(total_files))
 
-def migrate_users(index, delete, increment=10000):
+def migrate_users(index, delete, increment=10000, pool=None, state=None, es_args=None):
     logger.info('Migrating users to index: {}'.format(index))
     last = OSFUser.objects.last()
     if last is None:
@@ -284,7 +401,11 @@ def migrate_users(index, delete, increment=10000):
         index,
         JSON_UPDATE_USERS_SQL,
         max_uid,
-        increment)
+        increment,
+        es_args=es_args,
+        pool=pool,
+        state=state,
+        state_key='users')
     logger.info('{} users migrated'.format(total_users))
     if delete:
         logger.info('Preparing to delete old user documents')
@@ -294,7 +415,10 @@ def migrate_users(index, delete, increment=10000):
             JSON_DELETE_USERS_SQL,
             max_uid,
             increment,
-            es_args={'raise_on_error': False})  # ignore 404s
+            es_args=dict(es_args or {}, raise_on_error=False),  # ignore 404s
+            pool=pool,
+            state=state,
+            state_key='users_delete')
         logger.info('{} users marked deleted'.format(total_users))
 
 def migrate_collected_metadata(index, delete):
@@ -326,13 +450,21 @@ def migrate_institutions(index):
     for inst in Institution.objects.filter(is_deleted=False):
         update_institution(inst, index)
 
-def migrate(delete, remove=False, remove_all=False, index=None, app=None):
+def migrate(delete, remove=False, remove_all=False, index=None, app=None,
+            rebuild=False, workers=None, chunk_size=None, thread_count=None, state_file=None):
     """Reindexes relevant documents in ES
 
     :param bool delete: Delete documents that should not be indexed
     :param bool remove: Removes old index after migrating
     :param str index: index alias to version and migrate
     :param App app: Flask app for context
+    :param bool rebuild: Rebuild mode: migrate the pages of nodes, files and users
+                         by a process pool, disable refresh and replicas of the new
+                         index during the load and record the progress to resume
+    :param int workers: Number of worker processes (rebuild mode)
+    :param int chunk_size: Number of documents in a bulk request (rebuild mode)
+    :param int thread_count: Number of parallel bulk requests of a worker (rebuild mode)
+    :param str state_file: Local file to record the progress (rebuild mode)
     """
     index = es_index(index)
     app = app or init_app('website.settings', set_backends=True, routes=True)
@@ -344,19 +476,65 @@ def migrate(delete, remove=False, remove_all=False, index=None, app=None):
     ctx = app.test_request_context()
     ctx.push()
 
-    new_index = set_up_index(index)
-
-    if settings.ENABLE_INSTITUTIONS:
-        migrate_institutions(new_index)
-    migrate_nodes(new_index, delete=delete)
-    migrate_files(new_index, delete=delete)
-    migrate_wikis(new_index, delete=delete)
-    migrate_comments(new_index, delete=delete)
-    migrate_users(new_index, delete=delete)
-    migrate_preprints(new_index, delete=delete)
-    migrate_preprint_files(new_index, delete=delete)
-    migrate_collected_metadata(new_index, delete=delete)
-    migrate_groups(new_index, delete=delete)
+    state = None
+    pool = None
+    es_args = None
+    if rebuild:
+        state = MigrationState(state_file or settings.SEARCH_MIGRATION_STATE_FILE, index)
+        es_args = {
+            'chunk_size': chunk_size or settings.SEARCH_MIGRATION_CHUNK_SIZE,
+            'thread_count': thread_count or settings.SEARCH_MIGRATION_THREAD_COUNT,
+        }
+
+    if state and state.index and es_client().indices.exists(index=state.index):
+        new_index = state.index
+        logger.info('Resuming the migration to {}'.format(new_index))
+    else:
+        new_index = set_up_index(index)
+        if state:
+            state.start(new_index)
+
+    if rebuild:
+        if state.data['index_settings'] is None:
+            state.data['index_settings'] = disable_refresh(new_index)
+            state.save()
+        workers = workers or settings.SEARCH_MIGRATION_WORKERS
+        if workers > 1:
+            connection.close()  # not to share it with the forked workers
+            pool = multiprocessing.Pool(workers, initializer=_init_worker)
+
+    rebuild_args = {'pool': pool, 'state': state, 'es_args': es_args}
+    steps = [
+        ('institutions', functools.partial(migrate_institutions, new_index)),
+        ('nodes', functools.partial(migrate_nodes, new_index, delete=delete, **rebuild_args)),
+        ('files', functools.partial(migrate_files, new_index, delete=delete, **rebuild_args)),
+        ('wikis', functools.partial(migrate_wikis, new_index, delete=delete)),
+        ('comments', functools.partial(migrate_comments, new_index, delete=delete)),
+        ('users', functools.partial(migrate_users, new_index, delete=delete, **rebuild_args)),
+        ('preprints', functools.partial(migrate_preprints, new_index, delete=delete)),
+        ('preprint_files', functools.partial(migrate_preprint_files, new_index, delete=delete)),
+        ('collected_metadata', functools.partial(migrate_collected_metadata, new_index, delete=delete)),
+        ('groups', functools.partial(migrate_groups, new_index, delete=delete)),
+    ]
+    try:
+        for step, migrate_step in steps:
+            if step == 'institutions' and not settings.ENABLE_INSTITUTIONS:
+                continue
+            if state and state.is_step_done(step):
+                logger.info('Skipping {}: already migrated'.format(step))
+                continue
+            started = time.time()
+            migrate_step()
+            logger.info('{} migrated in {:.1f} s'.format(step, time.time() - started))
+            if state:
+                state.step_done(step)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    if rebuild:
+        restore_refresh(new_index, state.data['index_settings'])
 
     set_up_alias(index, new_index)
 
@@ -365,8 +543,32 @@ def migrate(delete, remove=False, remove_all=False, index=None, app=None):
     if remove_all:
         remove_all_old_index(new_index)
 
+    if state:
+        state.remove()
+
     ctx.pop()
 
+def disable_refresh(index):
+    """Disable the refresh and the replicas of index for a bulk load.
+
+    :return dict: the settings to restore
+    """
+    index_settings = es_client().indices.get_settings(index=index)[index]['settings']['index']
+    saved = {
+        'refresh_interval': index_settings.get('refresh_interval', '1s'),
+        'number_of_replicas': index_settings.get('number_of_replicas', '1'),
+    }
+    logger.info('Disabling refresh and replicas of {} (were: {})'.format(index, saved))
+    es_client().indices.put_settings(index=index, body={
+        'index': {'refresh_interval': '-1', 'number_of_replicas': 0}
+    })
+    return saved
+
+def restore_refresh(index, saved):
+    logger.info('Restoring refresh and replicas of {}: {}'.format(index, saved))
+    es_client().indices.put_settings(index=index, body={'index': saved})
+    es_client().indices.refresh(index=index)
+
 def set_up_index(idx):
     try:
         alias = es_client().indices.get_aliases(index=idx)
@@ -58,6 +58,11 @@ INCORRECT_PASSWORD_ATTEMPTS_ALLOWED = 3
 DATE_LAST_LOGIN_THROTTLE = 60
 DATE_LAST_LOGIN_THROTTLE_DELTA = datetime.timedelta(seconds=DATE_LAST_LOGIN_THROTTLE)
 
+# Seconds to remember a successful password check of HTTP Basic auth in each process (0: disabled)
+BASIC_AUTH_CACHE_TIMEOUT = 60
+# Maximum number of remembered password checks in each process
+BASIC_AUTH_CACHE_MAX_SIZE = 1000
+
 # Seconds that must elapse before change password attempts are reset(currently 1 hour)
 TIME_RESET_CHANGE_PASSWORD_ATTEMPTS = 3600
 
@@ -110,6 +115,18 @@ ELASTIC_URI = '127.0.0.1:9200'
 ELASTIC_TIMEOUT = 10
 ELASTIC_INDEX = 'website'
 ELASTIC_INDEX_PRIVATE_PREFIX = 'private__'  # for ENABLE_PRIVATE_SEARCH
+# Seconds to cache the results of searches on the public index (0: disabled)
+# Cached results may not reflect updates of the index for this period.
+SEARCH_RESULT_CACHE_TIMEOUT = 0
+# Searches slower than this (seconds) are logged with the time of each phase
+SEARCH_SLOW_LOG_THRESHOLD = 1.0
+# Seconds to cache the user names shown in search results in each process (0: disabled)
+SEARCH_USER_NAME_CACHE_TIMEOUT = 0
+# Rebuild mode of website.search_migration.migrate (invoke migrate_search --rebuild)
+SEARCH_MIGRATION_WORKERS = 4
+SEARCH_MIGRATION_CHUNK_SIZE = 500
+SEARCH_MIGRATION_THREAD_COUNT = 2
+SEARCH_MIGRATION_STATE_FILE = os.path.join(LOG_PATH, 'search_migration_state.json')
 ELASTIC_KWARGS = {
     # 'use_ssl': False,
     # 'verify_certs': True,
@@ -124,6 +141,10 @@ COOKIE_NAME = 'osf'
 OSF_COOKIE_DOMAIN = None
 # server-side verification timeout
 OSF_SESSION_TIMEOUT = 30 * 24 * 60 * 60  # 30 days in seconds
+# Seconds to keep sessions in the SESSION_CACHE_NAME cache of api.base.settings (0: disabled).
+# The cache must be shared by all processes (e.g. memcached). When it is enabled,
+# sessions are written to the database at the end of the request.
+SESSION_CACHE_TIMEOUT = 0
 # TODO: Override SECRET_KEY in local.py in production
 SECRET_KEY = 'CHANGEME'
 SESSION_COOKIE_SECURE = SECURE_MODE
@@ -404,6 +425,7 @@ class CeleryConfig:
     task_low_queue = 'low'
     task_med_queue = 'med'
     task_high_queue = 'high'
+    task_timestamp_queue = 'timestamp'
 
     low_pri_modules = {
         'framework.analytics.tasks',
@@ -414,6 +436,7 @@ class CeleryConfig:
         'scripts.populate_new_and_noteworthy_projects',
         'scripts.populate_popular_projects_and_registrations',
         'website.search.elastic_search',
+        'website.util.quota',
         'scripts.generate_sitemap',
         'scripts.analytics.run_keen_summaries',
         'scripts.analytics.run_keen_snapshots',
@@ -451,6 +474,11 @@ class CeleryConfig:
         'nii.mapcore_refresh_tokens',
     }
 
+    timestamp_modules = {
+        'website.util.timestamp.celery_add_pending_timestamps',
+        'website.util.timestamp.celery_check_external_files',
+    }
+
     try:
         from kombu import Queue, Exchange
     except ImportError:
@@ -465,6 +493,8 @@ class CeleryConfig:
                 consumer_arguments={'x-priority': 1}),
             Queue(task_high_queue, Exchange(task_high_queue), routing_key=task_high_queue,
                 consumer_arguments={'x-priority': 10}),
+            Queue(task_timestamp_queue, Exchange(task_timestamp_queue), routing_key=task_timestamp_queue,
+                consumer_arguments={'x-priority': 0}),
         )
 
         task_default_exchange_type = 'direct'
@@ -512,6 +542,8 @@ class CeleryConfig:
         'osf.management.commands.check_crossref_dois',
         'osf.management.commands.update_institution_project_counts',
         'nii.mapcore_refresh_tokens',
+        'nii.mapcore',
+        'website.util.quota',
     )
 
     # Modules that need metrics and release requirements
@@ -2029,6 +2061,11 @@ MAPCORE_REFRESH_PATH = '/oauth/token.php'
 MAPCORE_AUTHCODE_MAGIC = 'GRDM_mAP_AuthCode'
 MAPCORE_CLIENTID = None
 MAPCORE_SECRET = None
+# Synchronize with mAP core in celery tasks instead of while rendering pages.
+# Pages only enqueue the synchronization of the user (my projects) or the project
+# if the last synchronization is older than MAPCORE_SYNC_FRESHNESS (sec.).
+MAPCORE_SYNC_IN_BACKGROUND = True
+MAPCORE_SYNC_FRESHNESS = 60
 
 # allow logged-in-user to search private projects
 ENABLE_PRIVATE_SEARCH = False
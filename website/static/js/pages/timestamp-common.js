@@ -27,42 +27,6 @@ var setWebOrAdmin = function(webOrAdminString) {
     DOWNLOAD_FILENAME = webOrAdminString + '_' + dateString + '_' + 'timestamp_errors';
 };
 
-var HEADERS_ORDER = [
-    'timestampId', 'fileGuidResource', 'fileGuidLabel', 'fileGuid', 'fileNameResource',
-    'fileNameLabel', 'fileCreationDate', 'fileModificationDate', 'fileByteSize',
-    'fileVersion', 'projectGuidResource', 'projectGuidLabel', 'projectGuid', 'userGuidResource',
-    'userGuidLabel', 'userNameResource', 'userNameLabel', 'mail', 'orgIdResource', 'orgIdLabel',
-    'orgNameResource', 'orgNameLabel', 'userGuid', 'tsIdLabel', 'tsVerificationStatus',
-    'latestTsVerificationDate'
-];
-var HEADER_NAMES = {
-    timestampId: 'Timestamp ID',
-    fileGuidResource: 'File GUID Resource',
-    fileGuidLabel: 'File GUID Label',
-    fileGuid: 'File GUID',
-    fileNameResource: 'File Name Resource',
-    fileNameLabel: 'File Name Label',
-    fileCreationDate: 'File Creation Date',
-    fileModificationDate: 'File Modification Date',
-    fileByteSize: 'File ByteSize',
-    fileVersion: 'File Version',
-    projectGuidResource: 'Project GUID Resource',
-    projectGuidLabel: 'Project GUID Label',
-    projectGuid: 'Project GUID',
-    userGuidResource: 'User GUID Resource',
-    userGuidLabel: 'User GUID Label',
-    userNameResource: 'User Name Resource',
-    userNameLabel: 'User Name Label',
-    mail: 'Mail',
-    orgIdResource: 'Organization ID Resource',
-    orgIdLabel: 'Organization ID Label',
-    orgNameResource: 'Organization Name Resource',
-    orgNameLabel: 'Organization Name Label',
-    userGuid: 'User GUID',
-    tsIdLabel: 'Timestamp ID Label',
-    tsVerificationStatus: 'Timestamp Verification Status',
-    latestTsVerificationDate: 'Latest Timestamp Verification Date'
-};
 var RESOURCE_HOST = 'rdf.rdm.nii.ac.jp';
 
 var TIMESTAMP_LIST_OBJECT = new List('timestamp-form', {
@@ -88,48 +52,142 @@ var TIMESTAMP_LIST_OBJECT = new List('timestamp-form', {
         {name: 'verify_date', attr: 'value'},
         {name: 'verify_result_title', attr: 'value'},
         'verify_user_name_id'
-    ],
-    page: 10,
-    pagination: {
-        paginationClass: 'listjs-pagination',
-        innerWindow: 3,
-        outerWindow: 1
-    }
+    ]
 });
 
-TIMESTAMP_LIST_OBJECT.on('updated', function (list) {
-    var isFirst = list.i === 1;
-    var isLast = list.i > list.matchingItems.length - list.page;
+// The error list is paginated, sorted and filtered by the server;
+// the list object only holds the rows of the current page.
+var ERROR_LIST = {
+    url: null,
+    csvUrl: null,
+    page: 1,
+    numPages: 1,
+    pageSize: 10,
+    sort: 'file_path',
+    order: 'asc',
+    filters: {},
+    formatDate: null,
+    onPageLoaded: null
+};
+
+var HIDDEN_VALUE_NAMES = [
+    'creator_name', 'creator_email', 'creator_id', 'file_path', 'file_id',
+    'file_create_date_on_upload', 'file_create_date_on_verify',
+    'file_modify_date_on_upload', 'file_modify_date_on_verify',
+    'file_size_on_upload', 'file_size_on_verify', 'file_version', 'project_id',
+    'organization_id', 'organization_name', 'verify_user_id', 'verify_user_name',
+    'verify_date', 'verify_result_title'
+];
+
+function errorListParams () {
+    return $.extend({sort: ERROR_LIST.sort, order: ERROR_LIST.order}, ERROR_LIST.filters);
+}
+
+function errorRow (provider, errorInfo) {
+    var $row = $('<tr class="addTimestamp"></tr>');
+    $row.append($('<td></td>').append('<input type="checkBox" id="addTimestampCheck" style="width: 15px; height: 15px;"/>'));
+    $row.append($('<td class="provider"></td>').text(provider));
+    $row.append($('<td></td>').text(errorInfo.file_path));
+    HIDDEN_VALUE_NAMES.forEach(function (name) {
+        $row.append($('<input type="hidden" />').addClass(name).val(errorInfo[name]));
+    });
+    $row.append($('<td class="verify_user_name_id"></td>').text(
+        errorInfo.verify_user_id ? errorInfo.verify_user_name + ' (' + errorInfo.verify_user_id + ')' : _('Unknown')
+    ));
+    var verifyDate = errorInfo.verify_date ? errorInfo.verify_date : 'Unknown';
+    if (ERROR_LIST.formatDate) {
+        verifyDate = ERROR_LIST.formatDate(verifyDate);
+    }
+    $row.append($('<td class="verify_date"></td>').text(verifyDate));
+    $row.append($('<td class="verify_result_title"></td>').text(errorInfo.verify_result_title));
+    return $row;
+}
+
+// first page, last page and the pages around the current one; null is a gap
+function pageWindow (current, numPages) {
+    var pages = [];
+    for (var page = 1; page <= numPages; page++) {
+        if (page === 1 || page === numPages || Math.abs(page - current) <= 3) {
+            pages.push(page);
+        } else if (pages[pages.length - 1] !== null) {
+            pages.push(null);
+        }
+    }
+    return pages;
+}
+
+function renderPagination () {
+    var $pagination = $('.listjs-pagination').empty();
+    pageWindow(ERROR_LIST.page, ERROR_LIST.numPages).forEach(function (page) {
+        var $item = $('<li></li>');
+        if (page === null) {
+            $item.addClass('disabled').append('<a class="page">...</a>');
+        } else {
+            $item.toggleClass('active', page === ERROR_LIST.page);
+            $item.append($('<a class="page"></a>').text(page));
+            $item.on('click', function () {
+                loadPage(page);
+                return false;
+            });
+        }
+        $pagination.append($item);
+    });
 
-    if (list.items.length > list.page) {
+    if (ERROR_LIST.numPages > 1) {
         $('.pagination-wrap').show();
     } else {
         $('.pagination-wrap').hide();
     }
+    $('.pagination-prev').toggleClass('disabled', ERROR_LIST.page <= 1);
+    $('.pagination-next').toggleClass('disabled', ERROR_LIST.page >= ERROR_LIST.numPages);
 
-    $('.pagination-prev.disabled, .pagination-next.disabled').removeClass('disabled');
-    if (isFirst) {
-        $('.pagination-prev').addClass('disabled');
+    if (ERROR_LIST.onPageLoaded) {
+        ERROR_LIST.onPageLoaded();
     }
-    if (isLast) {
-        $('.pagination-next').addClass('disabled');
-    }
-});
+}
+
+function loadPage (page) {
+    $.ajax({
+        url: ERROR_LIST.url,
+        data: $.extend({page: page, page_size: ERROR_LIST.pageSize}, errorListParams()),
+        dataType: 'json',
+        method: 'GET'
+    }).done(function (data) {
+        var $list = $('#timestamp_error_list').empty();
+        data.provider_list.forEach(function (providerErrorInfo) {
+            providerErrorInfo.error_list.forEach(function (errorInfo) {
+                $list.append(errorRow(providerErrorInfo.provider, errorInfo));
+            });
+        });
+        TIMESTAMP_LIST_OBJECT.reIndex();
+        TIMESTAMP_LIST_OBJECT.update();
+        $('#addTimestampAllCheck').prop('checked', false);
+
+        ERROR_LIST.page = data.page;
+        ERROR_LIST.numPages = data.num_pages;
+        renderPagination();
+    }).fail(function () {
+        $osf.growl('Timestamp', _('Failed to load the timestamp error list.'), 'danger');
+    });
+}
 
 $('.pagination-prev').click(function () {
-    $('.listjs-pagination .active').prev().trigger('click');
+    if (ERROR_LIST.page > 1) {
+        loadPage(ERROR_LIST.page - 1);
+    }
     return false;
 });
 
 $('.pagination-next').click(function () {
-    $('.listjs-pagination .active').next().trigger('click');
+    if (ERROR_LIST.page < ERROR_LIST.numPages) {
+        loadPage(ERROR_LIST.page + 1);
+    }
     return false;
 });
 
 $('#pageLength').change(function () {
-    TIMESTAMP_LIST_OBJECT.page = $(this).val();
-    TIMESTAMP_LIST_OBJECT.update();
-    $('.listjs-pagination li').first().trigger('click');
+    ERROR_LIST.pageSize = parseInt($(this).val(), 10);
+    loadPage(1);
 });
 
 $('#addTimestampAllCheck').on('change', function () {
@@ -237,6 +295,12 @@ var cancel = function (url) {
 
 var download = function (url) {
     var fileFormat = $('#fileFormat').val();
+    if (fileFormat === 'csv') {
+        // the whole filtered error list is exported by the server,
+        // which also logs the download
+        window.location.href = ERROR_LIST.csvUrl + '?' + $.param(errorListParams());
+        return;
+    }
     var fileList = TIMESTAMP_LIST_OBJECT.items.filter(function (item) {
         var checkbox = item.elm.querySelector('[type=checkbox]');
         if (checkbox) {
@@ -292,11 +356,6 @@ var download = function (url) {
     var fileFormatStr;
     var fileContent;
     switch (fileFormat) {
-        case 'csv':
-            fileFormatStr = 'CSV';
-            fileContent = generateCsv(fileList, HEADERS_ORDER, HEADER_NAMES);
-            saveTextFile(DOWNLOAD_FILENAME + '.csv', fileContent);
-            break;
         case 'json-ld':
             fileFormatStr = 'JSON/LD';
             fileContent = generateJson(fileList);
@@ -324,33 +383,6 @@ var download = function (url) {
     });
 };
 
-function generateCsv(fileList, headersOrder, headerNames) {
-    var content = '';
-
-    // Generate header
-    content += headersOrder.map(function (headerName) {
-        return headerNames[headerName];
-    }).join(',') + NEW_LINE;
-
-    // Generate content
-    content += fileList.map(function (file) {
-        return headersOrder.map(function (headerName) {
-            if (file[headerName] === null) {
-                return 'Unknown';
-            }
-            if (typeof file[headerName] === 'object') {
-                return '"""' + file[headerName].text + '""@' + file[headerName].lang + '"';
-            }
-            if (/["|,]/.test(file[headerName])) {
-                return '"' + file[headerName].replace(/"/g, '""') + '"';
-            }
-            return file[headerName];
-        }).join(',');
-    }).join(NEW_LINE);
-
-    return content;
-}
-
 function generateJson(fileList) {
     // Update headers as defined in HEADERS_NAME
     fileList = fileList.map(function (file) {
@@ -687,167 +719,46 @@ function initList() {
 
     // sort buttons code
 
-    // this is necessary because javascript doesn't provide the default compare function it uses
-    var defaultSort = function (a, b) {
-        if (a === b) {return 0;}
-        else {
-            var list = [a, b];
-            list.sort();
-            return list.indexOf(a) === 0 ? -1 : 1;
-        }
-    };
-
-    var sortFunction = function(a, b, options) {
-        if (a.values().provider !== b.values().provider) {
-            return defaultSort(a.values().provider, b.values().provider);
-        }
-        else {
-            return defaultSort(a.values()[options.valueName], b.values()[options.valueName]);
-        }
-    };
-
     var propertyNames = ['provider', 'file_path', 'verify_user_name_id', 'verify_date', 'verify_result_title'];
-    var clickSortUpElements = propertyNames.map(function(property_name) {
-        return 'sort_up_' + property_name;
-    }).map(function(click_sort_name) {
-        return document.getElementById(click_sort_name);
-    });
-
-    var propertyToUpElement = {};
-    propertyNames.forEach(function(propertyName, i) {
-        propertyToUpElement[propertyName] = clickSortUpElements[i];
-    });
-
-    var clickSortDownElements = propertyNames.map(function(property_name) {
-        return 'sort_down_' + property_name;
-    }).map(function(click_sort_name) {
-        return document.getElementById(click_sort_name);
-    });
-
-    var propertyToDownElement = {};
-    propertyNames.forEach(function(propertyName, i) {
-        propertyToDownElement[propertyName] = clickSortDownElements[i];
-    });
-
-    for (var upPropertyName in propertyToUpElement) {
-        var clickSortUpElement = propertyToUpElement[upPropertyName];
-        // closure to make sure propertyName is in scope at click time
-        clickSortUpElement.addEventListener('click', (function(propertyName, clickSortUpElements) {
-            return function(event) {
-
-                clickSortUpElements.forEach(function(element) {
-                    // written this way to ensure it works with IE
-                    element.classList.add('tb-sort-inactive');
-                });
-
-                clickSortDownElements.forEach(function(element) {
+    var sortElements = [];
+    propertyNames.forEach(function(propertyName) {
+        [['asc', 'sort_up_'], ['desc', 'sort_down_']].forEach(function(sortOrder) {
+            var element = document.getElementById(sortOrder[1] + propertyName);
+            sortElements.push(element);
+            element.addEventListener('click', function(event) {
+                sortElements.forEach(function(element) {
                     // written this way to ensure it works with IE
                     element.classList.add('tb-sort-inactive');
                 });
-
-                TIMESTAMP_LIST_OBJECT.sort(propertyName, {order: 'asc', sortFunction: sortFunction});
-
                 event.target.classList.remove('tb-sort-inactive');
 
-            };
-        })(upPropertyName, clickSortUpElements));
-    }
-
-    for (var downPropertyName in propertyToDownElement) {
-        var clickSortDownElement = propertyToDownElement[downPropertyName];
-        // closure to make sure upPropertyName is in scope at click time
-        clickSortDownElement.addEventListener('click', (function(upPropertyName, clickSortDownElements) {
-            return function(event) {
-
-                clickSortDownElements.forEach(function(element) {
-                    // written this way to ensure it works with IE
-                    element.classList.add('tb-sort-inactive');
-                });
-
-                clickSortUpElements.forEach(function(element) {
-                    // written this way to ensure it works with IE
-                    element.classList.add('tb-sort-inactive');
-                });
-
-                TIMESTAMP_LIST_OBJECT.sort(upPropertyName, {order: 'desc', sortFunction: sortFunction});
-
-                event.target.classList.remove('tb-sort-inactive');
-
-            };
-        })(downPropertyName, clickSortDownElements));
-    }
+                ERROR_LIST.sort = propertyName;
+                ERROR_LIST.order = sortOrder[0];
+                loadPage(1);
+            });
+        });
+    });
 
     // filter by users and date code
 
     var userFilterSelect = document.getElementById('userFilterSelect');
-    var alreadyAdded = [''];
-    var users = TIMESTAMP_LIST_OBJECT.items.map(function(i) {return i.values().verify_user_name_id;});
-
-    if (TIMESTAMP_LIST_OBJECT.items.length > TIMESTAMP_LIST_OBJECT.page) {
-        $('.pagination-wrap').show();
-    } else {
-        $('.pagination-wrap').hide();
-    }
-
-    for (var i = 0; i < users.length; i++) {
-        var userName = users[i];
-        if (alreadyAdded.indexOf(userName) === -1) {
-            var option = document.createElement('option');
-            option.value = userName;
-            option.textContent = userName;
-            userFilterSelect.add(option);
-            alreadyAdded.push(userName);
-        }
-    }
 
     document.getElementById('applyFiltersButton').addEventListener('click', function() {
-        var userName = userFilterSelect.value;
-        var userNameFilter = function(i) {return !userName || (!i.values().verify_user_name_id || (i.values().verify_user_name_id === userName));};
-        var filters = [userNameFilter];
-        var dateFilters = [
-            {
-                element: document.getElementById('startDateFilter'),
-                comparator: function(a, b) {return a >= b;}
-            },
-            {
-                element: document.getElementById('endDateFilter'),
-                comparator: function(a, b) {return a <= b;}
-            },
-        ];
-
-        for (var i = 0; i < dateFilters.length; i++) {
-            var element = dateFilters[i].element;
-            var comparator = dateFilters[i].comparator;
-            if (element.value) {
-                // closure to prevent different filters getting the same element
-                filters.push((function (elementValue, comparator) {
-                    return function(i) {
-                        // sets the time to midnight, which is the same as dates from the input fields
-                        // this is needed to make items appear when the filter is set to the same day
-                        var verify_date_day = new Date(i.values().verify_date);
-                        verify_date_day.setHours(0, 0, 0, 0);
-
-                        // .replace below gets rid of invisible characters IE inserts
-                        var dateComponents = elementValue.replace(/\u200E/g, '').split('-');
-
-                        var year = dateComponents[0];
-                        var month = dateComponents[1] - 1; // string starts at 1, parameter starts at 0
-                        var day = dateComponents[2];
-                        var filter_date_day = new Date(year, month, day);
-                        filter_date_day.setHours(0, 0, 0, 0);
-
-                        return !i.values().verify_date || comparator( verify_date_day, filter_date_day );
-                    };
-                })(element.value, comparator));
-            }
-        }
-
-        TIMESTAMP_LIST_OBJECT.filter(function (i) {
-            return filters.every(function(f) {return f(i);});
-        });
+        // .replace below gets rid of invisible characters IE inserts
+        ERROR_LIST.filters = {
+            user: userFilterSelect.value,
+            start_date: document.getElementById('startDateFilter').value.replace(/\u200E/g, ''),
+            end_date: document.getElementById('endDateFilter').value.replace(/\u200E/g, '')
+        };
+        loadPage(1);
     });
 
-    TIMESTAMP_LIST_OBJECT.sort('file_path', {order: 'asc', sortFunction: sortFunction});
+    // the first page is rendered by the server
+    var $list = $('#timestamp_error_list');
+    ERROR_LIST.numPages = parseInt($list.data('num-pages'), 10) || 1;
+    ERROR_LIST.pageSize = parseInt($list.data('page-size'), 10) || ERROR_LIST.pageSize;
+    $('#pageLength').val(ERROR_LIST.pageSize);
+    renderPagination();
 
 }
 
@@ -901,8 +812,17 @@ function checkHasTaskRunning () {
     }
 }
 
-function init(url) {
+// options: errorListUrl and errorListCsvUrl of the paginated error list,
+// formatDate(text) to format the dates of the loaded rows and
+// onPageLoaded() called after a page of the error list is shown
+function init(url, options) {
     taskStatusUrl = url;
+    $.extend(ERROR_LIST, {
+        url: options.errorListUrl,
+        csvUrl: options.errorListCsvUrl,
+        formatDate: options.formatDate || null,
+        onPageLoaded: options.onPageLoaded || null
+    });
     initList();
     initBootstrapDatePicker();
     checkHasTaskRunning();
@@ -14,24 +14,28 @@ timestampCommon.setWebOrAdmin('web');
 
 var moment = require('moment');
 
+function dateToLocal(dateText) {
+    if (dateText === 'Unknown') {
+        return dateText;
+    }
+    return new $osf.FormattableDate(new Date(dateText)).local;
+}
+
 function datesToLocal() {
     var cells = document.querySelectorAll('td[class=verify_date]');
     for (var i = 0; i < cells.length; i++) {
         var cell = cells[i];
-        var newDateText;
-        if (cell.textContent === 'Unknown') {
-            newDateText = cell.textContent;
-        }
-        else {
-            newDateText = new $osf.FormattableDate(new Date(cell.textContent)).local;
-        }
-        cell.textContent = newDateText;
+        cell.textContent = dateToLocal(cell.textContent);
         cell.style.color = 'inherit';
     }
 }
 
 $(document).ready(function () {
-    timestampCommon.init(window.contextVars.node.urls.api + 'timestamp/task_status/');
+    timestampCommon.init(window.contextVars.node.urls.api + 'timestamp/task_status/', {
+        errorListUrl: nodeApiUrl + 'timestamp/error_list/',
+        errorListCsvUrl: nodeApiUrl + 'timestamp/error_list/csv/',
+        formatDate: dateToLocal
+    });
 });
 
 $(function () {
@@ -53,6 +53,9 @@
                                     <div class="input-group-addon">${_("User")}</div>
                                     <select id="userFilterSelect" class="form-control">
                                         <option value=""></option>
+                                        % for user in error_list_users:
+                                        <option value="${ user['id'] }">${ user['name'] }</option>
+                                        % endfor
                                     </select>
                                 </div>
                             </div>
@@ -151,7 +154,7 @@
                                 </th>
                             </tr>
                         </thead>
-                        <tbody class="list" id="timestamp_error_list">
+                        <tbody class="list" id="timestamp_error_list" data-num-pages="${ error_list_page['num_pages'] }" data-page-size="${ error_list_page['page_size'] }">
                             % for provider_error_info in provider_list:
                                 % for error_info in provider_error_info['error_list']:
                                 <tr class="addTimestamp">
@@ -5,13 +5,16 @@ from addons.base import signals as file_signals
 from addons.osfstorage.models import OsfStorageFileNode, Region
 from api.base import settings as api_settings
 from django.contrib.contenttypes.models import ContentType
-from django.db.models import Sum
-from django.db.models.functions import Coalesce
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Greatest
 from osf.models import (
-    AbstractNode, BaseFileNode, FileLog, FileInfo, Guid, OSFUser, UserQuota,
-    ProjectStorageType
+    AbstractNode, BaseFileNode, FileLog, FileInfo, Guid, NodeQuotaUsage, OSFUser,
+    UserQuota, ProjectStorageType
 )
 from django.utils import timezone
+from framework.celery_tasks import app as celery_app
 
 
 PROVIDERS = ['s3', 's3compat']
@@ -25,28 +28,227 @@ def used_quota(user_id, storage_type=UserQuota.NII_STORAGE):
         _id=user_id,
         content_type_id=ContentType.objects.get_for_model(OSFUser).id
     )
-    projects_ids = AbstractNode.objects.filter(
+    users_used, _ = calculate_used_quota([guid.object_id], storage_type)
+    return users_used[guid.object_id]
+
+
+def calculate_used_quota(user_ids, storage_type=UserQuota.NII_STORAGE):
+    """Calculate the used quota of users and of their projects.
+
+    The sizes of the files are summed up by one aggregate query for all of
+    the users.  Returns ({user id: used}, {node id: used}).
+    """
+    projects = dict(AbstractNode.objects.filter(
         projectstoragetype__storage_type=storage_type,
         is_deleted=False,
-        creator_id=guid.object_id
-    ).values_list('id', flat=True)
+        creator_id__in=user_ids
+    ).values_list('id', 'creator_id'))
     if storage_type != UserQuota.NII_STORAGE:
-        files_ids = BaseFileNode.objects.filter(
-            target_object_id__in=projects_ids,
-            target_content_type_id=ContentType.objects.get_for_model(AbstractNode),
-            deleted_on=None,
-            deleted_by_id=None,
-        ).values_list('id', flat=True)
+        files = BaseFileNode.objects.all()
     else:
-        files_ids = OsfStorageFileNode.objects.filter(
-            target_object_id__in=projects_ids,
-            target_content_type_id=ContentType.objects.get_for_model(AbstractNode),
-            deleted_on=None,
-            deleted_by_id=None,
-        ).values_list('id', flat=True)
-    db_sum = FileInfo.objects.filter(file_id__in=files_ids).aggregate(
-        filesize_sum=Coalesce(Sum('file_size'), 0))
-    return db_sum['filesize_sum'] if db_sum['filesize_sum'] is not None else 0
+        files = OsfStorageFileNode.objects.all()
+    files_ids = files.filter(
+        target_object_id__in=list(projects.keys()),
+        target_content_type_id=ContentType.objects.get_for_model(AbstractNode),
+        deleted_on=None,
+        deleted_by_id=None,
+    ).values('id')
+    nodes_used = {node_id: 0 for node_id in projects}
+    if projects:
+        for node_id, used in FileInfo.objects.filter(file__in=files_ids).values_list(
+                'file__target_object_id').annotate(used=Sum('file_size')):
+            nodes_used[node_id] = used or 0
+    users_used = {user_id: 0 for user_id in user_ids}
+    for node_id, used in nodes_used.items():
+        users_used[projects[node_id]] += used
+    return users_used, nodes_used
+
+
+def reconcile_used_quota(user_ids, storage_type=UserQuota.NII_STORAGE, dry_run=False):
+    """Recalculate the used quota of users and fix the stored values.
+
+    The UserQuota rows are locked while recalculating, so the deltas added
+    by update_used_quota() meanwhile are not lost.  Returns the list of
+    (user id, stored used, calculated used) which did not match.
+    """
+    drift = []
+    with transaction.atomic():
+        user_quotas = {
+            user_quota.user_id: user_quota
+            for user_quota in UserQuota.objects.select_for_update().filter(
+                user_id__in=user_ids, storage_type=storage_type)
+        }
+        users_used, nodes_used = calculate_used_quota(user_ids, storage_type)
+        for user_id in user_ids:
+            user_quota = user_quotas.get(user_id)
+            stored = user_quota.used if user_quota is not None else 0
+            if stored != users_used[user_id]:
+                drift.append((user_id, stored, users_used[user_id]))
+        if dry_run:
+            return drift
+
+        for user_id, _, used in drift:
+            if user_id in user_quotas:
+                UserQuota.objects.filter(id=user_quotas[user_id].id).update(used=used)
+            else:
+                UserQuota.objects.create(
+                    user_id=user_id,
+                    storage_type=storage_type,
+                    max_quota=api_settings.DEFAULT_MAX_QUOTA,
+                    used=used,
+                )
+        node_usages = {
+            node_usage.node_id: node_usage
+            for node_usage in NodeQuotaUsage.objects.select_for_update().filter(
+                node_id__in=list(nodes_used.keys()))
+        }
+        new_node_usages = []
+        for node_id, used in nodes_used.items():
+            node_usage = node_usages.get(node_id)
+            if node_usage is None:
+                new_node_usages.append(NodeQuotaUsage(node_id=node_id, used=used))
+            elif node_usage.used != used:
+                NodeQuotaUsage.objects.filter(id=node_usage.id).update(used=used)
+        NodeQuotaUsage.objects.bulk_create(new_node_usages)
+    return drift
+
+
+RECALCULATION_QUEUED = 'queued'
+RECALCULATION_RUNNING = 'running'
+RECALCULATION_DONE = 'done'
+RECALCULATION_FAILED = 'failed'
+
+
+def recalculation_cache():
+    # shared by the admin app and the celery workers
+    return caches[api_settings.STORAGE_USAGE_CACHE_NAME]
+
+
+def recalculation_status_key(institution_id, storage_type):
+    return 'quota_recalculation:{}:{}'.format(institution_id, storage_type)
+
+
+def get_recalculation_statuses(institution_ids, storage_type=UserQuota.NII_STORAGE):
+    """Returns {institution id: status of the recalculation} of the institutions
+    which have been recalculated (see recalculate_used_quota_of_institution).
+    """
+    keys = {recalculation_status_key(institution_id, storage_type): institution_id
+            for institution_id in institution_ids}
+    return {keys[key]: status for key, status in recalculation_cache().get_many(list(keys)).items()}
+
+
+def get_recalculation_status(institution_id, storage_type=UserQuota.NII_STORAGE):
+    return get_recalculation_statuses([institution_id], storage_type).get(institution_id)
+
+
+def _update_recalculation_status(institution_id, storage_type, **kwargs):
+    status = get_recalculation_status(institution_id, storage_type) or {}
+    status.update(kwargs)
+    status['updated'] = timezone.now()
+    recalculation_cache().set(recalculation_status_key(institution_id, storage_type), status, None)
+    return status
+
+
+def users_with_changed_files(users, since):
+    """Filter the users to the creators of projects which have been modified,
+    or whose files have been modified or deleted, since the given time.
+    """
+    changed_files = BaseFileNode.objects.filter(
+        target_content_type_id=ContentType.objects.get_for_model(AbstractNode),
+        modified__gte=since,
+    ).values('target_object_id')
+    return users.filter(
+        Q(nodes_created__id__in=changed_files) | Q(nodes_created__modified__gte=since)
+    ).distinct()
+
+
+def start_used_quota_recalculation(institution_ids, storage_type=UserQuota.NII_STORAGE, changed_only=False):
+    """Enqueue the recalculation of the used quota of the users of the institutions."""
+    for institution_id in institution_ids:
+        _update_recalculation_status(
+            institution_id, storage_type,
+            status=RECALCULATION_QUEUED, changed_only=changed_only,
+            processed=0, total=None, drifted=0, error=None)
+        recalculate_used_quota_of_institution.delay(
+            institution_id, storage_type, changed_only=changed_only)
+
+
+@celery_app.task(ignore_results=True, name='website.util.quota.recalculate_used_quota_of_institution')
+def recalculate_used_quota_of_institution(institution_id, storage_type=UserQuota.NII_STORAGE,
+                                          changed_only=False, chunk_size=None):
+    """Recalculate the used quota of the users of an institution, chunk_size users at a time
+    with one aggregate query per chunk (see reconcile_used_quota).
+
+    The progress is saved as the status of the recalculation.  If changed_only,
+    only the users whose files have been changed since the last recalculation
+    are recalculated.
+    """
+    chunk_size = chunk_size or api_settings.QUOTA_RECALCULATION_CHUNK_SIZE
+    status = get_recalculation_status(institution_id, storage_type) or {}
+    started = timezone.now()
+
+    users = OSFUser.objects.filter(affiliated_institutions=institution_id)
+    if changed_only and status.get('last_started'):
+        users = users_with_changed_files(users, status['last_started'])
+    user_ids = list(users.order_by('id').values_list('id', flat=True))
+    _update_recalculation_status(
+        institution_id, storage_type,
+        status=RECALCULATION_RUNNING, started=started,
+        processed=0, total=len(user_ids), drifted=0, error=None)
+
+    processed = drifted = 0
+    try:
+        for i in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[i:i + chunk_size]
+            drifted += len(reconcile_used_quota(chunk, storage_type))
+            processed += len(chunk)
+            _update_recalculation_status(
+                institution_id, storage_type, processed=processed, drifted=drifted)
+    except Exception as e:
+        logger.exception('Recalculation of the used quota of institution {} failed'.format(institution_id))
+        _update_recalculation_status(institution_id, storage_type, status=RECALCULATION_FAILED, error=str(e))
+        raise
+    # files changed while recalculating are recalculated again next time
+    _update_recalculation_status(
+        institution_id, storage_type,
+        status=RECALCULATION_DONE, finished=timezone.now(), last_started=started)
+    logger.info('Used quota of {} users of institution {} recalculated ({} drifted)'.format(
+        processed, institution_id, drifted))
+
+
+def add_used_quota(node, storage_type, delta):
+    """Add delta (bytes, may be negative) to the used quota of the project
+    and of its creator.
+
+    The values are updated by F() expressions, so concurrent updates are not
+    lost.  They never become negative.
+    """
+    if delta == 0:
+        return
+    updated = UserQuota.objects.filter(
+        user=node.creator,
+        storage_type=storage_type
+    ).update(used=Greatest(F('used') + delta, 0))
+    if not updated and delta > 0:
+        _, created = UserQuota.objects.get_or_create(
+            user=node.creator,
+            storage_type=storage_type,
+            defaults={'max_quota': api_settings.DEFAULT_MAX_QUOTA, 'used': delta}
+        )
+        if not created:  # created by another request meanwhile
+            UserQuota.objects.filter(
+                user=node.creator,
+                storage_type=storage_type
+            ).update(used=Greatest(F('used') + delta, 0))
+
+    updated = NodeQuotaUsage.objects.filter(node=node).update(
+        used=Greatest(F('used') + delta, 0))
+    if not updated and delta > 0:
+        _, created = NodeQuotaUsage.objects.get_or_create(
+            node=node, defaults={'used': delta})
+        if not created:
+            NodeQuotaUsage.objects.filter(node=node).update(
+                used=Greatest(F('used') + delta, 0))
 
 
 def update_user_used_quota(user, storage_type=UserQuota.NII_STORAGE):
@@ -60,12 +262,13 @@ def update_user_used_quota(user, storage_type=UserQuota.NII_STORAGE):
         user_quota.used = used
         user_quota.save()
     except UserQuota.DoesNotExist:
-        UserQuota.objects.create(
+        user_quota = UserQuota.objects.create(
             user=user,
             storage_type=storage_type,
             max_quota=api_settings.DEFAULT_MAX_QUOTA,
             used=used,
         )
+    return user_quota
 
 
 def abbreviate_size(size):
@@ -84,7 +287,8 @@ def get_quota_info(user, storage_type=UserQuota.NII_STORAGE):
         user_quota = user.userquota_set.get(storage_type=storage_type)
         return (user_quota.max_quota, user_quota.used)
     except UserQuota.DoesNotExist:
-        return (api_settings.DEFAULT_MAX_QUOTA, used_quota(user._id, storage_type))
+        user_quota = update_user_used_quota(user, storage_type)
+        return (user_quota.max_quota, user_quota.used)
 
 def get_project_storage_type(node):
     try:
@@ -98,29 +302,12 @@ def update_used_quota(self, target, user, event_type, payload):
         destination = dict(payload).get('destination')
         source = dict(payload).get('source')
         if dict(destination).get('provider') in PROVIDERS:
-            nodes_filter = []
-            if dict(destination).get('kind') == 'file':
-
-                nodes_filter = BaseFileNode.objects.filter(
-                    _path=dict(source).get('path'),
-                    provider=dict(destination).get('provider'),
-                    target_object_id=target.id,
-                    deleted=None,
-                    target_content_type_id=ContentType.objects.get_for_model(AbstractNode),
-                )
-            elif dict(destination).get('kind') == 'folder':
-
-                nodes_filter = BaseFileNode.objects.filter(
-                    _path__startswith=dict(source).get('path'),
-                    provider=dict(destination).get('provider'),
-                    target_object_id=target.id,
-                    deleted=None,
-                    target_content_type_id=ContentType.objects.get_for_model(AbstractNode),
-                )
-            for node in nodes_filter:
-                node._path = node._path.replace(dict(source).get('path'), dict(destination).get('path'))
-                node._materialized_path = node._path.replace(dict(source).get('path'), dict(destination).get('path'))
-                node.save()
+            BaseFileNode.objects.move_subtree(
+                target,
+                dict(destination).get('provider'),
+                dict(source).get('path'),
+                dict(destination).get('path'),
+            )
             lastest_node = BaseFileNode.objects.filter(
                 _path=dict(destination).get('path'),
                 provider=dict(destination).get('provider'),
@@ -183,25 +370,10 @@ def update_used_quota(self, target, user, event_type, payload):
                 file_node.save()
                 node_removed(target, user, payload, file_node, storage_type)
             elif metadata_provider in PROVIDERS and data.get('kind') == 'folder':
-                list_file_node = BaseFileNode.objects.filter(
-                    _path__startswith=data.get('materialized'),
-                    target_object_id=target.id,
-                    provider=metadata_provider,
-                    deleted=None,
-                    target_content_type_id=ContentType.objects.get_for_model(AbstractNode),
-                ).all()
-                for file_node_remove in list_file_node:
-                    file_node_remove.is_deleted = True
-                    if file_node_remove.type == 'osf.{}file'.format(metadata_provider):
-                        file_node_remove.type = 'osf.trashedfile'
-                    elif file_node_remove.type == 'osf.{}folder'.format(metadata_provider):
-                        file_node_remove.type = 'osf.trashedfolder'
-                    file_node_remove.deleted = timezone.now()
-                    file_node_remove.deleted_on = file_node_remove.deleted
-                    file_node_remove.deleted_by_id = user.id
-                    file_node_remove.save()
-                    if file_node_remove.type == 'osf.trashedfile':
-                        node_removed(target, user, payload, file_node_remove, storage_type)
+                removed_file_ids = BaseFileNode.objects.trash_subtree(
+                    target, metadata_provider, data.get('materialized'), user)
+                add_used_quota(target, storage_type, -files_size(
+                    BaseFileNode.objects.filter(id__in=removed_file_ids)))
             else:
                 node_removed(target, user, payload, file_node, storage_type)
         elif event_type == FileLog.FILE_UPDATED:
@@ -214,64 +386,36 @@ def file_added(target, payload, file_node, storage_type):
     file_size = int(payload['metadata']['size'])
     if file_size < 0:
         return
-    try:
-        user_quota = UserQuota.objects.get(
-            user=target.creator,
-            storage_type=storage_type
-        )
-        user_quota.used += file_size
-        user_quota.save()
-    except UserQuota.DoesNotExist:
-        UserQuota.objects.create(
-            user=target.creator,
-            storage_type=storage_type,
-            max_quota=api_settings.DEFAULT_MAX_QUOTA,
-            used=file_size
-        )
+    add_used_quota(target, storage_type, file_size)
 
     FileInfo.objects.create(file=file_node, file_size=file_size)
 
 def node_removed(target, user, payload, file_node, storage_type):
-    user_quota = UserQuota.objects.filter(
-        user=target.creator,
-        storage_type=storage_type
-    ).first()
-    if user_quota is not None:
-        if 'osf.trashed' not in file_node.type:
-            logging.error('FileNode is not trashed, cannot update used quota!')
-            return
+    if 'osf.trashed' not in file_node.type:
+        logging.error('FileNode is not trashed, cannot update used quota!')
+        return
 
-        for removed_file in get_node_file_list(file_node):
-            try:
-                file_info = FileInfo.objects.get(file=removed_file)
-            except FileInfo.DoesNotExist:
-                logging.error('FileInfo not found, cannot update used quota!')
-                continue
+    add_used_quota(target, storage_type, -files_size(get_node_file_list(file_node)))
 
-            file_size = min(file_info.file_size, user_quota.used)
-            user_quota.used -= file_size
-        user_quota.save()
+def files_size(files):
+    """Returns the total size of files (a queryset) by one aggregate query."""
+    result = FileInfo.objects.filter(file__in=files).aggregate(
+        file_count=Count('id'), file_size=Sum('file_size'))
+    if result['file_count'] < files.count():
+        logging.error('FileInfo not found, cannot update used quota!')
+    return result['file_size'] or 0
 
 def file_modified(target, user, payload, file_node, storage_type):
     file_size = int(payload['metadata']['size'])
     if file_size < 0:
         return
 
-    user_quota, _ = UserQuota.objects.get_or_create(
-        user=target.creator,
-        storage_type=storage_type,
-        defaults={'max_quota': api_settings.DEFAULT_MAX_QUOTA}
-    )
-
     try:
         file_info = FileInfo.objects.get(file=file_node)
     except FileInfo.DoesNotExist:
         file_info = FileInfo(file=file_node, file_size=0)
 
-    user_quota.used += file_size - file_info.file_size
-    if user_quota.used < 0:
-        user_quota.used = 0
-    user_quota.save()
+    add_used_quota(target, storage_type, file_size - file_info.file_size)
 
     file_info.file_size = file_size
     file_info.save()
@@ -297,19 +441,7 @@ def update_default_storage(user):
                     logger.info(u'user={}, institution={}, user_settings.set_region({})'.format(user, institution.name, region.name))
 
 def get_node_file_list(file_node):
+    """Returns a queryset of the files in (or of) file_node."""
     if 'file' in file_node.type:
-        return [file_node]
-
-    file_list = []
-    folder_list = [file_node]
-
-    while len(folder_list) > 0:
-        folder_id_list = list(map(lambda f: f.id, folder_list))
-        folder_list = []
-        for child_file_node in BaseFileNode.objects.filter(parent_id__in=folder_id_list):
-            if 'folder' in child_file_node.type:
-                folder_list.append(child_file_node)
-            else:  # file
-                file_list.append(child_file_node)
-
-    return file_list
+        return BaseFileNode.objects.filter(id=file_node.id)
+    return BaseFileNode.objects.get_descendants(file_node).exclude(type__contains='folder')
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+'''In-process RFC 3161 time-stamp request builder and response verifier.
+
+This is used instead of `openssl ts -query` / `openssl ts -verify` when
+api_settings.TIMESTAMP_BACKEND is TIMESTAMP_BACKEND_PYTHON.
+'''
+from __future__ import absolute_import
+import datetime
+import hashlib
+import logging
+import os
+import threading
+
+from asn1crypto import pem, tsp
+from asn1crypto import x509 as asn1_x509
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+PKI_STATUS_OK = ('granted', 'granted_with_mods')
+SIGNER_KEY_USAGES = {'digital_signature', 'non_repudiation'}
+
+_HASHES = {
+    'sha1': hashes.SHA1,
+    'sha224': hashes.SHA224,
+    'sha256': hashes.SHA256,
+    'sha384': hashes.SHA384,
+    'sha512': hashes.SHA512,
+}
+
+
+class TimestampVerifyError(Exception):
+    pass
+
+
+def new_hash(hash_type):
+    if hash_type not in _HASHES:
+        raise TimestampVerifyError('unsupported hash algorithm: {}'.format(hash_type))
+    return hashlib.new(hash_type)
+
+def file_digest(file_name, hash_type):
+    h = new_hash(hash_type)
+    with open(file_name, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.digest()
+
+def build_request(digest, hash_type, cert_req=True, nonce=True):
+    '''Create a DER encoded TimeStampReq (same as `openssl ts -query -cert`).
+
+    digest: bytes or hex string
+    '''
+    if not isinstance(digest, bytes):
+        digest = bytes(bytearray.fromhex(digest))
+    new_hash(hash_type)  # check only
+    req = {
+        'version': 'v1',
+        'message_imprint': {
+            'hash_algorithm': {'algorithm': hash_type},
+            'hashed_message': digest,
+        },
+        'cert_req': cert_req,
+    }
+    if nonce:
+        req['nonce'] = int.from_bytes(os.urandom(8), 'big')
+    return tsp.TimeStampReq(req).dump()
+
+def build_request_for_file(file_name, hash_type='sha512'):
+    return build_request(file_digest(file_name, hash_type), hash_type)
+
+
+_root_cache = {}
+_root_cache_lock = threading.Lock()
+
+def load_root_certificates(path):
+    '''Load (and cache) the trusted certificates in a PEM/DER file.
+
+    The parsed result is reused until the file is modified.
+    '''
+    mtime = os.path.getmtime(path)
+    with _root_cache_lock:
+        cached = _root_cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+    with open(path, 'rb') as f:
+        data = f.read()
+    certs = []
+    if pem.detect(data):
+        for _, _, der in pem.unarmor(data, multiple=True):
+            certs.append(asn1_x509.Certificate.load(der))
+    else:
+        certs.append(asn1_x509.Certificate.load(data))
+    with _root_cache_lock:
+        _root_cache[path] = (mtime, certs)
+    return certs
+
+
+def _to_crypto_cert(cert):
+    return x509.load_der_x509_certificate(cert.dump(), default_backend())
+
+def _verify_signature(public_key, signature, data, hash_type, signature_algo='rsassa_pkcs1v15'):
+    hash_algo = _HASHES[hash_type]()
+    if isinstance(public_key, rsa.RSAPublicKey):
+        if signature_algo == 'rsassa_pss':
+            pad = padding.PSS(mgf=padding.MGF1(hash_algo), salt_length=padding.PSS.AUTO)
+        else:
+            pad = padding.PKCS1v15()
+        public_key.verify(signature, data, pad, hash_algo)
+    elif isinstance(public_key, ec.EllipticCurvePublicKey):
+        public_key.verify(signature, data, ec.ECDSA(hash_algo))
+    else:
+        raise TimestampVerifyError('unsupported public key type')
+
+def _verify_issued_by(cert, issuer):
+    '''Check that cert (asn1crypto) is signed by issuer (asn1crypto).'''
+    if cert.issuer != issuer.subject:
+        return False
+    signed = cert['signature_algorithm']
+    try:
+        _verify_signature(
+            _to_crypto_cert(issuer).public_key(),
+            cert['signature_value'].native,
+            cert['tbs_certificate'].dump(),
+            signed.hash_algo, signed.signature_algo)
+    except (InvalidSignature, TimestampVerifyError, ValueError):
+        return False
+    return True
+
+def _is_self_signed(cert):
+    return cert.issuer == cert.subject and _verify_issued_by(cert, cert)
+
+def _check_validity(cert, now):
+    validity = cert['tbs_certificate']['validity']
+    if now < validity['not_before'].native or validity['not_after'].native < now:
+        raise TimestampVerifyError(
+            'certificate is not valid at {}: {}'.format(now, cert.subject.human_friendly))
+
+def _check_signer_certificate(cert):
+    '''Check the purpose of the TSA certificate (as X509_PURPOSE_TIMESTAMP_SIGN).
+
+    The extended key usage must be critical and only timeStamping.
+    '''
+    eku = [ext for ext in cert['tbs_certificate']['extensions'] or []
+           if ext['extn_id'].native == 'extended_key_usage']
+    if not eku or not eku[0]['critical'].native or \
+            eku[0]['extn_value'].parsed.native != ['time_stamping']:
+        raise TimestampVerifyError('signer certificate is not for time stamping')
+    if cert.key_usage_value is not None:
+        usages = set(cert.key_usage_value.native)
+        if not usages & SIGNER_KEY_USAGES or usages - SIGNER_KEY_USAGES:
+            raise TimestampVerifyError('key usage of signer certificate is not for time stamping')
+
+def _check_issuer_certificate(issuer, depth):
+    '''Check that issuer may issue a chain of depth (non self-issued) certificates below it.'''
+    constraints = issuer.basic_constraints_value
+    if constraints is None or not constraints['ca'].native:
+        raise TimestampVerifyError(
+            'issuer certificate is not a CA: {}'.format(issuer.subject.human_friendly))
+    if issuer.key_usage_value is not None and \
+            'key_cert_sign' not in issuer.key_usage_value.native:
+        raise TimestampVerifyError(
+            'issuer certificate is not for signing certificates: {}'.format(issuer.subject.human_friendly))
+    path_len = constraints['path_len_constraint'].native
+    if path_len is not None and depth - 1 > path_len:
+        raise TimestampVerifyError(
+            'path length constraint exceeded: {}'.format(issuer.subject.human_friendly))
+
+def _check_signing_certificate_attr(signed_attrs, signer_cert):
+    '''Check the ESS signingCertificate(V2) attribute against the signer certificate.'''
+    ess = None
+    for attr in signed_attrs:
+        if attr['type'].native in ('signing_certificate', 'signing_certificate_v2'):
+            ess = attr
+    if ess is None:
+        raise TimestampVerifyError('ESS signing certificate attribute is missing')
+    cert_ids = ess['values'][0]['certs']
+    if not len(cert_ids):
+        raise TimestampVerifyError('ESS signing certificate attribute is empty')
+    cert_id = cert_ids[0]
+    if ess['type'].native == 'signing_certificate':
+        hash_type = 'sha1'
+    else:
+        hash_type = cert_id['hash_algorithm']['algorithm'].native
+    cert_hash = new_hash(hash_type)
+    cert_hash.update(signer_cert.dump())
+    if cert_id['cert_hash'].native != cert_hash.digest():
+        raise TimestampVerifyError('ESS signing certificate does not match the signer certificate')
+    issuer_serial = cert_id['issuer_serial']
+    if issuer_serial.native is not None:
+        if issuer_serial['serial_number'].native != signer_cert.serial_number or \
+                not any(name.name == 'directory_name' and name.chosen == signer_cert.issuer
+                        for name in issuer_serial['issuer']):
+            raise TimestampVerifyError('ESS signing certificate does not match the signer certificate')
+
+def _find_signer_cert(signer_info, certs):
+    sid = signer_info['sid']
+    for cert in certs:
+        if sid.name == 'issuer_and_serial_number':
+            if cert.issuer == sid.chosen['issuer'] and \
+                    cert.serial_number == sid.chosen['serial_number'].native:
+                return cert
+        elif cert.key_identifier == sid.chosen.native:
+            return cert
+    raise TimestampVerifyError('signer certificate not found')
+
+def _verify_chain(cert, untrusted, trusted, now=None):
+    '''Build and check the chain from cert to a trusted self-signed certificate.
+
+    As `openssl verify` (without -partial_chain), a trusted certificate
+    which is not self-signed is not a trust anchor; every certificate of
+    the chain must be valid at now, and the issuers must be CAs.
+    '''
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+    trusted_der = set(c.dump() for c in trusted)
+    candidates = list(trusted) + list(untrusted)
+    current = cert
+    depth = 0
+    chain = set()
+    while True:
+        _check_validity(current, now)
+        if current.dump() in trusted_der and _is_self_signed(current):
+            return
+        chain.add(current.dump())
+        for issuer in candidates:
+            if issuer.dump() in chain:
+                continue
+            if _verify_issued_by(current, issuer):
+                _check_issuer_certificate(issuer, depth)
+                if current.issuer != current.subject:
+                    depth += 1
+                current = issuer
+                break
+        else:
+            raise TimestampVerifyError('certificate chain verification failed')
+
+def parse_response(tsr):
+    '''Returns (signed_data, tst_info) of a DER encoded TimeStampResp.'''
+    try:
+        resp = tsp.TimeStampResp.load(tsr)
+        status = resp['status']['status'].native
+    except Exception as e:
+        raise TimestampVerifyError('invalid timestamp response: {}'.format(e))
+    if status not in PKI_STATUS_OK:
+        raise TimestampVerifyError('timestamp response status: {}'.format(status))
+    token = resp['time_stamp_token']
+    if token['content_type'].native != 'signed_data':
+        raise TimestampVerifyError('timestamp token is not signed data')
+    signed_data = token['content']
+    encap = signed_data['encap_content_info']
+    if encap['content_type'].native != 'tst_info':
+        raise TimestampVerifyError('timestamp token does not contain TSTInfo')
+    return signed_data, encap['content'].parsed
+
+def verify_response(tsr, digest, ca_certs):
+    '''Verify a DER encoded TimeStampResp against a message digest.
+
+    Checks what `openssl ts -verify -digest ... -in tsr -CAfile ca` checks:
+    the message imprint, the signature, the ESS signing certificate, the
+    purpose of the TSA certificate and its chain to a trusted self-signed
+    certificate (validity period and CA constraints).
+    Returns the TSTInfo on success and raises TimestampVerifyError otherwise.
+    '''
+    if not isinstance(digest, bytes):
+        digest = bytes(bytearray.fromhex(digest))
+    signed_data, tst_info = parse_response(tsr)
+
+    if tst_info['message_imprint']['hashed_message'].native != digest:
+        raise TimestampVerifyError('message imprint mismatch')
+
+    signer_infos = signed_data['signer_infos']
+    if len(signer_infos) != 1:
+        raise TimestampVerifyError('timestamp token must have exactly one signer')
+    signer_info = signer_infos[0]
+    certs = [c.chosen for c in (signed_data['certificates'] or [])
+             if isinstance(c.chosen, asn1_x509.Certificate)]
+    signer_cert = _find_signer_cert(signer_info, certs + list(ca_certs))
+
+    _check_signer_certificate(signer_cert)
+
+    hash_type = signer_info['digest_algorithm']['algorithm'].native
+    signed_attrs = signer_info['signed_attrs']
+    content = signed_data['encap_content_info']['content'].contents
+    if not signed_attrs:
+        raise TimestampVerifyError('signed attributes are missing')
+    message_digest = None
+    for attr in signed_attrs:
+        if attr['type'].native == 'message_digest':
+            message_digest = attr['values'][0].native
+    content_digest = new_hash(hash_type)
+    content_digest.update(content)
+    if message_digest != content_digest.digest():
+        raise TimestampVerifyError('content digest mismatch')
+    _check_signing_certificate_attr(signed_attrs, signer_cert)
+
+    # signature is calculated over the DER encoding of SET OF attributes
+    signed_der = signed_attrs.dump()
+    signed_der = b'\x31' + signed_der[1:]
+    try:
+        _verify_signature(
+            _to_crypto_cert(signer_cert).public_key(),
+            signer_info['signature'].native, signed_der, hash_type,
+            signer_info['signature_algorithm'].signature_algo)
+    except InvalidSignature:
+        raise TimestampVerifyError('signature verification failed')
+
+    _verify_chain(signer_cert, certs, ca_certs)
+    return tst_info
+
+def verify_response_for_file(tsr, file_name, ca_certs):
+    '''Verify a TimeStampResp against the contents of a file.
+
+    The hash algorithm of the message imprint in the token is used.
+    '''
+    _, tst_info = parse_response(tsr)
+    hash_type = tst_info['message_imprint']['hash_algorithm']['algorithm'].native
+    return verify_response(tsr, file_digest(file_name, hash_type), ca_certs)
+
+def is_valid(tsr, digest, ca_certs):
+    try:
+        verify_response(tsr, digest, ca_certs)
+    except TimestampVerifyError as e:
+        logger.info('timestamp verification failed: {}'.format(e))
+        return False
+    return True
@@ -2,6 +2,7 @@
 '''Common functions for timestamp.
 '''
 from __future__ import absolute_import
+import csv
 import datetime
 import hashlib
 import logging
@@ -11,27 +12,38 @@ import shlex
 import shutil
 import subprocess
 import tempfile
+import threading
 import time
 import traceback
 
+from future.moves import queue
+
 from urllib3.util.retry import Retry
 import requests
 
 from api.base import settings as api_settings
 from api.base.utils import waterbutler_api_url_for
 from celery.contrib.abortable import AbortableTask, AbortableAsyncResult
+from django import db
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Concat, Substr
 from django.utils import timezone
 from osf.models import (
-    AbstractNode, BaseFileNode, Guid, RdmFileTimestamptokenVerifyResult, RdmUserKey,
-    OSFUser, TimestampTask
+    AbstractNode, BaseFileNode, BaseFileVersionsThrough, Guid,
+    RdmFileTimestamptokenVerifyResult, RdmUserKey, OSFUser, TimestampTask,
+    TimestampFileInventory
 )
 from osf.models.nodelog import NodeLog
 from website import util
 from website import settings
+from website.util import rfc3161
 from website.util import waterbutler
 
 from django.contrib.contenttypes.models import ContentType
 from framework.celery_tasks import app as celery_app
+from framework.celery_tasks.handlers import enqueue_task
 from framework.auth import Auth
 from inspect import currentframe
 
@@ -64,6 +76,10 @@ TIMESTAMP_MSG_MAP = {
         api_settings.TIME_STAMP_STORAGE_DISCONNECTED_MSG,
     api_settings.TIME_STAMP_STORAGE_NOT_ACCESSIBLE:
         api_settings.TIME_STAMP_STORAGE_NOT_ACCESSIBLE_MSG,
+    api_settings.TIME_STAMP_TOKEN_PENDING:
+        api_settings.TIME_STAMP_TOKEN_PENDING_MSG,
+    api_settings.TIME_STAMP_TOKEN_PROCESSING:
+        api_settings.TIME_STAMP_TOKEN_PROCESSING_MSG,
 }
 
 RESULT_MESSAGE = TIMESTAMP_MSG_MAP
@@ -117,25 +133,165 @@ def get_async_task_data(node):
             TimestampTask.objects.filter(node=node).delete()
     return task_data
 
-def get_error_list(pid):
-    '''Retrieve from the database the list of all timestamps that has an error.
-    '''
-    data_list = RdmFileTimestamptokenVerifyResult.objects.filter(project_id=pid).order_by('provider', 'path')
-    provider_error_list = []
-    provider = None
-    error_list = []
+ERROR_LIST_CHUNK_SIZE = 500
 
-    for data in data_list:
-        if data.inspection_result_status == api_settings.TIME_STAMP_TOKEN_CHECK_SUCCESS:
-            continue
+ERROR_LIST_PAGE_SIZE = 10
+
+ERROR_LIST_MAX_PAGE_SIZE = 1000
+
+# sort keys of the error list pages and the columns they are ordered by
+ERROR_LIST_ORDERING = {
+    'provider': 'provider',
+    'file_path': 'path',
+    'verify_user_name_id': 'verify_user_name',
+    'verify_date': 'verify_date',
+    'verify_result_title': 'inspection_result_status',
+}
+
+ERROR_LIST_CSV_COLUMNS = [
+    'provider', 'file_id', 'file_path', 'file_version',
+    'file_size_on_upload', 'file_size_on_verify',
+    'file_create_date_on_upload', 'file_create_date_on_verify',
+    'file_modify_date_on_upload', 'file_modify_date_on_verify',
+    'creator_id', 'creator_name', 'creator_email',
+    'organization_id', 'organization_name',
+    'verify_user_id', 'verify_user_name', 'verify_date', 'verify_result_title',
+]
+
+def get_error_queryset(pid, verify_user=None, start_date=None, end_date=None,
+                       sort='file_path', order='asc'):
+    """Return the verify results with an error of a project.
+
+    The results of unknown users or dates pass the user and date filters.
+    The results are ordered by provider first, then by the sort key.
+    """
+    queryset = RdmFileTimestamptokenVerifyResult.objects.filter(
+        project_id=pid
+    ).exclude(
+        inspection_result_status=api_settings.TIME_STAMP_TOKEN_CHECK_SUCCESS
+    )
+    if verify_user:
+        user_id = OSFUser.objects.filter(guids___id=verify_user).values_list('id', flat=True).first()
+        queryset = queryset.filter(Q(verify_user=user_id) | Q(verify_user__isnull=True))
+    if start_date is not None:
+        queryset = queryset.filter(Q(verify_date__date__gte=start_date) | Q(verify_date__isnull=True))
+    if end_date is not None:
+        queryset = queryset.filter(Q(verify_date__date__lte=end_date) | Q(verify_date__isnull=True))
+
+    column = ERROR_LIST_ORDERING.get(sort, 'path')
+    if column == 'verify_user_name':
+        queryset = queryset.annotate(verify_user_name=Subquery(
+            OSFUser.objects.filter(id=OuterRef('verify_user')).values('fullname')[:1]
+        ))
+    if order == 'desc':
+        column = '-' + column
+    return queryset.order_by('provider', column, 'id')
+
+def get_error_list_filters(args):
+    """Read the filters and the ordering of the error list from request arguments.
+    """
+    def parse_date(value):
+        try:
+            return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+        except (TypeError, ValueError):
+            return None
+
+    return {
+        'verify_user': args.get('user') or None,
+        'start_date': parse_date(args.get('start_date')),
+        'end_date': parse_date(args.get('end_date')),
+        'sort': args.get('sort') if args.get('sort') in ERROR_LIST_ORDERING else 'file_path',
+        'order': 'desc' if args.get('order') == 'desc' else 'asc',
+    }
+
+def get_error_list_page(pid, page=1, page_size=None, **filters):
+    """Return one page of the error list with the pagination information.
+    """
+    try:
+        page_size = max(1, min(int(page_size or ERROR_LIST_PAGE_SIZE), ERROR_LIST_MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        page_size = ERROR_LIST_PAGE_SIZE
+    paginator = Paginator(get_error_queryset(pid, **filters), page_size)
+    try:
+        current_page = paginator.page(page)
+    except PageNotAnInteger:
+        current_page = paginator.page(1)
+    except EmptyPage:
+        current_page = paginator.page(paginator.num_pages)
+    provider_list = []
+    if paginator.count:
+        provider_list = get_error_list(
+            pid, offset=current_page.start_index() - 1, limit=page_size, **filters)
+    return {
+        'count': paginator.count,
+        'num_pages': paginator.num_pages,
+        'page': current_page.number,
+        'page_size': page_size,
+        'provider_list': provider_list,
+    }
+
+def get_error_list_users(pid):
+    """Return the users who verified the error list of a project, for the user filter.
+    """
+    user_ids = RdmFileTimestamptokenVerifyResult.objects.filter(
+        project_id=pid, verify_user__isnull=False
+    ).exclude(
+        inspection_result_status=api_settings.TIME_STAMP_TOKEN_CHECK_SUCCESS
+    ).values('verify_user')
+    return [
+        {'id': user._id, 'name': u'{} ({})'.format(user.fullname, user._id.upper())}
+        for user in OSFUser.objects.filter(id__in=user_ids).order_by('fullname', 'id')
+    ]
+
+def count_error_list(pid):
+    return get_error_queryset(pid).count()
+
+def _hydrate_error_list(data_list):
+    """Generate the error_info dictionaries of a chunk of verify results.
+
+    The referenced file nodes, users and institutions are loaded by a
+    constant number of queries per chunk.
+    """
+    file_nodes = {}
+    latest_version = BaseFileVersionsThrough.objects.filter(
+        basefilenode=OuterRef('pk')
+    ).order_by('-fileversion_id').values('fileversion__creator_id')[:1]
+    for file_node in BaseFileNode.objects.filter(
+        _id__in=[data.file_id for data in data_list]
+    ).annotate(
+        version_count=Count('versions'),
+        latest_creator_id=Subquery(latest_version),
+    ).values('_id', 'version_count', 'latest_creator_id'):
+        file_nodes[file_node['_id']] = file_node
+
+    def creator_id_of(data):
+        if data.upload_file_modified_user is not None:
+            return data.upload_file_modified_user
+        if data.upload_file_created_user is not None:
+            return data.upload_file_created_user
+        file_node = file_nodes.get(data.file_id)
+        if file_node is not None:
+            return file_node['latest_creator_id']
+        return None
+
+    creator_ids = set(creator_id_of(data) for data in data_list)
+    creator_ids.discard(None)
+    user_ids = creator_ids | set(data.verify_user for data in data_list)
+    users = dict((user.id, user) for user in OSFUser.objects.filter(id__in=user_ids))
 
-        if not provider:
-            provider = data.provider
-        elif provider != data.provider:
-            provider_error_list.append({'provider': provider, 'error_list': error_list})
-            provider = data.provider
-            error_list = []
+    # same as OSFUser.affiliated_institutions.first()
+    institutions = {}
+    for affiliation in OSFUser.affiliated_institutions.through.objects.filter(
+        osfuser_id__in=creator_ids
+    ).order_by('osfuser_id', 'institution_id').values(
+        'osfuser_id', 'institution___id', 'institution__name'
+    ):
+        institutions.setdefault(affiliation['osfuser_id'], affiliation)
 
+    def empty_if_none(value):
+        return '' if value is None else value
+
+    for data in data_list:
         if data.inspection_result_status in RESULT_MESSAGE:
             verify_result_title = RESULT_MESSAGE[data.inspection_result_status]
         else:  # 'FILE missing(Unverify)'
@@ -147,51 +303,19 @@ def get_error_list(pid):
         else:
             verify_date = ''
 
-        # Get file info
-        base_file_data = BaseFileNode.objects.filter(_id=data.file_id)
-        base_file_data_exists = base_file_data.exists()
-        file_versions = None
-        if base_file_data_exists:
-            base_file_data = base_file_data.get()
-            file_versions = base_file_data.versions.all()
-
-        # Get creator info
-        creator = None
-        if data.upload_file_modified_user is not None:
-            creator = OSFUser.objects.get(id=data.upload_file_modified_user)
-        elif data.upload_file_created_user is not None:
-            creator = OSFUser.objects.get(id=data.upload_file_created_user)
-        elif file_versions is not None and file_versions.exists():
-            creator = file_versions.latest('id').creator
-
-        # Change None to '' (empty string)
-        data.path = '' if data.path is None else data.path
-        data.upload_file_created_at = '' if data.upload_file_created_at is None else \
-            data.upload_file_created_at
-        data.verify_file_created_at = '' if data.verify_file_created_at is None else \
-            data.verify_file_created_at
-        data.upload_file_modified_at = '' if data.upload_file_modified_at is None else \
-            data.upload_file_modified_at
-        data.verify_file_modified_at = '' if data.verify_file_modified_at is None else \
-            data.verify_file_modified_at
-        data.upload_file_size = '' if data.upload_file_size is None else \
-            data.upload_file_size
-        data.verify_file_size = '' if data.verify_file_size is None else \
-            data.verify_file_size
-
-        # Generate error_info dictionary
         error_info = {
+            'provider': data.provider,
             'creator_name': '',
             'creator_email': '',
             'creator_id': '',
-            'file_path': data.path,
+            'file_path': empty_if_none(data.path),
             'file_id': data.file_id,
-            'file_create_date_on_upload': data.upload_file_created_at,
-            'file_create_date_on_verify': data.verify_file_created_at,
-            'file_modify_date_on_upload': data.upload_file_modified_at,
-            'file_modify_date_on_verify': data.verify_file_modified_at,
-            'file_size_on_upload': data.upload_file_size,
-            'file_size_on_verify': data.verify_file_size,
+            'file_create_date_on_upload': empty_if_none(data.upload_file_created_at),
+            'file_create_date_on_verify': empty_if_none(data.verify_file_created_at),
+            'file_modify_date_on_upload': empty_if_none(data.upload_file_modified_at),
+            'file_modify_date_on_verify': empty_if_none(data.verify_file_modified_at),
+            'file_size_on_upload': empty_if_none(data.upload_file_size),
+            'file_size_on_verify': empty_if_none(data.verify_file_size),
             'file_version': '',
             'project_id': data.project_id,
             'organization_id': '',
@@ -202,35 +326,81 @@ def get_error_list(pid):
             'verify_result_title': verify_result_title,
         }
 
-        try:
-            verify_user = OSFUser.objects.get(id=data.verify_user)
+        verify_user = users.get(data.verify_user)
+        if verify_user is not None:
             error_info['verify_user_id'] = verify_user._id.upper()
             error_info['verify_user_name'] = verify_user.fullname
-        except OSFUser.DoesNotExist:
+        else:
             logger.warning('Timestamp Control: verify_user not found.')
 
-        if base_file_data_exists and provider == 'osfstorage':
-            error_info['file_version'] = base_file_data.current_version_number
+        file_node = file_nodes.get(data.file_id)
+        if file_node is not None and data.provider == 'osfstorage':
+            error_info['file_version'] = file_node['version_count'] or 1
 
+        creator = users.get(creator_id_of(data))
         if creator is not None:
             error_info['creator_name'] = creator.fullname
             error_info['creator_email'] = creator.username
             error_info['creator_id'] = creator._id
 
-            institution = creator.affiliated_institutions.first()
+            institution = institutions.get(creator.id)
             if institution is not None:
-                error_info['organization_id'] = institution._id
-                error_info['organization_name'] = institution.name
+                error_info['organization_id'] = institution['institution___id']
+                error_info['organization_name'] = institution['institution__name']
 
-        error_list.append(error_info)
+        yield error_info
 
-    if error_list:
-        provider_error_list.append({'provider': provider, 'error_list': error_list})
+def iter_error_list(pid, offset=0, limit=None, chunk_size=ERROR_LIST_CHUNK_SIZE, **filters):
+    """Generate the error_info dictionaries of a project ordered as get_error_queryset().
+    """
+    queryset = get_error_queryset(pid, **filters)
+    end = None if limit is None else offset + limit
+    while end is None or offset < end:
+        size = chunk_size if end is None else min(chunk_size, end - offset)
+        data_list = list(queryset[offset:offset + size])
+        if not data_list:
+            break
+        for error_info in _hydrate_error_list(data_list):
+            yield error_info
+        if len(data_list) < size:
+            break
+        offset += size
 
+def get_error_list(pid, offset=0, limit=None, **filters):
+    '''Retrieve from the database the list of all timestamps that has an error.
+    '''
+    provider_error_list = []
+    for error_info in iter_error_list(pid, offset=offset, limit=limit, **filters):
+        provider = error_info.pop('provider')
+        if not provider_error_list or provider_error_list[-1]['provider'] != provider:
+            provider_error_list.append({'provider': provider, 'error_list': []})
+        provider_error_list[-1]['error_list'].append(error_info)
     return provider_error_list
 
-def get_full_list(uid, pid, node):
+def iter_error_list_csv(pid, **filters):
+    """Generate lines of the CSV export of the error list.
+    """
+    class Echo(object):
+        def write(self, value):
+            return value
+
+    writer = csv.writer(Echo())
+    yield writer.writerow(ERROR_LIST_CSV_COLUMNS)
+    for error_info in iter_error_list(pid, **filters):
+        yield writer.writerow([error_info[column] for column in ERROR_LIST_CSV_COLUMNS])
+
+def get_full_list(uid, pid, node, changed_only=False):
     '''Get a full list of timestamps from all files uploaded to a storage.
+
+    The files are listed from the TimestampFileInventory of the node.  The
+    inventory is reconciled with WaterButler first, except for the providers
+    in TS_INVENTORY_EVENT_PROVIDERS which are kept up to date by file events.
+    The other providers can be changed outside of WaterButler and give
+    no change signal for folders, so all of their folders are still listed
+    from WaterButler on every call; only the database writes are reduced to
+    the changed files (see reconcile_file_inventory()).
+    If changed_only is True, files whose metadata has not changed since their
+    last successful verification are not listed.
     '''
     user_info = OSFUser.objects.get(id=uid)
     cookie = user_info.get_or_create_cookie().decode()
@@ -246,77 +416,205 @@ def get_full_list(uid, pid, node):
 
     for provider_data in provider_json_res['data']:
         provider = provider_data['attributes']['provider']
-        waterbutler_json_res = waterbutler.get_node_info(cookie, pid, provider, '/')
-
-        if waterbutler_json_res is None:
-            provider_files = RdmFileTimestamptokenVerifyResult.objects.filter(
-                project_id=node._id,
-                provider=provider
-            )
-            files_status = provider_files.first().inspection_result_status
-            if files_status != api_settings.TIME_STAMP_STORAGE_DISCONNECTED:
-                not_accessible_status = api_settings.TIME_STAMP_STORAGE_NOT_ACCESSIBLE
-                provider_files.update(inspection_result_status=not_accessible_status)
-            continue
+        inventory_exists = TimestampFileInventory.objects.filter(
+            node=node, provider=provider).exists()
+        if provider in api_settings.TS_INVENTORY_EVENT_PROVIDERS and inventory_exists:
+            logger.info(u'Using file inventory: provider={}'.format(provider))
         else:
-            RdmFileTimestamptokenVerifyResult.objects.filter(
-                project_id=node._id,
-                provider=provider,
-                inspection_result_status=api_settings.FILE_NOT_EXISTS
-            ).update(inspection_result_status=api_settings.FILE_NOT_EXISTS)
-
-        file_list = []
-        child_file_list = []
-        for file_data in waterbutler_json_res['data']:
-            if file_data['attributes']['kind'] == 'folder':
-                logger.info(u'Detected: folder={}'.format(file_data['attributes']['materialized']))
-                child_file_list.extend(
-                    waterbutler_folder_file_info(
-                        pid,
-                        provider_data['attributes']['provider'],
-                        file_data['attributes']['path'],
-                        node, cookies, headers
-                    )
+            waterbutler_json_res = waterbutler.get_node_info(cookie, pid, provider, '/')
+
+            if waterbutler_json_res is None:
+                provider_files = RdmFileTimestamptokenVerifyResult.objects.filter(
+                    project_id=node._id,
+                    provider=provider
                 )
+                files_status = provider_files.first().inspection_result_status
+                if files_status != api_settings.TIME_STAMP_STORAGE_DISCONNECTED:
+                    not_accessible_status = api_settings.TIME_STAMP_STORAGE_NOT_ACCESSIBLE
+                    provider_files.update(inspection_result_status=not_accessible_status)
+                continue
             else:
-                logger.info(u'Detected: file={}'.format(file_data['attributes']['materialized']))
-                file_info = None
-                basefile_node = BaseFileNode.resolve_class(
-                    provider_data['attributes']['provider'],
-                    BaseFileNode.FILE
-                ).get_or_create(
-                    node,
-                    file_data['attributes']['path']
-                )
-                basefile_node.materialized_path = file_data['attributes']['materialized']
-                basefile_node.name = os.path.basename(file_data['attributes']['materialized'])
-                basefile_node.save()
-                file_info = {
-                    'file_id': basefile_node._id,
-                    'file_name': file_data['attributes'].get('name'),
-                    'file_path': file_data['attributes'].get('materialized'),
-                    'size': file_data['attributes'].get('size'),
-                    'created': file_data['attributes'].get('created_utc'),
-                    'modified': file_data['attributes'].get('modified_utc'),
-                    'file_version': ''
-                }
-                if provider_data['attributes']['provider'] == 'osfstorage':
-                    file_info['file_version'] = file_data['attributes']['extra'].get('version')
-                if file_info:
-                    file_list.append(file_info)
-
-        file_list.extend(child_file_list)
+                RdmFileTimestamptokenVerifyResult.objects.filter(
+                    project_id=node._id,
+                    provider=provider,
+                    inspection_result_status=api_settings.FILE_NOT_EXISTS
+                ).update(inspection_result_status=api_settings.FILE_NOT_EXISTS)
+
+            file_attributes_list = []
+            child_file_attributes_list = []
+            for file_data in waterbutler_json_res['data']:
+                if file_data['attributes']['kind'] == 'folder':
+                    logger.info(u'Detected: folder={}'.format(file_data['attributes']['materialized']))
+                    child_file_attributes_list.extend(
+                        waterbutler_folder_file_info(
+                            pid, provider,
+                            file_data['attributes']['path'],
+                            node, cookies, headers
+                        )
+                    )
+                else:
+                    logger.info(u'Detected: file={}'.format(file_data['attributes']['materialized']))
+                    file_attributes_list.append(file_data['attributes'])
+            file_attributes_list.extend(child_file_attributes_list)
+            reconcile_file_inventory(node, provider, file_attributes_list)
 
+        file_list = get_file_inventory_list(node, provider, changed_only)
         if file_list:
             provider_files = {
-                'provider': provider_data['attributes']['provider'],
+                'provider': provider,
                 'provider_file_list': file_list
             }
             provider_list.append(provider_files)
 
     return provider_list
 
+def _inventory_values(provider, attributes):
+    version = ''
+    if provider == 'osfstorage':
+        version = (attributes.get('extra') or {}).get('version') or ''
+    values = {
+        'materialized_path': attributes.get('materialized'),
+        'size': attributes.get('size'),
+        'created_utc': attributes.get('created_utc'),
+        'modified_utc': attributes.get('modified_utc'),
+        'etag': attributes.get('etag'),
+        'version': version,
+    }
+    values['signature'] = TimestampFileInventory.get_signature(
+        values['size'], values['modified_utc'], values['etag'], version)
+    return values
+
+def reconcile_file_inventory(node, provider, file_attributes_list):
+    """Update the file inventory of a provider by the result of a crawl.
+
+    BaseFileNode is only created/updated for new or modified files, and the
+    files which were not found are removed from the inventory.  The crawl
+    itself is not reduced: file_attributes_list must list all the files of
+    the provider, or the missing ones are removed.
+    """
+    known = {
+        item.path: item
+        for item in TimestampFileInventory.objects.filter(node=node, provider=provider)
+    }
+    seen = set()
+    new_items = []
+    for attributes in file_attributes_list:
+        path = attributes['path']
+        seen.add(path)
+        values = _inventory_values(provider, attributes)
+        item = known.get(path)
+        if item is not None and item.signature == values['signature'] and \
+                item.materialized_path == values['materialized_path']:
+            continue
+        basefile_node = BaseFileNode.resolve_class(
+            provider,
+            BaseFileNode.FILE
+        ).get_or_create(
+            node,
+            path
+        )
+        basefile_node.materialized_path = attributes['materialized']
+        basefile_node.name = os.path.basename(attributes['materialized'])
+        basefile_node.save()
+        values['file_id'] = basefile_node._id
+        if item is None:
+            new_items.append(TimestampFileInventory(
+                node=node, provider=provider, path=path, **values))
+        else:
+            for key, value in values.items():
+                setattr(item, key, value)
+            item.save()
+    if new_items:
+        TimestampFileInventory.objects.bulk_create(new_items)
+    removed = [item.id for path, item in known.items() if path not in seen]
+    if removed:
+        TimestampFileInventory.objects.filter(id__in=removed).delete()
+
+def get_file_inventory_list(node, provider, changed_only=False):
+    inventory = TimestampFileInventory.objects.filter(
+        node=node, provider=provider).order_by('materialized_path')
+    verified_ids = set()
+    if changed_only:
+        verified_ids = set(RdmFileTimestamptokenVerifyResult.objects.filter(
+            project_id=node._id,
+            provider=provider,
+            inspection_result_status=api_settings.TIME_STAMP_TOKEN_CHECK_SUCCESS
+        ).values_list('file_id', flat=True))
+    file_list = []
+    for item in inventory:
+        if item.file_id in verified_ids and item.verified_signature == item.signature:
+            continue
+        file_list.append({
+            'file_id': item.file_id,
+            'file_name': os.path.basename(item.materialized_path),
+            'file_path': item.materialized_path,
+            'size': item.size,
+            'created': item.created_utc,
+            'modified': item.modified_utc,
+            'file_version': item.version or ''
+        })
+    return file_list
+
+def mark_file_inventory_verified(node, file_ids, since):
+    """Record the files successfully verified after `since` as unchanged."""
+    verified_ids = RdmFileTimestamptokenVerifyResult.objects.filter(
+        project_id=node._id,
+        file_id__in=file_ids,
+        inspection_result_status=api_settings.TIME_STAMP_TOKEN_CHECK_SUCCESS,
+        verify_date__gte=since
+    ).values('file_id')
+    TimestampFileInventory.objects.filter(
+        node=node, file_id__in=verified_ids
+    ).update(verified_signature=F('signature'))
+
+def update_file_inventory(node, metadata):
+    """Reflect a file added/updated through WaterButler in the file inventory.
+
+    Nothing is recorded until the provider has been crawled once, because
+    until then the inventory of the provider is incomplete.
+    """
+    provider = metadata['provider']
+    inventory = TimestampFileInventory.objects.filter(node=node, provider=provider)
+    if not inventory.exists():
+        return
+    values = _inventory_values(provider, metadata)
+    values['file_id'] = BaseFileNode.resolve_class(
+        provider, BaseFileNode.FILE
+    ).get_or_create(node, metadata['path'])._id
+    inventory.update_or_create(path=metadata['path'], defaults=values)
+
+def file_inventory_moved(node, src_provider, dest_provider, src_path, dest_path, metadata):
+    src_inventory = TimestampFileInventory.objects.filter(node=node, provider=src_provider)
+    if metadata.get('kind') == 'file' or not src_path.endswith('/'):
+        # moving /a.txt must not move /a.txt.bak
+        src_inventory = src_inventory.filter(materialized_path=src_path)
+    else:
+        src_inventory = src_inventory.filter(materialized_path__startswith=src_path)
+    if src_provider == dest_provider and src_provider in api_settings.TS_INVENTORY_EVENT_PROVIDERS:
+        # paths of these providers are ids, only the materialized paths change
+        src_inventory.update(materialized_path=Concat(
+            Value(dest_path), Substr('materialized_path', len(src_path) + 1)))
+        return
+    src_inventory.delete()
+    if metadata.get('kind') == 'file':
+        update_file_inventory(node, metadata)
+    else:
+        # the files in the folder are unknown, crawl them again
+        TimestampFileInventory.objects.filter(node=node, provider=dest_provider).delete()
+
 def check_file_timestamp(uid, node, data, verify_external_only=False):
+    user, file_node, result = check_file_timestamp_hash(
+        uid, node, data, verify_external_only)
+    if result is not None:
+        return result
+    return check_file_timestamp_download(user, node, file_node, data)
+
+def check_file_timestamp_hash(uid, node, data, verify_external_only=False):
+    """Verify a file by the hash provided by the storage (no download).
+
+    Returns (user, file_node, result). result is None when the storage
+    does not provide a hash and check_file_timestamp_download() is needed.
+    """
     user = OSFUser.objects.get(id=uid)
     file_node = BaseFileNode.objects.get(_id=data['file_id'])
     if not userkey_generation_check(user._id):
@@ -325,8 +623,13 @@ def check_file_timestamp(uid, node, data, verify_external_only=False):
     ext_info = ExternalInfo(node, user, file_node, verify_external_only)
     if ext_info.hash_value:
         if ext_info.file_exists:
-            return TimeStampTokenVerifyCheckHash.timestamp_check(
+            return user, file_node, TimeStampTokenVerifyCheckHash.timestamp_check(
                 ext_info, user._id, data, node._id)
+    return user, file_node, None
+
+def check_file_timestamp_download(user, node, file_node, data):
+    if api_settings.TIMESTAMP_STREAMING_DIGEST:
+        return check_file_timestamp_streaming(user, node, file_node, data)
 
     cookie = user.get_or_create_cookie().decode()
     tmp_dir = None
@@ -360,6 +663,27 @@ def check_file_timestamp(uid, node, data, verify_external_only=False):
         logger.exception(err)
         raise
 
+def check_file_timestamp_streaming(user, node, file_node, data):
+    """Verify a file by the digest computed while streaming it from WaterButler.
+    """
+    cookie = user.get_or_create_cookie().decode()
+    verify_result = RdmFileTimestamptokenVerifyResult.objects.filter(
+        file_id=data['file_id']).first()
+    hash_type = get_token_hash_type(verify_result)
+    hash_info = StreamedHashInfo.download(cookie, file_node, hash_type)
+    if hash_info is None:
+        intentional_remove_status = [
+            api_settings.FILE_NOT_EXISTS,
+            api_settings.TIME_STAMP_STORAGE_DISCONNECTED
+        ]
+        if verify_result is not None and \
+                verify_result.inspection_result_status not in intentional_remove_status:
+            verify_result.inspection_result_status = api_settings.FILE_NOT_FOUND
+            verify_result.save()
+        return None
+    return TimeStampTokenVerifyCheckHash.timestamp_check(
+        hash_info, user._id, data, node._id)
+
 def _get_user(uid, op_name, action):
     try:
         return OSFUser.objects.get(id=uid)
@@ -439,27 +763,196 @@ def add_log_download_errors(node, uid, data, save=True):
         save=save,
     )
 
+class TokenBucket(object):
+    """Thread-safe token bucket rate limiter.
+
+    A single instance is shared by all workers of a task so that the total
+    number of requests does not exceed `rate_per_min`.
+    """
+    def __init__(self, rate_per_min, capacity=1, clock=time.time):
+        self.rate = float(rate_per_min) / 60.0
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.clock = clock
+        self.last = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def try_acquire(self):
+        """Take a token if available.  Returns seconds to wait otherwise (0 on success)."""
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return 0
+            return (1.0 - self.tokens) / self.rate
+
+    def acquire(self, stop_event=None):
+        """Block until a token is available.
+
+        Returns False when stop_event is set while waiting.
+        """
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return True
+            if stop_event is None:
+                time.sleep(wait)
+            elif stop_event.wait(wait):
+                return False
+
+
+class TimestampVerifyEngine(object):
+    """Verify timestamps of many files concurrently.
+
+    Files whose hash is provided by the storage are processed by the hash
+    lane, which does not consume the rate budget.  The other files are
+    passed to the download lane, which shares one TokenBucket
+    (TS_REQUESTS_PER_MIN) among all of its workers.
+    """
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, uid, node, workers=None, hash_workers=None,
+                 rate_limiter=None, verify_external_only=False):
+        self.uid = uid
+        self.node = node
+        self.workers = workers or api_settings.TS_VERIFY_WORKERS
+        self.hash_workers = hash_workers or api_settings.TS_VERIFY_HASH_WORKERS
+        if rate_limiter is None:
+            rate_limiter = TokenBucket(api_settings.TS_REQUESTS_PER_MIN)
+        self.rate_limiter = rate_limiter
+        self.verify_external_only = verify_external_only
+
+    def _hash_worker(self, hash_queue, download_queue, done_queue, stop):
+        try:
+            while not stop.is_set():
+                try:
+                    data = hash_queue.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    user, file_node, result = check_file_timestamp_hash(
+                        self.uid, self.node, data, self.verify_external_only)
+                except Exception as err:
+                    done_queue.put((data, None, err))
+                    continue
+                if result is None:
+                    download_queue.put((user, file_node, data))
+                else:
+                    done_queue.put((data, result, None))
+        finally:
+            db.connection.close()
+
+    def _download_worker(self, download_queue, done_queue, stop):
+        try:
+            while not stop.is_set():
+                try:
+                    user, file_node, data = download_queue.get(
+                        timeout=self.POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+                if not self.rate_limiter.acquire(stop):
+                    return
+                try:
+                    result = check_file_timestamp_download(
+                        user, self.node, file_node, data)
+                except Exception as err:
+                    done_queue.put((data, None, err))
+                    continue
+                done_queue.put((data, result, None))
+        finally:
+            db.connection.close()
+
+    def run(self, file_list, is_aborted=None, progress_callback=None):
+        """Verify all files in file_list (dicts of get_full_list() with 'provider').
+
+        progress_callback(processed, total) is called from the calling
+        thread.  Returns the list of verify results (None is not included).
+        """
+        total = len(file_list)
+        results = []
+        if total == 0:
+            return results
+
+        hash_queue = queue.Queue()
+        download_queue = queue.Queue()
+        done_queue = queue.Queue()
+        stop = threading.Event()
+        for data in file_list:
+            hash_queue.put(data)
+
+        threads = [
+            threading.Thread(target=self._hash_worker,
+                             args=(hash_queue, download_queue, done_queue, stop))
+            for _ in range(min(self.hash_workers, total))
+        ] + [
+            threading.Thread(target=self._download_worker,
+                             args=(download_queue, done_queue, stop))
+            for _ in range(min(self.workers, total))
+        ]
+        for th in threads:
+            th.daemon = True
+            th.start()
+
+        error = None
+        processed = 0
+        try:
+            while processed < total:
+                if is_aborted is not None and is_aborted():
+                    break
+                try:
+                    data, result, err = done_queue.get(timeout=self.POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+                processed += 1
+                if err is not None:
+                    logger.error(u'timestamp verification failed: file_id={}'.format(data.get('file_id')))
+                    error = err
+                    break
+                if result is not None:
+                    results.append(result)
+                if progress_callback is not None:
+                    progress_callback(processed, total)
+        finally:
+            stop.set()
+            for th in threads:
+                th.join()
+        if error is not None:
+            raise error
+        return results
+
+
 @celery_app.task(bind=True, base=AbortableTask)
 def celery_verify_timestamp_token(self, uid, node_id):
-    secs_to_wait = 60.0 / api_settings.TS_REQUESTS_PER_MIN
-    last_run = None
-
     celery_app.current_task.update_state(state='PROGRESS', meta={'progress': 0})
     node = AbstractNode.objects.get(id=node_id)
-    celery_app.current_task.update_state(state='PROGRESS', meta={'progress': 50})
     logger.info('Running timestamp verification...: uid={}, node_guid={}'.format(uid, node._id))
-    for provider_dict in get_full_list(uid, node._id, node):
+    started = timezone.now()
+    file_list = []
+    for provider_dict in get_full_list(uid, node._id, node,
+                                       changed_only=api_settings.TS_INCREMENTAL_VERIFY):
         for p_item in provider_dict['provider_file_list']:
-            if self.is_aborted():
-                break
             p_item['provider'] = provider_dict['provider']
-            last_run = time.time()
-            result = check_file_timestamp(uid, node, p_item)
-            if result is None:
-                continue
-            # Do not let the task run too many requests
-            while time.time() < last_run + secs_to_wait:
-                time.sleep(0.1)
+            file_list.append(p_item)
+
+    progress = {'last': 0}
+
+    def report_progress(processed, total):
+        percent = processed * 100 // total
+        if percent != progress['last']:
+            progress['last'] = percent
+            celery_app.current_task.update_state(
+                state='PROGRESS', meta={'progress': percent})
+
+    engine = TimestampVerifyEngine(uid, node)
+    engine.run(file_list, is_aborted=self.is_aborted,
+               progress_callback=report_progress)
+    mark_file_inventory_verified(
+        node, [p_item.get('file_id') for p_item in file_list], started)
     add_log_verify_all(node, uid)
     if self.is_aborted():
         logger.warning('Task from project ID {} was cancelled by user ID {}'.format(node_id, uid))
@@ -549,6 +1042,22 @@ def add_token(uid, node, data):
     if root_file_nodes is None:
         return None
 
+    if api_settings.TIMESTAMP_STREAMING_DIGEST:
+        hash_info = StreamedHashInfo.download(cookie, file_node, HASH_TYPE_SHA512)
+        if hash_info is None:
+            intentional_remove_status = [
+                api_settings.FILE_NOT_EXISTS,
+                api_settings.TIME_STAMP_STORAGE_DISCONNECTED
+            ]
+            RdmFileTimestamptokenVerifyResult.objects.filter(
+                file_id=data['file_id']
+            ).exclude(
+                inspection_result_status__in=intentional_remove_status
+            ).update(inspection_result_status=api_settings.FILE_NOT_FOUND)
+            return None
+        return AddTimestampHash.add_timestamp(
+            user._id, data, node._id, hash_info)
+
     try:
         # Request To Download File
         tmp_dir = tempfile.mkdtemp()
@@ -608,6 +1117,7 @@ def get_file_info(cookie, file_node, version):
 def file_created_or_updated(node, metadata, user_id, created_flag):
     if not settings.ENABLE_TIMESTAMP:
         return
+    update_file_inventory(node, metadata)
     if metadata['provider'] != 'osfstorage':
         file_node = BaseFileNode.resolve_class(
             metadata['provider'], BaseFileNode.FILE
@@ -636,18 +1146,287 @@ def file_created_or_updated(node, metadata, user_id, created_flag):
         'version': version,
         'provider': metadata.get('provider')
     }
-    add_token(user_id, node, file_info)
-
+    set_timestamp_pending(node, file_info, user_id, created_flag)
+    # Timestamps are added by celery after the request (see celery_add_pending_timestamps)
+    enqueue_task(celery_add_pending_timestamps.si(node.id).set(
+        countdown=api_settings.TS_PENDING_DELAY))
+
+def set_timestamp_pending(node, file_info, user_id, created_flag):
+    """Record that a timestamp should be added to the file.
+
+    Repeated events for the same file before the timestamp is added are
+    coalesced into the pending RdmFileTimestamptokenVerifyResult.  Only the
+    upload information and the status are updated, so this never waits for
+    (or overwrites the token written by) celery_add_pending_timestamps.
+    """
+    user = OSFUser.objects.get(id=user_id)
+    if not userkey_generation_check(user._id):
+        userkey_generation(user._id)
+    key_file_name = RdmUserKey.objects.get(
+        guid=user_id, key_kind=api_settings.PUBLIC_KEY_VALUE
+    ).key_name
+
+    fields = {
+        'upload_file_created_at': file_info['created'],
+        'upload_file_modified_at': file_info['modified'],
+        'upload_file_size': file_info['size'],
+        'key_file_name': key_file_name,
+        'inspection_result_status': api_settings.TIME_STAMP_TOKEN_PENDING,
+        'modified': timezone.now(),
+    }
     # Update created/modified user in timestamp result
-    verify_data = RdmFileTimestamptokenVerifyResult.objects.get(file_id=file_info['file_id'])
     if created_flag:
-        verify_data.upload_file_created_user = user_id
+        fields['upload_file_created_user'] = user_id
     else:  # Updated
-        verify_data.upload_file_modified_user = user_id
-    verify_data.upload_file_created_at = file_info['created']
-    verify_data.upload_file_modified_at = file_info['modified']
-    verify_data.upload_file_size = file_info['size']
-    verify_data.save()
+        fields['upload_file_modified_user'] = user_id
+
+    defaults = dict(fields, project_id=node._id, provider=file_info['provider'],
+                    path=file_info['file_path'])
+    _, created = RdmFileTimestamptokenVerifyResult.objects.get_or_create(
+        file_id=file_info['file_id'], defaults=defaults)
+    if not created:
+        RdmFileTimestamptokenVerifyResult.objects.filter(
+            file_id=file_info['file_id']).update(**fields)
+
+def _pending_file_info(verify_data):
+    path = verify_data.path or ''
+    return {
+        'file_id': verify_data.file_id,
+        'file_name': os.path.basename(path),
+        'file_path': path,
+        'size': verify_data.upload_file_size,
+        'created': verify_data.upload_file_created_at,
+        'modified': verify_data.upload_file_modified_at,
+        'version': '',
+        'provider': verify_data.provider,
+    }
+
+def _claim_pending_timestamp(file_id, statuses):
+    """Mark the pending file as being processed by this task.
+
+    Returns the claimed RdmFileTimestamptokenVerifyResult, or None if
+    another worker has claimed it.  The claim is one UPDATE, so no row
+    lock is held while the timestamp is added.
+    """
+    claimed = RdmFileTimestamptokenVerifyResult.objects.filter(
+        statuses, file_id=file_id,
+    ).update(
+        inspection_result_status=api_settings.TIME_STAMP_TOKEN_PROCESSING,
+        modified=timezone.now())
+    if not claimed:
+        return None
+    return RdmFileTimestamptokenVerifyResult.objects.get(file_id=file_id)
+
+def _upload_info(verify_data):
+    return (verify_data.upload_file_created_user, verify_data.upload_file_modified_user,
+            verify_data.upload_file_created_at, verify_data.upload_file_modified_at,
+            verify_data.upload_file_size)
+
+@celery_app.task(ignore_results=True)
+def celery_add_pending_timestamps(node_id):
+    """Add timestamps to the pending files of a node.
+
+    Each file is claimed (TIME_STAMP_TOKEN_PROCESSING) before its timestamp
+    is added, so the same file is never sent to the TSA by two workers at
+    once.  A file event which arrives meanwhile marks the file pending
+    again without waiting, and the file is processed again.
+    A timestamp is requested from the TSA for each file (a TimeStampReq
+    has one message imprint); the files are batched per task.
+    """
+    node = AbstractNode.objects.get(id=node_id)
+    # also take over the files claimed by a lost task
+    statuses = Q(inspection_result_status=api_settings.TIME_STAMP_TOKEN_PENDING) | Q(
+        inspection_result_status=api_settings.TIME_STAMP_TOKEN_PROCESSING,
+        modified__lt=timezone.now() - datetime.timedelta(seconds=api_settings.TS_PROCESSING_TIMEOUT))
+    pending = RdmFileTimestamptokenVerifyResult.objects.filter(statuses, project_id=node._id)
+    file_ids = list(pending.order_by('id').values_list(
+        'file_id', flat=True)[:api_settings.TS_PENDING_BATCH_SIZE])
+    logger.info('Adding pending timestamps...: node_guid={}, files={}'.format(node._id, len(file_ids)))
+
+    repending = False
+    for file_id in file_ids:
+        verify_data = _claim_pending_timestamp(file_id, statuses)
+        if verify_data is None:  # done by another worker
+            continue
+        upload_info = _upload_info(verify_data)
+        try:
+            uid = verify_data.upload_file_modified_user or \
+                verify_data.upload_file_created_user
+            add_token(uid, node, _pending_file_info(verify_data))
+        except Exception as err:
+            logger.exception(err)
+            RdmFileTimestamptokenVerifyResult.objects.filter(
+                file_id=file_id,
+                inspection_result_status=api_settings.TIME_STAMP_TOKEN_PROCESSING
+            ).update(inspection_result_status=api_settings.TIME_STAMP_TOKEN_NO_DATA)
+        # The result of add_token() may overwrite the status of an event
+        # which arrived meanwhile, but not its upload information.
+        verify_data = RdmFileTimestamptokenVerifyResult.objects.filter(file_id=file_id).first()
+        if verify_data is not None and (
+                _upload_info(verify_data) != upload_info or
+                verify_data.inspection_result_status == api_settings.TIME_STAMP_TOKEN_PENDING):
+            RdmFileTimestamptokenVerifyResult.objects.filter(file_id=file_id).update(
+                inspection_result_status=api_settings.TIME_STAMP_TOKEN_PENDING)
+            repending = True
+        else:
+            RdmFileTimestamptokenVerifyResult.objects.filter(
+                file_id=file_id,
+                inspection_result_status=api_settings.TIME_STAMP_TOKEN_PROCESSING
+            ).update(inspection_result_status=api_settings.TIME_STAMP_TOKEN_UNCHECKED)
+
+    if repending or (len(file_ids) >= api_settings.TS_PENDING_BATCH_SIZE and pending.exists()):
+        celery_add_pending_timestamps.apply_async(
+            (node_id,), countdown=api_settings.TS_PENDING_DELAY if repending else None)
+
+def _external_file_info(file_node, provider, attrs):
+    return {
+        'file_id': file_node._id,
+        'file_name': attrs.get('name'),
+        'file_path': attrs.get('materialized'),
+        'size': attrs.get('size'),
+        'created': attrs.get('created_utc'),
+        'modified': attrs.get('modified_utc'),
+        'file_version': '',
+        'provider': provider
+    }
+
+def get_external_files_metadata(cookie, node, provider, paths):
+    """Get the WaterButler attributes of files ({path: attributes}).
+
+    The metadata is fetched per folder (one listing of the parent folder)
+    when TS_EXTERNAL_FOLDER_LISTING_MIN or more files in the folder are
+    changed, and per file otherwise.  Files not found are omitted.
+    """
+    folders = {}
+    for path in paths:
+        folders.setdefault(os.path.dirname(path), []).append(path)
+
+    results = {}
+    for folder, folder_paths in folders.items():
+        if len(folder_paths) >= api_settings.TS_EXTERNAL_FOLDER_LISTING_MIN:
+            res = waterbutler.get_node_info(
+                cookie, node._id, provider, folder.rstrip('/') + '/')
+            children = {}
+            if res is not None and isinstance(res.get('data'), list):
+                for data in res['data']:
+                    attrs = data['attributes']
+                    if attrs.get('kind') == 'file':
+                        children[attrs.get('name')] = attrs
+            for path in folder_paths:
+                attrs = children.get(os.path.basename(path))
+                if attrs is not None:
+                    results[path] = attrs
+            folder_paths = [p for p in folder_paths if p not in results]
+        for path in folder_paths:
+            res = waterbutler.get_node_info(cookie, node._id, provider, path)
+            data = res.get('data') if res is not None else None
+            if data is None:
+                DEBUG(u'waterbutler.get_node_info() has no data: path={}'.format(path))
+                continue
+            results[path] = data['attributes']
+    return results
+
+def reconcile_external_files(node, provider, admin, changes):
+    """Register files changed outside of GRDM and check their timestamps.
+
+    changes: {path: user_id who modified the file (or None)} of a project
+
+    The file nodes are resolved (or created) with bulk queries and the
+    metadata is fetched per folder.  The files are handed to
+    celery_check_external_files() as one job.
+    """
+    if not changes:
+        return []
+    cls = BaseFileNode.resolve_class(provider, BaseFileNode.FILE)
+    content_type = ContentType.objects.get_for_model(node)
+    paths = sorted(set('/' + path.lstrip('/') for path in changes))
+    user_ids = dict(('/' + path.lstrip('/'), uid) for path, uid in changes.items())
+
+    file_nodes = {}
+    for file_node in cls.objects.filter(
+            target_object_id=node.id, target_content_type=content_type,
+            _path__in=paths).order_by('id'):
+        file_nodes.setdefault(file_node._path, file_node)
+
+    cookie = admin.get_or_create_cookie().decode()
+    metadata = get_external_files_metadata(cookie, node, provider, paths)
+
+    items = []
+    new_file_nodes = []
+    for path in paths:
+        attrs = metadata.get(path)
+        if attrs is None:
+            continue
+        file_node = file_nodes.get(path)
+        created = file_node is None
+        if created:
+            file_node = cls(target_object_id=node.id, target_content_type=content_type,
+                            _path=path, provider=provider)
+            file_node.update(None, attrs, user=admin, save=False)
+            new_file_nodes.append(file_node)
+        else:
+            file_node.update(None, attrs, user=admin)  # update content_hash
+        items.append({
+            'path': path,
+            'user_id': user_ids[path],
+            'created': created,
+            'file_info': _external_file_info(file_node, provider, attrs),
+        })
+    if new_file_nodes:
+        cls.objects.bulk_create(new_file_nodes)
+
+    if items:
+        args = (node.id, provider, admin.id, items)
+        transaction.on_commit(
+            lambda: celery_check_external_files.apply_async(args))
+    return items
+
+@celery_app.task(ignore_results=True)
+def celery_check_external_files(node_id, provider, admin_id, items):
+    """Add timestamps to the files changed outside of GRDM.
+
+    The files already having a valid timestamp (changed through GRDM)
+    are skipped.  items: see reconcile_external_files()
+    """
+    node = AbstractNode.objects.get(id=node_id)
+    addon = node.get_addon(provider)
+    if node.is_deleted or addon is None:
+        return
+    users = OSFUser.objects.in_bulk(
+        list(set(item['user_id'] for item in items if item['user_id'])))
+    for item in items:
+        path = item['path']
+        file_info = item['file_info']
+        try:
+            # verified by admin
+            verify_result = check_file_timestamp(
+                admin_id, node, file_info, verify_external_only=True)
+            DEBUG('check timestamp: verify_result={}'.format(verify_result.get('verify_result_title')))
+            if verify_result['verify_result'] == \
+               api_settings.TIME_STAMP_TOKEN_CHECK_SUCCESS:
+                continue  # already checked
+
+            # The file is created (new file) or modified.
+            metadata = {
+                'path': path,
+                'materialized': path,
+            }
+            if item['created']:
+                action = 'file_added'
+            else:
+                action = 'file_updated'
+            user = users.get(item['user_id'])
+            if user:  # modified by user
+                verify_result = add_token(user.id, node, file_info)
+                addon.create_waterbutler_log(Auth(user), action, metadata)
+            else:  # modified by unknown user
+                verify_result = add_token(admin_id, node, file_info)
+                addon.create_waterbutler_log(None, action, metadata)
+            logger.info(u'update timestamp by Webhook: provider={}, node_guid={}, path={}, verify_result={}'.format(
+                provider, node._id, path,
+                verify_result.get('verify_result_title') if verify_result else None))
+        except Exception:
+            logger.exception(u'node_guid={}, provider={}, path={}'.format(node._id, provider, path))
 
 def file_node_moved(uid, project_id, src_provider, dest_provider, src_path, dest_path, metadata, src_metadata=None):
     if not settings.ENABLE_TIMESTAMP:
@@ -656,32 +1435,45 @@ def file_node_moved(uid, project_id, src_provider, dest_provider, src_path, dest
     dest_path = dest_path if dest_path[0] == '/' else '/' + dest_path
     target_object_id = Guid.objects.get(_id=project_id,
                                         content_type_id=ContentType.objects.get_for_model(AbstractNode).id).object_id
+    file_inventory_moved(AbstractNode.objects.get(id=target_object_id),
+                         src_provider, dest_provider, src_path, dest_path, metadata)
     deleted_files = RdmFileTimestamptokenVerifyResult.objects.filter(
         path__startswith=dest_path,
         project_id=project_id,
         provider=dest_provider
     ).exclude(
         inspection_result_status=api_settings.FILE_NOT_EXISTS
-    ).all()
-
-    for deleted_file in deleted_files:
+    )
+    if deleted_files.exists():
         file_node_overwitten(project_id, target_object_id, dest_provider, dest_path)
-    moved_files = RdmFileTimestamptokenVerifyResult.objects.filter(
+    RdmFileTimestamptokenVerifyResult.objects.filter(
         path__startswith=src_path,
         project_id=project_id,
         provider=src_provider
     ).exclude(
         inspection_result_status__in=STATUS_NOT_ACCESSIBLE
-    ).all()
-    for moved_file in moved_files:
-        moved_file.path = moved_file.path.replace(src_path, dest_path, 1)
-        moved_file.provider = dest_provider
-        moved_file.save()
+    ).update(
+        path=Concat(Value(dest_path), Substr('path', len(src_path) + 1)),
+        provider=dest_provider
+    )
 
     def is_folder(path):
         return path[-1:] == '/'
 
-    if src_provider != 'osfstorage' and is_folder(src_path):
+    if src_provider == dest_provider and src_provider != 'osfstorage' and is_folder(src_path):
+        node = AbstractNode.objects.get(id=target_object_id)
+        BaseFileNode.objects.move_subtree(node, src_provider, src_path, dest_path)
+        for child in metadata.get('children', None) or []:
+            path = child.get('path')
+            if path:
+                BaseFileNode.objects.filter(
+                    target_object_id=target_object_id,
+                    provider=dest_provider,
+                    deleted_on__isnull=True,
+                    _materialized_path=child.get('materialized')
+                ).update(_path=path if path[0] == '/' else '/' + path)
+
+    elif src_provider != 'osfstorage' and is_folder(src_path):
         file_nodes = BaseFileNode.objects.filter(target_object_id=target_object_id,
                                                  provider=src_provider,
                                                  deleted_on__isnull=True,
@@ -857,6 +1649,11 @@ def file_node_deleted(project_id, addon_name, src_path):
     tst_status = api_settings.FILE_NOT_EXISTS
     if src_path == '/':
         tst_status = api_settings.TIME_STAMP_STORAGE_DISCONNECTED
+    TimestampFileInventory.objects.filter(
+        node__guids___id=project_id,
+        provider=addon_name,
+        materialized_path__startswith=src_path
+    ).delete()
     RdmFileTimestamptokenVerifyResult.objects.filter(
         project_id=project_id,
         provider=addon_name,
@@ -883,7 +1680,7 @@ def file_node_gone(project_id, addon_name, src_path):
     ).update(inspection_result_status=tst_status)
 
 def waterbutler_folder_file_info(pid, provider, path, node, cookies, headers):
-    # get waterbutler folder file
+    """Returns the WaterButler attributes of all files in a folder (recursively)."""
     if provider == 'osfstorage':
         waterbutler_meta_url = waterbutler_api_url_for(
             pid, provider,
@@ -908,34 +1705,7 @@ def waterbutler_folder_file_info(pid, provider, path, node, cookies, headers):
                 pid, provider, file_data['attributes']['path'],
                 node, cookies, headers))
         else:
-            basefile_node = BaseFileNode.resolve_class(
-                provider,
-                BaseFileNode.FILE
-            ).get_or_create(
-                node,
-                file_data['attributes']['path']
-            )
-            basefile_node.materialized_path = file_data['attributes']['materialized']
-            basefile_node.name = os.path.basename(file_data['attributes']['materialized'])
-            basefile_node.save()
-            if provider == 'osfstorage':
-                file_info = {
-                    'file_name': file_data['attributes']['name'],
-                    'file_path': file_data['attributes']['materialized'],
-                    'file_kind': file_data['attributes']['kind'],
-                    'file_id': basefile_node._id,
-                    'version': file_data['attributes']['extra']['version']
-                }
-            else:
-                file_info = {
-                    'file_name': file_data['attributes']['name'],
-                    'file_path': file_data['attributes']['materialized'],
-                    'file_kind': file_data['attributes']['kind'],
-                    'file_id': basefile_node._id,
-                    'version': ''
-                }
-
-            file_list.append(file_info)
+            file_list.append(file_data['attributes'])
 
     file_list.extend(child_file_list)
     return file_list
@@ -1006,6 +1776,21 @@ def create_rdmuserkey_info(user_id, key_name, key_kind, date):
 def filename_formatter(file_name):
     return file_name.replace(' ', '\\ ')
 
+def save_verify_result(verify_result):
+    """Save the result of adding/verifying a timestamp.
+
+    The upload information is not written back, because a file event may
+    have updated it (see set_timestamp_pending) while the timestamp was
+    being added.
+    """
+    if verify_result.pk is None:
+        verify_result.save()
+        return
+    verify_result.save(update_fields=[
+        f.name for f in RdmFileTimestamptokenVerifyResult._meta.concrete_fields
+        if not f.primary_key and not f.name.startswith('upload_file_')
+    ])
+
 def get_timestamp_verify_result(file_id, project_id, provider, path, inspection_result_status, user_id):
     res, created = RdmFileTimestamptokenVerifyResult.objects.get_or_create(
         file_id=file_id)
@@ -1023,9 +1808,44 @@ def get_timestamp_verify_result(file_id, project_id, provider, path, inspection_
     return res
 
 
+def use_python_backend():
+    return not api_settings.USE_UPKI and \
+        api_settings.TIMESTAMP_BACKEND == api_settings.TIMESTAMP_BACKEND_PYTHON
+
+def get_root_certificates():
+    return rfc3161.load_root_certificates(
+        os.path.join(api_settings.KEY_SAVE_PATH, api_settings.VERIFY_ROOT_CERTIFICATE))
+
+def verify_timestamp_token_python(timestamp_token, provider, file_name=None, digest=None):
+    """Verify timestamp_token in-process.
+
+    Returns (ret, verify_result_title) as the openssl command does.
+    """
+    try:
+        if digest is None:
+            rfc3161.verify_response_for_file(
+                timestamp_token, file_name, get_root_certificates())
+        else:
+            rfc3161.verify_response(
+                timestamp_token, digest, get_root_certificates())
+        ret = api_settings.TIME_STAMP_TOKEN_CHECK_SUCCESS
+        verify_result_title = api_settings.TIME_STAMP_TOKEN_CHECK_SUCCESS_MSG  # 'OK'
+    except rfc3161.TimestampVerifyError as err:
+        logger.error(u'timestamp verification error occured.({}:{}) : {}'.format(provider, file_name, err))
+        ret = api_settings.TIME_STAMP_TOKEN_CHECK_NG
+        verify_result_title = api_settings.TIME_STAMP_TOKEN_CHECK_NG_MSG  # 'NG'
+    except Exception as err:
+        logger.error(u'timestamp verification error occured.({}:{}) : {}'.format(provider, file_name, err))
+        ret = api_settings.TIME_STAMP_VERIFICATION_ERR
+        verify_result_title = api_settings.TIME_STAMP_VERIFICATION_ERR_MSG  # 'NG'
+    return ret, verify_result_title
+
+
 class AddTimestamp:
     #1 create tsq (timestamp request) from file, and keyinfo
     def get_timestamp_request(self, file_name):
+        if use_python_backend():
+            return rfc3161.build_request_for_file(file_name, HASH_TYPE_SHA512)
         cmd = shlex.split(api_settings.SSL_CREATE_TIMESTAMP_REQUEST.format(filename_formatter(file_name)))
         process = subprocess.Popen(
             cmd, shell=False, stdin=subprocess.PIPE,
@@ -1105,10 +1925,11 @@ class AddTimestamp:
 
         verify_data.key_file_name = key_file_name
         verify_data.timestamp_token = tsa_response
-        verify_data.save()
+        save_verify_result(verify_data)
 
         return TimeStampTokenVerifyCheck().timestamp_check(
-            guid, file_info, project_id, file_name, tmp_dir, verify_data)
+            guid, file_info, project_id, file_name, tmp_dir, verify_data,
+            skip_pending_check=True)
 
 class TimeStampTokenVerifyCheck:
     # get abstractNode
@@ -1149,7 +1970,8 @@ class TimeStampTokenVerifyCheck:
         return create_data
 
     @classmethod
-    def timestamp_check_switch(cls, ext_info, file_info, verify_result_local, project_id, userid):
+    def timestamp_check_switch(cls, ext_info, file_info, verify_result_local, project_id, userid,
+                               skip_pending_check=False):
         # _timestamp_check_local() is used in add_timestamp()
         # (verify_result_local is not None after add_timestamp())
         if verify_result_local is None and ext_info:
@@ -1157,7 +1979,7 @@ class TimeStampTokenVerifyCheck:
                                                  project_id, userid)
         else:
             return cls._timestamp_check_local(file_info, verify_result_local,
-                                              project_id, userid)
+                                              project_id, userid, skip_pending_check)
 
     @classmethod
     def _timestamp_check_external(cls, ext_info, file_info, project_id, userid):
@@ -1194,7 +2016,8 @@ class TimeStampTokenVerifyCheck:
         return ret, baseFileNode, verify_result_local, verify_result_title
 
     @classmethod
-    def _timestamp_check_local(cls, file_info, verify_result, project_id, userid):
+    def _timestamp_check_local(cls, file_info, verify_result, project_id, userid,
+                               skip_pending_check=False):
         """
         Check the local database for the situation of the file.
 
@@ -1203,6 +2026,8 @@ class TimeStampTokenVerifyCheck:
         from those values.
         For example, if the file has been deleted, it can set the status
         immediately.
+        A pending file is reported as pending unless skip_pending_check is
+        True, i.e. the timestamp has just been added by add_timestamp().
         """
         ret = api_settings.TIME_STAMP_TOKEN_UNCHECKED  # initial status
         baseFileNode = None  # for osfstorage
@@ -1217,6 +2042,17 @@ class TimeStampTokenVerifyCheck:
             verify_result = RdmFileTimestamptokenVerifyResult.objects.filter(
                 file_id=file_id).first()
 
+        # the timestamp will be added by celery_add_pending_timestamps()
+        if not skip_pending_check and verify_result is not None and \
+                verify_result.inspection_result_status in (
+                    api_settings.TIME_STAMP_TOKEN_PENDING,
+                    api_settings.TIME_STAMP_TOKEN_PROCESSING):
+            if provider == 'osfstorage':
+                baseFileNode = BaseFileNode.objects.get(_id=file_id)
+            ret = api_settings.TIME_STAMP_TOKEN_PENDING
+            verify_result_title = api_settings.TIME_STAMP_TOKEN_PENDING_MSG
+            return ret, baseFileNode, verify_result, verify_result_title
+
         # get file information, verifyresult table
         if provider == 'osfstorage':
             baseFileNode = BaseFileNode.objects.get(_id=file_id)
@@ -1262,13 +2098,19 @@ class TimeStampTokenVerifyCheck:
         return ret, baseFileNode, verify_result, verify_result_title
 
     # timestamp token check
-    def timestamp_check(self, user_guid, file_info, project_id, file_name, tmp_dir, verify_result=None):
+    def timestamp_check(self, user_guid, file_info, project_id, file_name, tmp_dir, verify_result=None,
+                        skip_pending_check=False):
         userid = user_guid_to_id(user_guid)
         ret, baseFileNode, verify_result, verify_result_title = \
-            self.timestamp_check_switch(None, file_info, verify_result, project_id, userid)
+            self.timestamp_check_switch(None, file_info, verify_result, project_id, userid,
+                                        skip_pending_check)
 
         if STATUS_IS_NO_ERROR(ret):
-            if not api_settings.USE_UPKI:
+            if use_python_backend():
+                ret, verify_result_title = verify_timestamp_token_python(
+                    verify_result.timestamp_token, verify_result.provider,
+                    file_name=file_name)
+            elif not api_settings.USE_UPKI:
                 timestamptoken_file = user_guid + '.tsr'
                 timestamptoken_file_path = os.path.join(tmp_dir, timestamptoken_file)
                 with open(timestamptoken_file_path, 'wb') as fout:
@@ -1361,7 +2203,7 @@ class TimeStampTokenVerifyCheck:
         verify_result.verify_file_created_at = file_created_at
         verify_result.verify_file_modified_at = file_modified_at
         verify_result.verify_file_size = file_size
-        verify_result.save()
+        save_verify_result(verify_result)
 
         # RDMINFO: TimeStampVerify
         if file_info['provider'] == 'osfstorage':
@@ -1410,10 +2252,11 @@ class AddTimestampHash:
         else:
             ext_info.timestamp_status = verify_data.inspection_result_status
         # update local timestamp
-        verify_data.save()
+        save_verify_result(verify_data)
 
         result = TimeStampTokenVerifyCheckHash.timestamp_check(
-            ext_info, user_guid, file_info, node_id, verify_data)
+            ext_info, user_guid, file_info, node_id, verify_data,
+            skip_pending_check=True)
 
         # update external timestamp
         ext_info.timestamp_status = result.get('verify_result')
@@ -1436,6 +2279,8 @@ class AddTimestampHash:
 
     @classmethod
     def _gen_timestamp_request(cls, ext_info):
+        if use_python_backend():
+            return rfc3161.build_request(ext_info.hash_value, ext_info.hash_type)
         digest = ext_info.hash_value
         digest_type = hash_type_to_openssl_digest_type(ext_info.hash_type)
         fmt = api_settings.SSL_CREATE_TIMESTAMP_HASH_REQUEST
@@ -1559,23 +2404,32 @@ class TimeStampTokenVerifyCheckHash:
         return verify_result, verify_result_title, ret
 
     @classmethod
-    def timestamp_check(cls, ext_info, user_guid, file_info, project_id, verify_result=None):
+    def timestamp_check(cls, ext_info, user_guid, file_info, project_id, verify_result=None,
+                        skip_pending_check=False):
         user_id = user_guid_to_id(user_guid)
         ret, baseFileNode, verify_result, verify_result_title = \
             TimeStampTokenVerifyCheck.timestamp_check_switch(
-                ext_info, file_info, verify_result, project_id, user_id)
+                ext_info, file_info, verify_result, project_id, user_id,
+                skip_pending_check)
 
         if STATUS_IS_NO_ERROR(ret):
-            tmp_dir = tempfile.mkdtemp()
-            try:
-                verify_result, verify_result_title, ret = cls._verify(
-                    tmp_dir, ext_info, user_guid, project_id, verify_result)
-            except Exception:
+            if use_python_backend():
+                hash_type_to_openssl_digest_type(ext_info.hash_type)  # check only
+                ret, verify_result_title = verify_timestamp_token_python(
+                    select_timestamp_token(verify_result, ext_info),
+                    verify_result.provider, digest=ext_info.hash_value)
+                verify_result.inspection_result_status = ret
+            else:
+                tmp_dir = tempfile.mkdtemp()
+                try:
+                    verify_result, verify_result_title, ret = cls._verify(
+                        tmp_dir, ext_info, user_guid, project_id, verify_result)
+                except Exception:
+                    shutil.rmtree(tmp_dir)
+                    raise
                 shutil.rmtree(tmp_dir)
-                raise
-            shutil.rmtree(tmp_dir)
 
-        use_hash = True
+        use_hash = ext_info.use_hash
         external_timestamp = ext_info.has_timestamp
 
         return TimeStampTokenVerifyCheck.generate_verify_result(
@@ -1607,6 +2461,23 @@ def sha256_to_sha512(val):
     return val + \
         '0000000000000000000000000000000000000000000000000000000000000000'
 
+def get_token_hash_type(verify_result):
+    """Return the hash algorithm of the message imprint in the local token.
+
+    SHA-512 (used by SSL_CREATE_TIMESTAMP_REQUEST) is returned when it
+    cannot be determined.
+    """
+    token = verify_result.timestamp_token if verify_result is not None else None
+    if token:
+        try:
+            _, tst_info = rfc3161.parse_response(token)
+            hash_type = tst_info['message_imprint']['hash_algorithm']['algorithm'].native
+            if hash_type in (HASH_TYPE_SHA256, HASH_TYPE_SHA512):
+                return hash_type
+        except rfc3161.TimestampVerifyError:
+            pass
+    return HASH_TYPE_SHA512
+
 def select_timestamp_token(verify_result, ext_info):
     if ext_info and ext_info.has_timestamp:
         DEBUG('use external Timestamp')
@@ -1615,6 +2486,8 @@ def select_timestamp_token(verify_result, ext_info):
     return verify_result.timestamp_token
 
 class ExternalInfo():
+    use_hash = True  # the hash is provided by the storage
+
     def __init__(self, node, user, file_node, verify_external_only):
         self.node = node
         self.user = user
@@ -1674,3 +2547,39 @@ class ExternalInfo():
         func = getattr(self.file_node, 'set_timestamp', None)
         if func:
             func(self.timestamp_data, self.timestamp_status, self.context)
+
+
+class StreamedHashInfo(object):
+    """Digest of a file computed by streaming it from WaterButler.
+
+    This has the attributes of ExternalInfo used by AddTimestampHash and
+    TimeStampTokenVerifyCheckHash, so a file is timestamped and verified by
+    its digest without being saved on local disk.
+    """
+    verify_external_only = False
+    use_hash = False  # the digest is computed by downloading the file
+
+    def __init__(self, hash_type, hash_value):
+        self.hash_type = hash_type
+        self.hash_value = hash_value
+        self.timestamp_data = None
+        self.timestamp_status = None
+        self.context = None
+
+    @classmethod
+    def download(cls, cookie, file_node, hash_type):
+        digests = waterbutler.download_file_digest(cookie, file_node, [hash_type])
+        if digests is None:
+            return None
+        return cls(hash_type, digests[hash_type])
+
+    @property
+    def has_timestamp(self):
+        return False  # the local timestamp is always used
+
+    @property
+    def file_exists(self):
+        return True
+
+    def update_timestamp(self):
+        pass
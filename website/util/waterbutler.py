@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import hashlib
 import requests
 import shutil
 import os
@@ -8,6 +9,8 @@ from website import settings
 import logging
 logger = logging.getLogger(__name__)
 
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
 def download_file(osf_cookie, file_node, download_path, **kwargs):
     """Download an waterbutler file by streaming its contents while saving,
     so we do not waste memory.
@@ -38,6 +41,37 @@ def download_file(osf_cookie, file_node, download_path, **kwargs):
     response.close()
     return full_path
 
+def download_file_digest(osf_cookie, file_node, hash_types, chunk_size=DOWNLOAD_CHUNK_SIZE, **kwargs):
+    """Stream an waterbutler file into hashlib digests without saving it.
+
+    Returns a dict of {hash_type: hexdigest}, or None if the file cannot
+    be downloaded.
+    """
+    digests = dict((hash_type, hashlib.new(hash_type)) for hash_type in hash_types)
+    try:
+        response = requests.get(
+            file_node.generate_waterbutler_url(action='download', direct=None, **kwargs),
+            cookies={settings.COOKIE_NAME: osf_cookie},
+            stream=True
+        )
+    except Exception as err:
+        logger.error(err)
+        return None
+
+    try:
+        if response.status_code != 200:
+            logger.warning(u'download_file_digest: status={}, path={}'.format(response.status_code, file_node.path))
+            return None
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            for digest in digests.values():
+                digest.update(chunk)
+    except Exception as err:
+        logger.error(err)
+        return None
+    finally:
+        response.close()
+    return dict((hash_type, digest.hexdigest()) for hash_type, digest in digests.items())
+
 def upload_folder_recursive(osf_cookie, pid, local_path, dest_path):
     """Upload all the content (files and folders) inside a folder.
     """